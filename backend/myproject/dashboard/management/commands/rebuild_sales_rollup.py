@@ -0,0 +1,64 @@
+# dashboard/management/commands/rebuild_sales_rollup.py
+import datetime
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from dashboard.rollup import rebuild_days, rebuild_product_sales
+from orders.models import Order
+
+
+def _date(value):
+    try:
+        return datetime.date.fromisoformat(value)
+    except ValueError:
+        raise CommandError(f"Invalid date {value!r}, expected YYYY-MM-DD")
+
+
+class Command(BaseCommand):
+    help = ("Recompute DailySalesRollup from the order tables, a chunk of days per transaction, "
+            "then the all-time ProductSales counters.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--start', help="First day (YYYY-MM-DD), defaults to the first order's day.")
+        parser.add_argument('--end', help="Last day, inclusive (YYYY-MM-DD), defaults to today.")
+        parser.add_argument('--chunk-days', type=int, default=31, help="Days recomputed per transaction.")
+
+    def handle(self, *args, **options):
+        if options['chunk_days'] < 1:
+            raise CommandError("--chunk-days must be positive")
+        if options['start']:
+            start = _date(options['start'])
+        else:
+            first = Order.objects.order_by('created_at').values_list('created_at', flat=True).first()
+            if first is None:
+                rebuild_product_sales()  # clears counters left from deleted orders
+                self.stdout.write("No orders; nothing to rebuild")
+                return
+            start = timezone.localdate(first)
+        end = _date(options['end']) if options['end'] else timezone.localdate()
+        if start > end:
+            raise CommandError("--start must not be after --end")
+
+        started = time.perf_counter()
+        written = 0
+        chunk_start = start
+        while chunk_start <= end:
+            chunk_end = min(chunk_start + datetime.timedelta(days=options['chunk_days']),
+                            end + datetime.timedelta(days=1))
+            rows = rebuild_days(chunk_start, chunk_end)
+            written += rows
+            if options['verbosity'] > 1:
+                self.stdout.write(f"  {chunk_start} to {chunk_end - datetime.timedelta(days=1)}: {rows} rows")
+            chunk_start = chunk_end
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Sales rollup rebuilt from {start} to {end}: {written} rows in {time.perf_counter() - started:.1f}s"
+        ))
+
+        started = time.perf_counter()
+        products = rebuild_product_sales()
+        self.stdout.write(self.style.SUCCESS(
+            f"Product sales counters rebuilt: {products} products in {time.perf_counter() - started:.1f}s"
+        ))
@@ -1,3 +1,168 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models import Q
+from django.contrib.auth.models import User
+from django.db.models.signals import pre_save, post_save, pre_delete, post_delete
+from django.dispatch import receiver
+from orders.models import Order, OrderItem
+from products.models import Product, Category
+from .snapshots import invalidate
 
 # Create your models here.
+
+class DailySalesRollup(models.Model):
+    """
+    Orders aggregated per day (of Order.created_at) x status x category, kept
+    up to date by the receivers below and rebuilt by
+    `manage.py rebuild_sales_rollup`.
+
+    Rows with a category count the orders that contain that category and the
+    units/revenue (price x quantity) of its items. The row with category NULL
+    holds the order totals of the day and status: order count, units and
+    revenue as Order.total_cost (shipping included), so orders with several
+    categories are not counted twice.
+    """
+    day = models.DateField()
+    status = models.CharField(max_length=20, choices=Order.STATUS_CHOICES)
+    category = models.ForeignKey(Category, on_delete=models.CASCADE, null=True, blank=True,
+                                 related_name='sales_rollups')
+    order_count = models.IntegerField(default=0)
+    units = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['day', 'status', 'category'], condition=Q(category__isnull=False),
+                                    name='sales_rollup_day_status_category'),
+            models.UniqueConstraint(fields=['day', 'status'], condition=Q(category__isnull=True),
+                                    name='sales_rollup_day_status_total'),
+        ]
+        indexes = [
+            models.Index(fields=['day', 'status'], name='sales_rollup_day_idx'),
+        ]
+
+    def __str__(self):
+        return f"Sales on {self.day} ({self.status}, {self.category_id or 'all categories'})"
+
+
+class ProductSales(models.Model):
+    """
+    All-time sales counters of one product over the orders that are not
+    cancelled: units, revenue (price x quantity) and when it last sold.
+    Maintained next to DailySalesRollup (see dashboard/rollup.py) and rebuilt
+    by `manage.py rebuild_sales_rollup`. A table of its own rather than
+    columns on Product, so a Product.save() from a stale instance cannot
+    overwrite the counters.
+    """
+    product = models.OneToOneField(Product, on_delete=models.CASCADE, primary_key=True, related_name='sales')
+    units = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    last_sold_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['-units'], name='product_sales_units_idx'),
+        ]
+
+    def __str__(self):
+        return f"Sales of product {self.product_id}: {self.units} units"
+
+
+# Writes that change the numbers on the overview make its cached snapshots stale
+# (after commit, so the recomputation sees the new rows).
+@receiver([post_save, post_delete], sender=Order)
+@receiver([post_save, post_delete], sender=OrderItem)
+@receiver([post_save, post_delete], sender=Product)
+@receiver([post_save, post_delete], sender=Category)
+@receiver([post_save, post_delete], sender=User)
+def invalidate_overview(sender, update_fields=None, **kwargs):
+    # Logins save last_login only; nothing on the overview depends on it
+    if sender is User and update_fields is not None and set(update_fields) == {'last_login'}:
+        return
+
+    def invalidate_all():
+        invalidate('overview')
+        invalidate('overview-rollup')
+    transaction.on_commit(invalidate_all)
+
+
+# --- Incremental rollup maintenance (see dashboard/rollup.py) ---
+# pre_save reads what the stored row contributes before it is overwritten,
+# so the save can move or remove exactly that contribution. Only writes pay
+# for this; loading rows runs no rollup code.
+@receiver(pre_save, sender=Order)
+def rollup_order_saving(sender, instance, raw=False, **kwargs):
+    if not raw:
+        from .rollup import saving_snapshot, stored_order_snapshot
+        saving_snapshot(instance, stored_order_snapshot)
+
+@receiver(pre_save, sender=OrderItem)
+def rollup_item_saving(sender, instance, raw=False, **kwargs):
+    if not raw:
+        from .rollup import saving_snapshot, stored_item_snapshot
+        saving_snapshot(instance, stored_item_snapshot)
+
+@receiver(pre_save, sender=Product)
+def rollup_product_saving(sender, instance, raw=False, **kwargs):
+    if not raw:
+        from .rollup import saving_snapshot, stored_product_category
+        saving_snapshot(instance, stored_product_category)
+
+@receiver(post_save, sender=Product)
+def rollup_product_saved(sender, instance, created, raw=False, **kwargs):
+    if not raw:
+        from .rollup import product_saved
+        product_saved(instance, created)
+
+@receiver(post_save, sender=Order)
+def rollup_order_saved(sender, instance, created, raw=False, **kwargs):
+    if not raw:
+        from .rollup import order_saved
+        order_saved(instance, created)
+
+@receiver(pre_delete, sender=Order)
+def rollup_order_deleting(sender, instance, **kwargs):
+    from .rollup import order_deleting
+    order_deleting(instance)
+
+@receiver(post_delete, sender=Order)
+def rollup_order_deleted(sender, instance, **kwargs):
+    from .rollup import order_deleted
+    order_deleted(instance)
+
+@receiver(post_save, sender=OrderItem)
+def rollup_item_saved(sender, instance, created, raw=False, **kwargs):
+    if not raw:
+        from .rollup import item_saved
+        item_saved(instance, created)
+
+@receiver(pre_delete, sender=OrderItem)
+def rollup_item_deleting(sender, instance, **kwargs):
+    from .rollup import item_deleting
+    item_deleting(instance)
+
+@receiver(post_delete, sender=OrderItem)
+def rollup_item_deleted(sender, instance, **kwargs):
+    from .rollup import item_deleted
+    item_deleted(instance)
+
+@receiver(pre_delete, sender=Product)
+def rollup_product_deleting(sender, instance, **kwargs):
+    # Its sales counters go with it; the cascaded items must not recreate them
+    from .rollup import mark_deleting
+    mark_deleting('products', instance.pk)
+
+@receiver(post_delete, sender=Product)
+def rollup_product_deleted(sender, instance, **kwargs):
+    from .rollup import unmark_deleting
+    unmark_deleting('products', instance.pk)
+
+@receiver(pre_delete, sender=Category)
+def rollup_category_deleting(sender, instance, **kwargs):
+    # Its rollup rows go with it; the cascaded items must not recreate them
+    from .rollup import mark_deleting
+    mark_deleting('categories', instance.pk)
+
+@receiver(post_delete, sender=Category)
+def rollup_category_deleted(sender, instance, **kwargs):
+    from .rollup import unmark_deleting
+    unmark_deleting('categories', instance.pk)
@@ -0,0 +1,80 @@
+# dashboard/pagination.py
+import base64
+import datetime
+import decimal
+import json
+
+from django.db.models import Q
+from rest_framework.exceptions import ValidationError
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination:
+    """
+    Keyset ("seek") pagination on one sort field plus the primary key.
+
+    DRF's CursorPagination only seeks on the first ordering field and skips
+    ties with an OFFSET, which degrades badly when many rows share a value
+    (e.g. thousands of customers who never ordered). Here the cursor holds
+    the (value, id) of the last row of the page and the next page continues
+    strictly after it. The sort field may be an annotation; it must not be
+    NULL (wrap it in Coalesce).
+    """
+    page_size = 50
+    max_page_size = 500
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+
+    def __init__(self, field, descending):
+        self.field = field
+        self.descending = descending
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params.get(self.page_size_query_param, self.page_size))
+        except ValueError:
+            raise ValidationError({self.page_size_query_param: 'Must be an integer.'})
+        return max(1, min(size, self.max_page_size))
+
+    def encode_cursor(self, value, pk):
+        if isinstance(value, datetime.datetime):
+            value = ['dt', value.isoformat()]
+        elif isinstance(value, decimal.Decimal):
+            value = ['dec', str(value)]
+        return base64.urlsafe_b64encode(json.dumps([value, pk]).encode()).decode()
+
+    def decode_cursor(self, cursor):
+        try:
+            value, pk = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+            if isinstance(value, list):
+                kind, raw = value
+                value = datetime.datetime.fromisoformat(raw) if kind == 'dt' else decimal.Decimal(raw)
+            return value, int(pk)
+        except (ValueError, TypeError, decimal.InvalidOperation):
+            raise ValidationError({self.cursor_query_param: 'Invalid cursor.'})
+
+    def order(self, queryset):
+        prefix = '-' if self.descending else ''
+        return queryset.order_by(prefix + self.field, prefix + 'pk')
+
+    def paginate(self, queryset, request):
+        """Return (rows, next_url); `queryset` must yield dicts with the sort field and 'id'."""
+        page_size = self.get_page_size(request)
+        cursor = request.query_params.get(self.cursor_query_param)
+        queryset = self.order(queryset)
+        if cursor:
+            value, pk = self.decode_cursor(cursor)
+            op = 'lt' if self.descending else 'gt'
+            queryset = queryset.filter(
+                Q(**{f'{self.field}__{op}': value}) | Q(**{self.field: value, f'pk__{op}': pk})
+            )
+        rows = list(queryset[:page_size + 1])
+        next_url = None
+        if len(rows) > page_size:
+            rows = rows[:page_size]
+            last = rows[-1]
+            next_url = replace_query_param(
+                request.build_absolute_uri(), self.cursor_query_param,
+                self.encode_cursor(last[self.field], last['id']),
+            )
+        return rows, next_url
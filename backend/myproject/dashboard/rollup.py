@@ -0,0 +1,329 @@
+# dashboard/rollup.py
+#
+# Maintenance of DailySalesRollup and the ProductSales counters.
+#
+# Incremental: the receivers in dashboard/models.py call order_saved /
+# order_deleted / item_saved / item_deleted, which add or remove the row's
+# contribution with F() updates (UPDATE ... SET units = units + n), so
+# concurrent orders never overwrite each other's counts. pre_save reads what
+# the stored row contributed (one query, on writes only), so a status change
+# moves the order's numbers from the old status rows to the new ones. Moving a product to another category moves its items' numbers
+# from the old category rows to the new ones. ProductSales follows the same
+# events but only counts orders that are not cancelled:
+# cancelling an order takes its items off the counters, un-cancelling puts
+# them back. last_sold_at only moves forward; a cancellation leaves it as is
+# until the next rebuild.
+#
+# Writes that bypass model signals (QuerySet.update(), bulk_create(), raw
+# SQL) are not seen; `manage.py rebuild_sales_rollup` recomputes any range
+# of days from the order tables, and the product counters as a whole.
+import datetime
+import threading
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, DecimalField, Exists, F, Max, OuterRef, Sum, Value
+from django.db.models.functions import Coalesce, Greatest, TruncDate
+from django.utils import timezone
+
+from orders.models import Order, OrderItem
+from products.models import Product
+from .models import DailySalesRollup, ProductSales
+
+REVENUE = DecimalField(max_digits=14, decimal_places=2)
+CANCELLED = 'cancelled'
+
+# Rows being deleted by this thread, by kind ('orders', 'products',
+# 'categories'): marked in pre_delete, so the post_delete of the items
+# cascaded with them can tell
+_deleting = threading.local()
+
+
+def mark_deleting(kind, pk):
+    setattr(_deleting, kind, _being_deleted(kind) | {pk})
+
+
+def unmark_deleting(kind, pk):
+    setattr(_deleting, kind, _being_deleted(kind) - {pk})
+
+
+def _being_deleted(kind):
+    return getattr(_deleting, kind, frozenset())
+
+
+def order_snapshot(order):
+    """(day, status, total_cost) an order row contributes, or None if unknown/unsaved."""
+    # Read __dict__ so deferred fields are never loaded one query per instance
+    values = order.__dict__
+    if order.pk is None or values.get('created_at') is None or 'status' not in values or 'total_cost' not in values:
+        return None
+    return timezone.localdate(values['created_at']), values['status'], values['total_cost']
+
+
+def stored_order_snapshot(order_id):
+    """order_snapshot() of the row as stored in the database, or None."""
+    row = Order.objects.filter(pk=order_id).values_list('created_at', 'status', 'total_cost').first()
+    return row and (timezone.localdate(row[0]), row[1], row[2])
+
+
+def item_snapshot(item):
+    """(order_id, product_id, price, quantity) an item row contributes, or None."""
+    values = item.__dict__
+    if item.pk is None or any(name not in values for name in ('order_id', 'product_id', 'price', 'quantity')):
+        return None
+    return values['order_id'], values['product_id'], values['price'], values['quantity']
+
+
+def stored_item_snapshot(item_id):
+    """item_snapshot() of the row as stored in the database, or None."""
+    return OrderItem.objects.filter(pk=item_id).values_list('order_id', 'product_id', 'price', 'quantity').first()
+
+
+def stored_product_category(product_id):
+    return Product.objects.filter(pk=product_id).values_list('category_id', flat=True).first()
+
+
+def saving_snapshot(instance, stored):
+    """pre_save: remember what the stored row contributes, None for a new row."""
+    adding = instance.pk is None or instance._state.adding
+    instance._rollup_snapshot = None if adding else stored(instance.pk)
+
+
+def bump(day, status, category_id, order_count=0, units=0, revenue=0):
+    """Atomically add to one rollup row, creating it when it does not exist yet."""
+    if not (order_count or units or revenue) or category_id in _being_deleted('categories'):
+        return
+    rows = DailySalesRollup.objects.filter(day=day, status=status, category_id=category_id)
+    changes = {
+        'order_count': F('order_count') + order_count,
+        'units': F('units') + units,
+        'revenue': F('revenue') + revenue,
+    }
+    if rows.update(**changes) or order_count < 0 or units < 0 or revenue < 0:
+        return  # a decrement never creates the row
+    try:
+        with transaction.atomic():
+            DailySalesRollup.objects.create(day=day, status=status, category_id=category_id,
+                                            order_count=order_count, units=units, revenue=revenue)
+    except IntegrityError:
+        rows.update(**changes)  # created concurrently
+
+
+def bump_product(product_id, units=0, revenue=0, sold_at=None):
+    """Atomically add to a product's sales counters, creating its row when missing."""
+    if not (units or revenue) or product_id in _being_deleted('products'):
+        return
+    rows = ProductSales.objects.filter(product_id=product_id)
+    changes = {'units': F('units') + units, 'revenue': F('revenue') + revenue}
+    if sold_at is not None:
+        # Coalesce first: GREATEST() with a NULL is NULL on some backends
+        changes['last_sold_at'] = Greatest(Coalesce('last_sold_at', Value(sold_at)), Value(sold_at))
+    if rows.update(**changes) or units < 0 or revenue < 0:
+        return  # a decrement never creates the row
+    try:
+        with transaction.atomic():
+            ProductSales.objects.create(product_id=product_id, units=units, revenue=revenue, last_sold_at=sold_at)
+    except IntegrityError:
+        rows.update(**changes)  # created concurrently
+
+
+def _bump_order_products(order_id, sign, sold_at=None):
+    """Add (sign=1) or remove (sign=-1) all items of an order from the product counters."""
+    rows = OrderItem.objects.filter(order_id=order_id).values('product').annotate(
+        units=Sum('quantity'), revenue=Sum(F('price') * F('quantity'), output_field=REVENUE),
+    )
+    for row in rows:
+        bump_product(row['product'], sign * row['units'], sign * row['revenue'], sold_at=sold_at)
+
+
+def _order_categories(order_id):
+    return OrderItem.objects.filter(order_id=order_id).values('product__category').annotate(
+        units=Sum('quantity'), revenue=Sum(F('price') * F('quantity'), output_field=REVENUE),
+    )
+
+
+def order_saved(order, created):
+    old = None if created else getattr(order, '_rollup_snapshot', None)
+    new = order_snapshot(order) or stored_order_snapshot(order.pk)
+    if new is None:
+        return
+    day, status, total_cost = new
+    if created:
+        # Items are created after the order; they add their units themselves
+        bump(day, status, None, order_count=1, revenue=total_cost)
+        return
+    if old is None or old == new:
+        return
+
+    old_day, old_status, old_total = old
+    if (old_day, old_status) == (day, status):
+        bump(day, status, None, revenue=total_cost - old_total)
+        return
+    # Status (or day) changed: move everything the order contributes
+    categories = list(_order_categories(order.pk))
+    units = sum(row['units'] for row in categories)
+    bump(old_day, old_status, None, order_count=-1, units=-units, revenue=-old_total)
+    bump(day, status, None, order_count=1, units=units, revenue=total_cost)
+    for row in categories:
+        bump(old_day, old_status, row['product__category'], -1, -row['units'], -row['revenue'])
+        bump(day, status, row['product__category'], 1, row['units'], row['revenue'])
+    if (old_status == CANCELLED) != (status == CANCELLED):
+        if status == CANCELLED:
+            _bump_order_products(order.pk, -1)
+        else:
+            _bump_order_products(order.pk, 1, sold_at=order.created_at)
+
+
+def order_deleting(order):
+    """
+    Remove everything an order contributes before it and its items are
+    deleted; its items' own post_delete is skipped (see item_deleted), as
+    they are all gone by then and could not tell whether they were the
+    last item of their category.
+    """
+    # Rows loaded by the deletion collector are complete; a deferred one is read
+    snapshot = order_snapshot(order) or stored_order_snapshot(order.pk)
+    if snapshot is None:
+        return
+    mark_deleting('orders', order.pk)
+    day, status, total_cost = snapshot
+    categories = list(_order_categories(order.pk))
+    bump(day, status, None, order_count=-1, units=-sum(row['units'] for row in categories), revenue=-total_cost)
+    for row in categories:
+        bump(day, status, row['product__category'], -1, -row['units'], -row['revenue'])
+    if status != CANCELLED:
+        _bump_order_products(order.pk, -1)
+
+
+def order_deleted(order):
+    unmark_deleting('orders', order.pk)
+
+
+def _order_key(order_id):
+    """(created_at, status) of an order as stored in the database."""
+    return Order.objects.filter(pk=order_id).values_list('created_at', 'status').first()
+
+
+def _apply_item(item_pk, snapshot, sign):
+    order_id, product_id, price, quantity = snapshot
+    key = _order_key(order_id)
+    if key is None:
+        return
+    created_at, status = key
+    day = timezone.localdate(created_at)
+    revenue = sign * Decimal(str(price)) * quantity
+    if status != CANCELLED:
+        bump_product(product_id, sign * quantity, revenue, sold_at=created_at if sign > 0 else None)
+    bump(day, status, None, units=sign * quantity)
+    category_id = Product.objects.filter(pk=product_id).values_list('category_id', flat=True).first()
+    if category_id is None:
+        return
+    # The order counts once per category, whatever the number of its items in it
+    others = OrderItem.objects.filter(order_id=order_id, product__category_id=category_id) \
+        .exclude(pk=item_pk).exists()
+    bump(day, status, category_id, order_count=0 if others else sign,
+         units=sign * quantity, revenue=revenue)
+
+
+def item_saved(item, created):
+    old = None if created else getattr(item, '_rollup_snapshot', None)
+    new = item_snapshot(item) or stored_item_snapshot(item.pk)
+    if new is None or (not created and (old is None or old == new)):
+        return
+    if old is not None:
+        _apply_item(item.pk, old, -1)
+    _apply_item(item.pk, new, 1)
+
+
+def item_deleting(item):
+    # Read now: post_delete runs after the row is gone
+    item._rollup_snapshot = item_snapshot(item) or stored_item_snapshot(item.pk)
+
+
+def item_deleted(item):
+    snapshot = getattr(item, '_rollup_snapshot', None)
+    if snapshot is not None and snapshot[0] not in _being_deleted('orders'):
+        _apply_item(item.pk, snapshot, -1)
+
+
+def product_saved(product, created):
+    """A product moved to another category: move its items' numbers between the category rows."""
+    old = None if created else getattr(product, '_rollup_snapshot', None)
+    new = product.__dict__.get('category_id')
+    if old is None or new is None or old == new:
+        return
+
+    def other_items(category_id):
+        # Items of the same order in `category_id` that are not this product's
+        return OrderItem.objects.filter(order=OuterRef('order'), product__category_id=category_id) \
+            .exclude(product_id=product.pk)
+
+    tz = timezone.get_current_timezone()
+    rows = OrderItem.objects.filter(product_id=product.pk).annotate(
+        day=TruncDate('order__created_at', tzinfo=tz),
+    ).values('day', 'order__status').annotate(
+        units=Sum('quantity'), revenue=Sum(F('price') * F('quantity'), output_field=REVENUE),
+        # An order leaves the old category only if nothing else of it is in
+        # there, and joins the new one only if it was not there already
+        left=Count('order', distinct=True, filter=~Exists(other_items(old))),
+        joined=Count('order', distinct=True, filter=~Exists(other_items(new))),
+    )
+    for row in rows:
+        day, status = row['day'], row['order__status']
+        bump(day, status, old, -row['left'], -row['units'], -row['revenue'])
+        bump(day, status, new, row['joined'], row['units'], row['revenue'])
+
+
+def rebuild_days(start, end):
+    """
+    Recompute the rollup rows of the days in [start, end) from Order and
+    OrderItem in one transaction. Returns the number of rows written.
+    """
+    tz = timezone.get_current_timezone()
+    created = {
+        'created_at__gte': datetime.datetime.combine(start, datetime.time.min, tz),
+        'created_at__lt': datetime.datetime.combine(end, datetime.time.min, tz),
+    }
+    orders = Order.objects.filter(**created).annotate(day=TruncDate('created_at', tzinfo=tz))
+    items = OrderItem.objects.filter(**{f'order__{name}': value for name, value in created.items()}) \
+        .annotate(day=TruncDate('order__created_at', tzinfo=tz))
+
+    # Read and write in one transaction so the chunk is replaced consistently
+    with transaction.atomic():
+        totals = {
+            (row['day'], row['status']): DailySalesRollup(
+                day=row['day'], status=row['status'], order_count=row['order_count'], revenue=row['revenue'] or 0,
+            )
+            for row in orders.values('day', 'status').annotate(order_count=Count('id'), revenue=Sum('total_cost'))
+        }
+        for row in items.values('day', 'order__status').annotate(units=Sum('quantity')):
+            totals[(row['day'], row['order__status'])].units = row['units']
+        categories = [
+            DailySalesRollup(
+                day=row['day'], status=row['order__status'], category_id=row['product__category'],
+                order_count=row['order_count'], units=row['units'], revenue=row['revenue'],
+            )
+            for row in items.values('day', 'order__status', 'product__category').annotate(
+                order_count=Count('order', distinct=True), units=Sum('quantity'),
+                revenue=Sum(F('price') * F('quantity'), output_field=REVENUE),
+            )
+        ]
+        DailySalesRollup.objects.filter(day__gte=start, day__lt=end).delete()
+        DailySalesRollup.objects.bulk_create(list(totals.values()) + categories, batch_size=1000)
+    return len(totals) + len(categories)
+
+
+def rebuild_product_sales():
+    """Recompute every ProductSales row from OrderItem in one transaction. Returns the row count."""
+    with transaction.atomic():
+        rows = [
+            ProductSales(product_id=row['product'], units=row['units'], revenue=row['revenue'],
+                         last_sold_at=row['last_sold_at'])
+            for row in OrderItem.objects.exclude(order__status=CANCELLED).values('product').annotate(
+                units=Sum('quantity'), revenue=Sum(F('price') * F('quantity'), output_field=REVENUE),
+                last_sold_at=Max('order__created_at'),
+            )
+        ]
+        ProductSales.objects.all().delete()
+        ProductSales.objects.bulk_create(rows, batch_size=1000)
+    return len(rows)
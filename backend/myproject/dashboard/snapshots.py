@@ -0,0 +1,76 @@
+# dashboard/snapshots.py
+#
+# Cached dashboard payloads.
+#
+# A snapshot is stored in the Django cache together with the time it goes
+# stale and the invalidation generation it was computed under. Model writes
+# (see the receivers in dashboard/models.py) bump the generation, which makes
+# the snapshot stale without removing it.
+#
+# Stampede protection: when a snapshot is stale, the first request takes a
+# short lock with cache.add() and recomputes it; concurrent requests keep
+# getting the stale payload meanwhile. Only when there is no snapshot at all
+# do they wait (up to DASHBOARD_SNAPSHOT_LOCK_TIMEOUT) for the one being
+# computed. With a per-process cache (the default LocMemCache) invalidation
+# only reaches the process that saw the write; use a shared cache backend
+# when running several workers.
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+DEFAULT_TTL = 300  # seconds a snapshot is served without recomputing
+DEFAULT_LOCK_TIMEOUT = 30  # seconds one recomputation may hold the lock
+WAIT_INTERVAL = 0.05
+
+
+def _keys(name):
+    return f'dashboard:snapshot:{name}', f'dashboard:snapshot:{name}:generation', f'dashboard:snapshot:{name}:lock'
+
+
+def _generation(key):
+    generation = cache.get(key)
+    if generation is None:
+        cache.add(key, 1, timeout=None)
+        generation = cache.get(key, 1)
+    return generation
+
+
+def invalidate(name):
+    """Mark snapshot `name` stale; the next request recomputes it."""
+    _, generation_key, _ = _keys(name)
+    try:
+        cache.incr(generation_key)
+    except ValueError:  # not set yet (or evicted)
+        cache.add(generation_key, 1, timeout=None)
+
+
+def get_snapshot(name, compute, ttl=None):
+    """Return the cached payload `name`, recomputing it with `compute()` when stale."""
+    ttl = ttl if ttl is not None else getattr(settings, 'DASHBOARD_SNAPSHOT_TTL', DEFAULT_TTL)
+    lock_timeout = getattr(settings, 'DASHBOARD_SNAPSHOT_LOCK_TIMEOUT', DEFAULT_LOCK_TIMEOUT)
+    key, generation_key, lock_key = _keys(name)
+
+    deadline = time.monotonic() + lock_timeout
+    while True:
+        generation = _generation(generation_key)
+        snapshot = cache.get(key)
+        if snapshot is not None and snapshot['generation'] == generation and snapshot['expires_at'] > time.time():
+            return snapshot['data']
+
+        if cache.add(lock_key, 1, timeout=lock_timeout):
+            try:
+                data = compute()
+                # Kept past its TTL so it can be served while the next one is computed
+                cache.set(key, {'data': data, 'generation': generation, 'expires_at': time.time() + ttl},
+                          timeout=ttl + lock_timeout)
+                return data
+            finally:
+                cache.delete(lock_key)
+
+        # Someone else is recomputing: serve the stale copy, or wait for theirs
+        if snapshot is not None:
+            return snapshot['data']
+        if time.monotonic() >= deadline:
+            return compute()
+        time.sleep(WAIT_INTERVAL)
@@ -1,3 +1,314 @@
+import datetime
+import io
+import threading
+import time
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.db.models.signals import post_init
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from orders.models import Order, OrderItem
+from products.models import Category, Product
+from .models import DailySalesRollup, ProductSales
+from .snapshots import get_snapshot, invalidate
+
+
+class OrdersAnalyticsTests(TestCase):
+    """OrdersAnalytics must answer any range with the same number of queries."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_user('admin', password='x', is_staff=True)
+        customer = User.objects.create_user('customer', password='x')
+        now = timezone.now()
+        for days_ago, total in [(0, 10), (1, 20), (1, 5), (40, 7), (200, 3)]:
+            order = Order.objects.create(
+                user=customer, first_name='A', last_name='B', email='a@example.com',
+                address='x', city='x', state='x', postal_code='1', total_cost=total,
+            )
+            Order.objects.filter(pk=order.pk).update(created_at=now - datetime.timedelta(days=days_ago))
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+
+    def get(self, **params):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/dashboard/orders-analytics/', params)
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json(), len(queries)
+
+    def test_query_count_does_not_depend_on_range(self):
+        _, short_range = self.get(days=7)
+        _, long_range = self.get(days=365)
+        _, weekly = self.get(days=365, granularity='week')
+        self.assertEqual(short_range, long_range)
+        self.assertEqual(short_range, weekly)
+
+    def test_daily_data_is_gap_filled(self):
+        data, _ = self.get(days=30)
+        today = timezone.localdate()
+        self.assertEqual(len(data['daily_data']), 31)
+        self.assertEqual(data['daily_data'][today.strftime('%Y-%m-%d')], {'count': 1, 'revenue': 10.0})
+        yesterday = (today - datetime.timedelta(days=1)).strftime('%Y-%m-%d')
+        self.assertEqual(data['daily_data'][yesterday], {'count': 2, 'revenue': 25.0})
+        self.assertEqual(sum(day['count'] for day in data['daily_data'].values()), 3)
+
+    def test_monthly_totals(self):
+        today = timezone.localdate()
+        data, _ = self.get(start=(today - datetime.timedelta(days=365)).isoformat(), end=today.isoformat(),
+                           granularity='month')
+        self.assertEqual(sum(month['count'] for month in data['daily_data'].values()), 5)
+        self.assertTrue(all(key.endswith('-01') for key in data['daily_data']))
+
+    def test_range_is_limited(self):
+        for days in (100000, 99999999999):
+            response = self.client.get('/api/dashboard/orders-analytics/', {'days': days})
+            self.assertEqual(response.status_code, 400, days)
+
+
+class ReplenishmentReportTests(TestCase):
+    """ReplenishmentReport query parameter validation."""
+
+    def setUp(self):
+        self.client.force_login(User.objects.create_user('admin', password='x', is_staff=True))
+
+    def test_limit_must_be_positive(self):
+        for limit in ('0', '-1', 'abc'):
+            response = self.client.get('/api/dashboard/replenishment/', {'limit': limit})
+            self.assertEqual(response.status_code, 400, limit)
+        self.assertEqual(self.client.get('/api/dashboard/replenishment/', {'limit': 5}).status_code, 200)
+
+
+class CustomersListTests(TestCase):
+    """Keyset pagination of CustomersList: every ordering, cursors and the CSV export."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_user('admin', password='x', is_staff=True)
+        now = timezone.now()
+        # (username, order totals): ties on spend, and customers without orders
+        customers = [('a', [10, 20]), ('b', [30]), ('c', []), ('d', [15, 15]), ('e', []), ('f', ['9.99'])]
+        for position, (name, totals) in enumerate(customers):
+            customer = User.objects.create_user(name, password='x')
+            for index, total in enumerate(totals):
+                order = Order.objects.create(
+                    user=customer, first_name='A', last_name='B', email='a@example.com',
+                    address='x', city='x', state='x', postal_code='1', total_cost=total,
+                )
+                Order.objects.filter(pk=order.pk).update(
+                    created_at=now - datetime.timedelta(days=position * 5 + index))
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+
+    def pages(self, **params):
+        url, params, rows = '/api/dashboard/customers/', dict(params, page_size=2), []
+        while url:
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(url, params)
+            self.assertEqual(response.status_code, 200, response.content)
+            self.assertEqual(len([q for q in queries if 'auth_user' in q['sql'] and 'orders_order' in q['sql']]), 1)
+            data = response.json()
+            rows += data['results']
+            url, params = data['next'], {}
+        return rows
+
+    def test_every_ordering_pages_through_all_customers(self):
+        for ordering, key in [('id', lambda row: row['id']),
+                              ('spend', lambda row: (row['total_spent'], row['id'])),
+                              ('recency', lambda row: (row['last_order'] or '', row['id'])),
+                              ('joined', lambda row: (row['date_joined'], row['id']))]:
+            for descending in (False, True):
+                rows = self.pages(ordering=('-' if descending else '') + ordering)
+                self.assertEqual(len(rows), 6, ordering)
+                self.assertEqual(rows, sorted(rows, key=key, reverse=descending), ordering)
+
+    def test_totals(self):
+        rows = {row['username']: row for row in self.pages(ordering='id')}
+        self.assertEqual((rows['a']['orders_count'], rows['a']['total_spent']), (2, 30.0))
+        self.assertEqual((rows['c']['orders_count'], rows['c']['total_spent'], rows['c']['last_order']), (0, 0.0, None))
+
+    def test_invalid_parameters(self):
+        for params in ({'ordering': 'name'}, {'cursor': 'not-a-cursor'}, {'page_size': 'x'}):
+            response = self.client.get('/api/dashboard/customers/', params)
+            self.assertEqual(response.status_code, 400, params)
+
+    def test_csv_export(self):
+        response = self.client.get('/api/dashboard/customers/', {'export': 'csv', 'ordering': 'id'})
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines[0].split(',')[:2], ['id', 'username'])
+        self.assertEqual(len(lines), 7)
+        spent = {line.split(',')[1]: line.split(',')[6] for line in lines[1:]}
+        self.assertEqual(spent, {'a': '30.00', 'b': '30.00', 'c': '0.00', 'd': '30.00', 'e': '0.00', 'f': '9.99'})
+
+
+class SnapshotTests(TestCase):
+    """Cached dashboard payloads: hits, invalidation and stale-while-recompute."""
+
+    def setUp(self):
+        cache.clear()
+        self.calls = 0
+
+    def compute(self):
+        self.calls += 1
+        return {'calls': self.calls}
+
+    def test_hit_until_invalidated(self):
+        self.assertEqual(get_snapshot('test', self.compute), {'calls': 1})
+        self.assertEqual(get_snapshot('test', self.compute), {'calls': 1})
+        invalidate('test')
+        self.assertEqual(get_snapshot('test', self.compute), {'calls': 2})
+
+    def test_expires_after_ttl(self):
+        get_snapshot('test', self.compute, ttl=60)
+        with mock.patch('dashboard.snapshots.time.time', return_value=time.time() + 61):
+            self.assertEqual(get_snapshot('test', self.compute, ttl=60), {'calls': 2})
+
+    def test_stale_copy_served_while_recomputing(self):
+        get_snapshot('test', self.compute)
+        invalidate('test')
+        started, release = threading.Event(), threading.Event()
+
+        def slow_compute():
+            started.set()
+            release.wait(5)
+            return self.compute()
+
+        worker = threading.Thread(target=get_snapshot, args=('test', slow_compute))
+        worker.start()
+        started.wait(5)
+        # Another request while the lock is held gets the stale payload at once
+        self.assertEqual(get_snapshot('test', self.compute), {'calls': 1})
+        release.set()
+        worker.join()
+        self.assertEqual(get_snapshot('test', self.compute), {'calls': 2})
+        self.assertEqual(self.calls, 2)
+
+    def test_login_does_not_invalidate_overview(self):
+        admin = User.objects.create_user('admin', password='x', is_staff=True)
+        with self.captureOnCommitCallbacks(execute=True):
+            get_snapshot('overview', self.compute)
+            self.client.login(username='admin', password='x')
+        self.assertEqual(get_snapshot('overview', self.compute), {'calls': 1})
+        with self.captureOnCommitCallbacks(execute=True):
+            admin.first_name = 'Ada'
+            admin.save()
+        self.assertEqual(get_snapshot('overview', self.compute), {'calls': 2})
+
+
+class SalesRollupTests(TestCase):
+    """The signal-maintained rollup and counters must equal a rebuild from the order tables."""
+    maxDiff = None
+
+    def rows(self):
+        rollup = sorted(
+            (row.day, row.status, row.category_id or 0, row.order_count, row.units, row.revenue)
+            for row in DailySalesRollup.objects.exclude(order_count=0, units=0, revenue=0)
+        )
+        # last_sold_at only moves forward incrementally, so it is left out
+        products = sorted(ProductSales.objects.exclude(units=0).values_list('product', 'units', 'revenue'))
+        return rollup, products
+
+    def setUp(self):
+        customer = User.objects.create_user('customer', password='x')
+        categories = [Category.objects.create(name=f'c{i}', slug=f'c{i}') for i in range(2)]
+        products = [
+            Product.objects.create(name=f'p{i}', slug=f'p{i}', description='', price=10 + i,
+                                   category=categories[i % 2], stock=5)
+            for i in range(4)
+        ]
+        orders = []
+        for total in (30, 40, 50, 60):
+            order = Order.objects.create(
+                user=customer, first_name='A', last_name='B', email='a@example.com',
+                address='x', city='x', state='x', postal_code='1', total_cost=total,
+            )
+            for quantity, product in enumerate(products[:3], start=1):
+                OrderItem.objects.create(order=order, product=product, price=product.price, quantity=quantity)
+            orders.append(order)
+        self.orders, self.products = orders, products
+
+    def test_incremental_matches_rebuild(self):
+        orders, products = self.orders, self.products
+        orders[0].status = 'cancelled'
+        orders[0].save()
+        item = orders[1].items.first()
+        item.product = products[3]
+        item.quantity = 7
+        item.save()
+        orders[2].items.last().delete()
+        Order.objects.get(pk=orders[3].pk).delete()  # items go with it
+        self.assertMatchesRebuild()
+
+    def assertMatchesRebuild(self):
+        incremental = self.rows()
+        call_command('rebuild_sales_rollup', stdout=io.StringIO())
+        self.assertEqual(incremental, self.rows())
+
+    def test_delete_product_with_sales(self):
+        pk = self.products[0].pk
+        self.products[0].delete()
+        self.assertFalse(ProductSales.objects.filter(product_id=pk).exists())
+        self.assertMatchesRebuild()
+
+    def test_delete_category_with_sales(self):
+        pk = self.products[0].category_id
+        Category.objects.get(pk=pk).delete()
+        self.assertFalse(DailySalesRollup.objects.filter(category_id=pk).exists())
+        self.assertMatchesRebuild()
+
+    def test_status_change_on_deferred_order(self):
+        order = Order.objects.only('id', 'status').get(pk=self.orders[0].pk)
+        order.status = 'shipped'
+        order.save()
+        OrderItem.objects.only('id').get(pk=self.orders[1].items.first().pk).delete()
+        self.assertMatchesRebuild()
+
+    def test_recategorised_product(self):
+        product = self.products[0]
+        # An order whose only item is the product, so it leaves its category entirely
+        alone = Order.objects.create(
+            user=self.orders[0].user, first_name='A', last_name='B', email='a@example.com',
+            address='x', city='x', state='x', postal_code='1', total_cost=5,
+        )
+        OrderItem.objects.create(order=alone, product=product, price=product.price, quantity=2)
+        product.category = self.products[1].category
+        with CaptureQueriesContext(connection) as queries:
+            product.save()
+        self.assertFalse([q for q in queries if q['sql'].startswith('DELETE')])  # no rebuild
+        self.assertMatchesRebuild()
+        self.orders[0].items.get(product=product).delete()
+        self.assertMatchesRebuild()
+
+    def test_loading_rows_runs_no_rollup_code(self):
+        for model in (Order, OrderItem, Product):
+            self.assertFalse(post_init.has_listeners(model), model)
+
+    def test_product_analytics_validates_days(self):
+        self.client.force_login(User.objects.create_user('admin', password='x', is_staff=True))
+        for days in ('abc', '-1', '100000'):
+            response = self.client.get('/api/dashboard/product-analytics/', {'days': days})
+            self.assertEqual(response.status_code, 400, days)
 
-# Create your tests here.
+    def test_product_analytics_reads_counters(self):
+        self.client.force_login(User.objects.create_user('admin', password='x', is_staff=True))
+        Order.objects.filter(pk=self.orders[0].pk).get().delete()
+        order = Order.objects.get(pk=self.orders[1].pk)
+        order.status = 'cancelled'
+        order.save()
+        responses = {}
+        for source in ('live', 'rollup'):
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get('/api/dashboard/product-analytics/', {'source': source})
+            responses[source] = response.json()['top_products']
+            self.assertLessEqual(len(queries), 6)  # session, user, top, low stock, categories
+        self.assertEqual(responses['live'], responses['rollup'])
+        # 2 orders left, each with 1, 2 and 3 units of products 0, 1 and 2
+        self.assertEqual([(row['total_sold'], row['revenue']) for row in responses['rollup']],
+                         [(6, 72.0), (4, 44.0), (2, 20.0)])
@@ -1,10 +1,12 @@
 
 from django.urls import path
 from .views import DashboardOverview, CustomersList, OrdersAnalytics, ProductAnalytics
+from .views import ReplenishmentReport
 
 urlpatterns = [
     path('overview/', DashboardOverview.as_view(), name='dashboard-overview'),
     path('customers/', CustomersList.as_view(), name='dashboard-customers'),
     path('orders-analytics/', OrdersAnalytics.as_view(), name='orders-analytics'),
     path('product-analytics/', ProductAnalytics.as_view(), name='product-analytics'),
+    path('replenishment/', ReplenishmentReport.as_view(), name='replenishment-report'),
 ]
\ No newline at end of file
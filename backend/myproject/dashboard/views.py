@@ -1,134 +1,324 @@
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import permissions, status
-from django.db.models import Count, Sum, Avg
+from django.db.models import Count, Sum, Avg, Max, Q, Value, DecimalField, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce, TruncDay, TruncWeek, TruncMonth
+from django.conf import settings
 from django.contrib.auth.models import User
+from django.http import StreamingHttpResponse
 from django.utils import timezone
 from datetime import timedelta
-from orders.models import Order
+from decimal import Decimal
+import csv
+import datetime
+from orders.models import Order, OrderItem
 from products.models import Product, Category
+from predictions.models import ReplenishmentForecast
+from .models import DailySalesRollup
+from .pagination import KeysetPagination
+from .snapshots import get_snapshot
 
 class IsAdminUser(permissions.BasePermission):
     def has_permission(self, request, view):
         return request.user and request.user.is_staff
 
+def use_rollup(request):
+    """Read order numbers from DailySalesRollup? ?source=rollup|live, else DASHBOARD_USE_ROLLUP."""
+    source = request.query_params.get('source')
+    if source in ('rollup', 'live'):
+        return source == 'rollup'
+    return getattr(settings, 'DASHBOARD_USE_ROLLUP', False)
+
+
 class DashboardOverview(APIView):
     permission_classes = [IsAdminUser]
     
     def get(self, request):
-        # Get current date and time
-        now = timezone.now()
-        thirty_days_ago = now - timedelta(days=30)
-        
-        # Summary statistics
-        total_orders = Order.objects.count()
-        recent_orders = Order.objects.filter(created_at__gte=thirty_days_ago).count()
-        total_products = Product.objects.count()
-        total_customers = User.objects.exclude(is_staff=True).count()
-        
-        # Sales statistics
-        total_sales = Order.objects.filter(status__in=['delivered', 'shipped']).aggregate(total=Sum('total_cost'))['total'] or 0
-        recent_sales = Order.objects.filter(
-            status__in=['delivered', 'shipped'],
-            created_at__gte=thirty_days_ago
-        ).aggregate(total=Sum('total_cost'))['total'] or 0
-        
-        # Order status breakdown
-        status_counts = Order.objects.values('status').annotate(count=Count('id'))
-        status_breakdown = {item['status']: item['count'] for item in status_counts}
-        
-        # Category statistics
+        # Served from a cached snapshot; Order/Product/User writes invalidate it
+        # (see dashboard/models.py) and only one request recomputes it.
+        if use_rollup(request):
+            return Response(get_snapshot('overview-rollup', lambda: overview_payload(rollup=True)))
+        return Response(get_snapshot('overview', overview_payload))
+
+
+def overview_payload(rollup=False):
+    # Get current date and time
+    now = timezone.now()
+    thirty_days_ago = now - timedelta(days=30)
+    sold = Q(status__in=['delivered', 'shipped'])
+
+    # Order counts, sales and the status breakdown in one conditional aggregation,
+    # over the orders or over the per-day totals of the rollup (whole days)
+    if rollup:
+        recent = Q(day__gte=timezone.localdate(thirty_days_ago))
+        order_stats = DailySalesRollup.objects.filter(category__isnull=True).aggregate(
+            total_orders=Sum('order_count', default=0),
+            recent_orders=Sum('order_count', filter=recent, default=0),
+            total_sales=Sum('revenue', filter=sold),
+            recent_sales=Sum('revenue', filter=sold & recent),
+            **{f'status_{value}': Sum('order_count', filter=Q(status=value), default=0)
+               for value, _ in Order.STATUS_CHOICES}
+        )
+    else:
+        recent = Q(created_at__gte=thirty_days_ago)
+        order_stats = Order.objects.aggregate(
+            total_orders=Count('id'),
+            recent_orders=Count('id', filter=recent),
+            total_sales=Sum('total_cost', filter=sold),
+            recent_sales=Sum('total_cost', filter=sold & recent),
+            **{f'status_{value}': Count('id', filter=Q(status=value)) for value, _ in Order.STATUS_CHOICES}
+        )
+    status_breakdown = {
+        value: order_stats[f'status_{value}']
+        for value, _ in Order.STATUS_CHOICES if order_stats[f'status_{value}']
+    }
+
+    total_products = Product.objects.count()
+    total_customers = User.objects.exclude(is_staff=True).count()
+
+    # Category statistics (distinct: the order items join repeats each product)
+    if rollup:
+        # Rollup revenue is price x quantity of the category's items
+        category_sales = DailySalesRollup.objects.filter(category=OuterRef('pk')).values('category') \
+            .annotate(total=Sum('revenue')).values('total')
         category_stats = Category.objects.annotate(
             product_count=Count('products'),
-            total_sales=Sum('products__order_items__price')
+            total_sales=Subquery(category_sales)
         ).values('id', 'name', 'product_count', 'total_sales')
-        
-        # Recent orders
-        recent_orders_data = Order.objects.all().order_by('-created_at')[:10]
-        recent_orders_list = [
-            {
-                'id': order.id,
-                'customer': f"{order.first_name} {order.last_name}",
-                'email': order.email,
-                'total': order.total_cost,
-                'status': order.status,
-                'date': order.created_at
-            }
-            for order in recent_orders_data
-        ]
-        
-        return Response({
-            'summary': {
-                'total_orders': total_orders,
-                'recent_orders': recent_orders,
-                'total_products': total_products,
-                'total_customers': total_customers,
-                'total_sales': total_sales,
-                'recent_sales': recent_sales
-            },
-            'status_breakdown': status_breakdown,
-            'category_stats': list(category_stats),
-            'recent_orders': recent_orders_list
-        })
+    else:
+        category_stats = Category.objects.annotate(
+            product_count=Count('products', distinct=True),
+            total_sales=Sum(F('products__order_items__price') * F('products__order_items__quantity'),
+                            output_field=DecimalField(max_digits=14, decimal_places=2))
+        ).values('id', 'name', 'product_count', 'total_sales')
+
+    # Recent orders
+    recent_orders_data = Order.objects.order_by('-created_at').values(
+        'id', 'first_name', 'last_name', 'email', 'total_cost', 'status', 'created_at'
+    )[:10]
+    recent_orders_list = [
+        {
+            'id': order['id'],
+            'customer': f"{order['first_name']} {order['last_name']}",
+            'email': order['email'],
+            'total': order['total_cost'],
+            'status': order['status'],
+            'date': order['created_at']
+        }
+        for order in recent_orders_data
+    ]
+
+    return {
+        'summary': {
+            'total_orders': order_stats['total_orders'],
+            'recent_orders': order_stats['recent_orders'],
+            'total_products': total_products,
+            'total_customers': total_customers,
+            'total_sales': order_stats['total_sales'] or 0,
+            'recent_sales': order_stats['recent_sales'] or 0
+        },
+        'status_breakdown': status_breakdown,
+        'category_stats': list(category_stats),
+        'recent_orders': recent_orders_list
+    }
+
+# ?ordering= values of CustomersList (prefix with '-' for descending)
+CUSTOMER_ORDERINGS = {
+    'id': 'id',
+    'spend': 'total_spent',
+    'recency': 'last_order_key',
+    'joined': 'date_joined',
+}
+CUSTOMER_EXPORT_FIELDS = ['id', 'username', 'name', 'email', 'date_joined', 'orders_count', 'total_spent', 'last_order']
+NEVER = datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc)  # sort key of customers without orders
+CENTS = Decimal('0.01')
+
+
+class Echo:
+    """File-like object whose write() returns the line, for streaming csv.writer output."""
+    def write(self, value):
+        return value
+
 
 class CustomersList(APIView):
+    """
+    Customers with their order count, total spent and last order date, all
+    computed by one grouped query. Keyset-paginated ({'next', 'results'});
+    ?ordering=spend|recency|joined|id (prefix '-' for descending),
+    ?page_size=, and ?export=csv streams every customer instead of a page.
+    """
     permission_classes = [IsAdminUser]
+    stream_chunk_size = 2000  # rows fetched per database round trip when exporting
     
     def get(self, request):
-        customers = User.objects.exclude(is_staff=True)
-        
-        customer_data = []
-        for customer in customers:
-            orders = Order.objects.filter(user=customer)
-            total_spent = orders.aggregate(total=Sum('total_cost'))['total'] or 0
-            order_count = orders.count()
-            
-            customer_data.append({
-                'id': customer.id,
-                'username': customer.username,
-                'name': f"{customer.first_name} {customer.last_name}".strip() or customer.username,
-                'email': customer.email,
-                'date_joined': customer.date_joined,
-                'orders_count': order_count,
-                'total_spent': total_spent,
-                'last_order': orders.order_by('-created_at').first().created_at if order_count > 0 else None
-            })
-        
-        return Response(customer_data)
+        ordering = request.query_params.get('ordering', 'id')
+        field = CUSTOMER_ORDERINGS.get(ordering.lstrip('-'))
+        if field is None:
+            return Response({'error': f"ordering must be one of {', '.join(CUSTOMER_ORDERINGS)} (prefix '-' for descending)"},
+                            status=status.HTTP_400_BAD_REQUEST)
+        paginator = KeysetPagination(field, descending=ordering.startswith('-'))
+
+        customers = User.objects.exclude(is_staff=True).annotate(
+            orders_count=Count('orders'),
+            total_spent=Coalesce(Sum('orders__total_cost'), Value(Decimal('0')),
+                                 output_field=DecimalField(max_digits=12, decimal_places=2)),
+            last_order=Max('orders__created_at'),
+            last_order_key=Coalesce(Max('orders__created_at'), Value(NEVER)),
+        ).values(
+            'id', 'username', 'first_name', 'last_name', 'email', 'date_joined',
+            'orders_count', 'total_spent', 'last_order', 'last_order_key',
+        )
+
+        if request.query_params.get('export') == 'csv':
+            return self.export_csv(paginator.order(customers))
+
+        rows, next_url = paginator.paginate(customers, request)
+        return Response({
+            'next': next_url,
+            'results': [self.customer_data(row) for row in rows],
+        })
+
+    @staticmethod
+    def customer_data(row):
+        return {
+            'id': row['id'],
+            'username': row['username'],
+            'name': f"{row['first_name']} {row['last_name']}".strip() or row['username'],
+            'email': row['email'],
+            'date_joined': row['date_joined'],
+            'orders_count': row['orders_count'],
+            # SQLite sums decimals as floats (109.990000000000)
+            'total_spent': Decimal(row['total_spent']).quantize(CENTS),
+            'last_order': row['last_order'],
+        }
+
+    def export_csv(self, customers):
+        writer = csv.writer(Echo())
+
+        def lines():
+            yield writer.writerow(CUSTOMER_EXPORT_FIELDS)
+            for row in customers.iterator(chunk_size=self.stream_chunk_size):
+                data = self.customer_data(row)
+                yield writer.writerow([data[name] for name in CUSTOMER_EXPORT_FIELDS])
+
+        response = StreamingHttpResponse(lines(), content_type='text/csv')
+        response['Content-Disposition'] = 'attachment; filename="customers.csv"'
+        return response
+
+
+# ?granularity= of OrdersAnalytics: database truncation per period
+ANALYTICS_TRUNC = {'day': TruncDay, 'week': TruncWeek, 'month': TruncMonth}
+DEFAULT_ANALYTICS_MAX_DAYS = 1096  # about three years
+
+
+def period_starts(start, end, granularity):
+    """First day of every day/week (Monday)/month period overlapping [start, end]."""
+    if granularity == 'day':
+        current = start
+    elif granularity == 'week':
+        current = start - timedelta(days=start.weekday())
+    else:
+        current = start.replace(day=1)
+    while current <= end:
+        yield current
+        if granularity == 'day':
+            current += timedelta(days=1)
+        elif granularity == 'week':
+            current += timedelta(days=7)
+        else:
+            current = (current + timedelta(days=32)).replace(day=1)
+
 
 class OrdersAnalytics(APIView):
+    """
+    Order count and revenue per day, week or month, from one grouped query.
+
+    ?granularity=day|week|month (default day). The range is ?start= / ?end=
+    (YYYY-MM-DD, inclusive) or the last ?days= days (default 30), at most
+    DASHBOARD_ANALYTICS_MAX_DAYS long. Periods are keyed by their first day;
+    periods without orders are filled with zeros.
+    """
     permission_classes = [IsAdminUser]
     
     def get(self, request):
+        granularity = request.query_params.get('granularity', 'day')
+        if granularity not in ANALYTICS_TRUNC:
+            return Response({'error': 'granularity must be day, week or month'}, status=status.HTTP_400_BAD_REQUEST)
+
         # Get date range from query params or default to last 30 days
-        days = int(request.query_params.get('days', 30))
-        end_date = timezone.now()
-        start_date = end_date - timedelta(days=days)
-        
-        # Daily orders and revenue
+        max_days = getattr(settings, 'DASHBOARD_ANALYTICS_MAX_DAYS', DEFAULT_ANALYTICS_MAX_DAYS)
+        try:
+            end_date = datetime.date.fromisoformat(request.query_params['end']) \
+                if 'end' in request.query_params else timezone.localdate()
+            if 'start' in request.query_params:
+                start_date = datetime.date.fromisoformat(request.query_params['start'])
+            else:
+                days = int(request.query_params.get('days', 30))
+                # Checked before timedelta(), which overflows on huge values
+                if days > max_days:
+                    return Response({'error': f'The range is limited to {max_days} days'},
+                                    status=status.HTTP_400_BAD_REQUEST)
+                start_date = end_date - timedelta(days=days)
+        except (ValueError, OverflowError):
+            return Response({'error': 'start and end must be YYYY-MM-DD dates and days an integer'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        if start_date > end_date:
+            return Response({'error': 'start must not be after end'}, status=status.HTTP_400_BAD_REQUEST)
+        if (end_date - start_date).days > max_days:
+            return Response({'error': f'The range is limited to {max_days} days'}, status=status.HTTP_400_BAD_REQUEST)
+
+        rollup = use_rollup(request)
+        if rollup:
+            # Per-day order totals of the rollup: cost grows with the range, not the order volume
+            rows = DailySalesRollup.objects.filter(
+                category__isnull=True, day__gte=start_date, day__lte=end_date,
+            ).annotate(
+                period=ANALYTICS_TRUNC[granularity]('day')
+            ).values('period').annotate(
+                count=Sum('order_count'), revenue=Sum('revenue')
+            ).order_by('period')
+        else:
+            # One grouped query over a created_at range (index friendly, no per-day queries)
+            tz = timezone.get_current_timezone()
+            rows = Order.objects.filter(
+                created_at__gte=datetime.datetime.combine(start_date, datetime.time.min, tz),
+                created_at__lt=datetime.datetime.combine(end_date + timedelta(days=1), datetime.time.min, tz),
+            ).annotate(
+                period=ANALYTICS_TRUNC[granularity]('created_at', tzinfo=tz)
+            ).values('period').annotate(
+                count=Count('id'), revenue=Sum('total_cost')
+            ).order_by('period')
+        totals = {
+            row['period'].date() if isinstance(row['period'], datetime.datetime) else row['period']: row
+            for row in rows
+        }
+
+        # Fill the periods without orders
         orders_by_date = {}
-        current_date = start_date
-        
-        while current_date <= end_date:
-            date_str = current_date.strftime('%Y-%m-%d')
-            day_orders = Order.objects.filter(
-                created_at__date=current_date.date()
-            )
-            
-            orders_by_date[date_str] = {
-                'count': day_orders.count(),
-                'revenue': day_orders.aggregate(total=Sum('total_cost'))['total'] or 0
+        for period in period_starts(start_date, end_date, granularity):
+            row = totals.get(period)
+            orders_by_date[period.strftime('%Y-%m-%d')] = {
+                'count': row['count'] if row else 0,
+                'revenue': (row['revenue'] or 0) if row else 0
             }
-            
-            current_date += timedelta(days=1)
-        
-        # Status distribution
-        status_counts = Order.objects.values('status').annotate(count=Count('id'))
         
-        # Average order value
-        avg_order_value = Order.objects.aggregate(avg=Avg('total_cost'))['avg'] or 0
+        if rollup:
+            order_totals = DailySalesRollup.objects.filter(category__isnull=True)
+            status_counts = order_totals.values('status').annotate(count=Sum('order_count')) \
+                .filter(count__gt=0).order_by('status')
+            overall = order_totals.aggregate(orders=Sum('order_count'), revenue=Sum('revenue'))
+            avg_order_value = overall['revenue'] / overall['orders'] if overall['orders'] else 0
+        else:
+            # Status distribution
+            status_counts = Order.objects.values('status').annotate(count=Count('id'))
+
+            # Average order value
+            avg_order_value = Order.objects.aggregate(avg=Avg('total_cost'))['avg'] or 0
         
         return Response({
+            'granularity': granularity,
+            'start': start_date,
+            'end': end_date,
             'daily_data': orders_by_date,
             'status_distribution': list(status_counts),
             'average_order_value': avg_order_value
@@ -138,27 +328,51 @@ class ProductAnalytics(APIView):
     permission_classes = [IsAdminUser]
     
     def get(self, request):
-        # Top selling products
-        top_products = Product.objects.annotate(
-            total_sold=Sum('order_items__quantity'),
-            revenue=Sum('order_items__price')
-        ).filter(total_sold__gt=0).order_by('-total_sold')[:10]
+        try:
+            days = int(request.query_params.get('days', 30))
+        except ValueError:
+            return Response({'error': 'days must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+        max_days = getattr(settings, 'DASHBOARD_ANALYTICS_MAX_DAYS', DEFAULT_ANALYTICS_MAX_DAYS)
+        if not 0 <= days <= max_days:
+            return Response({'error': f'days must be between 0 and {max_days}'}, status=status.HTTP_400_BAD_REQUEST)
+
+        # Top selling products (orders that were not cancelled)
+        if use_rollup(request):
+            # Counters kept by dashboard/rollup.py; an index scan on ProductSales.units
+            top_products = [
+                (product, product.sales.units, product.sales.revenue, product.sales.last_sold_at)
+                for product in Product.objects.filter(sales__units__gt=0)
+                    .select_related('category', 'sales').order_by('-sales__units', 'pk')[:10]
+            ]
+        else:
+            sold = ~Q(order_items__order__status='cancelled')
+            top_products = [
+                (product, product.total_sold, product.revenue, product.last_sold_at)
+                for product in Product.objects.select_related('category').annotate(
+                    total_sold=Sum('order_items__quantity', filter=sold),
+                    revenue=Sum(F('order_items__price') * F('order_items__quantity'), filter=sold,
+                                output_field=DecimalField(max_digits=14, decimal_places=2)),
+                    last_sold_at=Max('order_items__order__created_at', filter=sold),
+                ).filter(total_sold__gt=0).order_by('-total_sold', 'pk')[:10]
+            ]
         
         top_products_data = [
             {
                 'id': product.id,
                 'name': product.name,
-                'total_sold': product.total_sold or 0,
-                'revenue': product.revenue or 0,
+                'total_sold': total_sold or 0,
+                'revenue': revenue or 0,
+                'last_sold_at': last_sold_at,
                 'price': product.price,
                 'category': product.category.name
             }
-            for product in top_products
+            for product, total_sold, revenue, last_sold_at in top_products
         ]
         
         # Low stock products
         low_stock_threshold = int(request.query_params.get('threshold', 5))
-        low_stock = Product.objects.filter(stock__lte=low_stock_threshold, available=True)
+        low_stock = Product.objects.filter(stock__lte=low_stock_threshold, available=True) \
+            .select_related('category')
         
         low_stock_data = [
             {
@@ -171,7 +385,77 @@ class ProductAnalytics(APIView):
             for product in low_stock
         ]
         
+        # Units and revenue per category over the last ?days= days
+        since = timezone.localdate() - timedelta(days=days)
+        if use_rollup(request):
+            category_sales = DailySalesRollup.objects.filter(category__isnull=False, day__gte=since) \
+                .exclude(status='cancelled').values('category', 'category__name') \
+                .annotate(units=Sum('units'), revenue=Sum('revenue')).order_by('-revenue')
+        else:
+            tz = timezone.get_current_timezone()
+            category_sales = OrderItem.objects.filter(
+                order__created_at__gte=datetime.datetime.combine(since, datetime.time.min, tz)
+            ).exclude(order__status='cancelled').values(
+                category=F('product__category'), category__name=F('product__category__name')
+            ).annotate(
+                units=Sum('quantity'),
+                revenue=Sum(F('price') * F('quantity'), output_field=DecimalField(max_digits=14, decimal_places=2))
+            ).order_by('-revenue')
+        
         return Response({
             'top_products': top_products_data,
-            'low_stock': low_stock_data
-        })
\ No newline at end of file
+            'low_stock': low_stock_data,
+            'category_sales': [
+                {'id': row['category'], 'name': row['category__name'], 'units': row['units'], 'revenue': row['revenue']}
+                for row in category_sales
+            ]
+        })
+
+
+class ReplenishmentReport(APIView):
+    """
+    Products whose forecast demand for the upcoming period exceeds their
+    stock, largest shortfall first. Reads the table rebuilt nightly by
+    `manage.py compute_replenishment`; no inference runs here.
+    """
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        try:
+            limit = min(int(request.query_params.get('limit', 50)), 500)
+            min_shortfall = float(request.query_params.get('min_shortfall', 0))
+        except ValueError:
+            return Response({'error': 'limit and min_shortfall must be numbers'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        if limit < 1:
+            return Response({'error': 'limit must be positive'}, status=status.HTTP_400_BAD_REQUEST)
+
+        # One query, served by the (store_id, -shortfall) / (-shortfall) indexes
+        forecasts = ReplenishmentForecast.objects.filter(shortfall__gt=min_shortfall)
+        store_id = request.query_params.get('store_id')
+        if store_id:
+            forecasts = forecasts.filter(store_id=store_id)
+        rows = forecasts.order_by('-shortfall').values(
+            'product_id', 'product__name', 'product__category__name', 'store_id',
+            'period_start', 'period_end', 'predicted_demand', 'stock_on_hand', 'shortfall',
+            'model_version', 'computed_at',
+        )[:limit]
+
+        return Response({
+            'replenishment': [
+                {
+                    'id': row['product_id'],
+                    'name': row['product__name'],
+                    'category': row['product__category__name'],
+                    'store_id': row['store_id'],
+                    'period_start': row['period_start'],
+                    'period_end': row['period_end'],
+                    'predicted_demand': round(row['predicted_demand'], 2),
+                    'stock': row['stock_on_hand'],
+                    'shortfall': round(row['shortfall'], 2),
+                    'model_version': row['model_version'],
+                    'computed_at': row['computed_at'],
+                }
+                for row in rows
+            ]
+        })
@@ -50,6 +50,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'predictions.instrumentation.ServerTimingMiddleware',  # per-stage Server-Timing header
 ]
 
 ROOT_URLCONF = 'myproject.urls'
@@ -169,3 +170,53 @@ EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'  # For developm
 # EMAIL_USE_TLS = True
 # EMAIL_HOST_USER = 'your_email@gmail.com'
 # EMAIL_HOST_PASSWORD = 'your_password'
+
+# Stock prediction settings
+PREDICTIONS_MODEL_PATH = os.path.join(BASE_DIR, 'predictions', 'model.pkl')
+PREDICTIONS_MODEL_CHECK_INTERVAL = 5  # seconds between model.pkl change checks
+PREDICTIONS_BATCH_MAX_ROWS = 5000  # rows accepted by /predictions/batch/ per request
+PREDICTIONS_CACHE_SIZE = 10000  # cached single-row predictions per process (0 disables)
+PREDICTIONS_CACHE_TTL = 3600  # seconds a cached prediction stays valid
+PREDICTIONS_FAST_PATH = True  # score single rows without building a DataFrame when the pipeline allows it
+PREDICTIONS_BATCH_WINDOW_MS = 0  # micro-batching window for concurrent predictions (0 disables)
+PREDICTIONS_BATCH_MAX_SIZE = 64  # rows per coalesced model.predict call
+PREDICTIONS_BATCH_QUEUE_DEPTH = 1024  # queued rows before callers score inline
+PREDICTIONS_COMPILED_MODEL_PATH = os.path.join(BASE_DIR, 'predictions', 'model_compiled')  # built by `manage.py compile_model`; a .npz path gives a single non-mmapped archive
+PREDICTIONS_USE_COMPILED_MODEL = False  # serve the compiled array evaluator instead of the pickle when it is up to date
+PREDICTIONS_MODEL_SERVER_SOCKET = None  # Unix socket of `manage.py run_model_server`; None predicts in-process
+PREDICTIONS_MODEL_SERVER_TIMEOUT = 2.0  # seconds for connecting to / waiting on the model server
+PREDICTIONS_MODEL_SERVER_RETRY_INTERVAL = 5  # seconds to predict in-process after the server failed
+PREDICTIONS_SERVER_TIMING = True  # add a Server-Timing header with the prediction stage breakdown
+PREDICTIONS_PAYLOAD_LOG_SAMPLE_RATE = 0.0  # fraction of requests whose prediction payloads are logged (1.0 logs all)
+PREDICTIONS_RETENTION_FULL_DAYS = 90  # `manage.py prune_predictions` keeps every prediction this recent
+PREDICTIONS_RETENTION_ARCHIVE_DAYS = 365  # ...and moves older ones to the archive table
+PREDICTIONS_RETENTION_CHUNK_SIZE = 5000  # rows per retention transaction
+PREDICTIONS_STORE_IDS = []  # stores `manage.py compute_replenishment` forecasts (empty: stores seen in past predictions)
+PREDICTIONS_REPLENISHMENT_WEEKS = 4  # weeks of forecast demand compared against Product.stock
+PREDICTIONS_SHADOW_MODELS = {}  # {'name': path} of candidate models scored in the background against served requests
+PREDICTIONS_SHADOW_SAMPLE_RATE = 1.0  # fraction of requests compared when shadow models are configured
+PREDICTIONS_SHADOW_WORKERS = 1  # background threads scoring the shadow models
+PREDICTIONS_SHADOW_QUEUE_DEPTH = 64  # queued requests before new ones are left out of the comparison
+PREDICTIONS_MODEL_ARTIFACT_DIR = os.path.join(BASE_DIR, 'predictions', 'artifacts')  # versioned models written by `manage.py retrain_model`
+PREDICTIONS_JOB_STALE_SECONDS = 6 * 3600  # forecast jobs 'running' for longer are requeued when a worker starts
+PREDICTIONS_WARMUP = None  # None, 'background' or 'blocking' (use 'blocking' with gunicorn --preload)
+
+# Dashboard overview snapshot (dashboard/snapshots.py). Writes invalidate it in the
+# process that made them; configure a shared CACHES backend when running several workers.
+DASHBOARD_SNAPSHOT_TTL = 300  # seconds the cached overview is served without recomputing
+DASHBOARD_SNAPSHOT_LOCK_TIMEOUT = 30  # seconds one recomputation may hold the lock
+DASHBOARD_ANALYTICS_MAX_DAYS = 1096  # longest range /dashboard/orders-analytics/ accepts
+DASHBOARD_USE_ROLLUP = False  # read order numbers from DailySalesRollup (`manage.py rebuild_sales_rollup` fills it); ?source=rollup|live overrides
+
+# Logging: warnings and errors of the prediction pipeline go to the console;
+# sampled payload logs (PREDICTIONS_PAYLOAD_LOG_SAMPLE_RATE) are logged at INFO.
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'predictions': {'handlers': ['console'], 'level': 'INFO', 'propagate': False},
+    },
+}
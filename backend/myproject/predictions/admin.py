@@ -1,4 +1,17 @@
 from django.contrib import admin
-from .models import  StockPrediction
+from .models import StockPrediction, StockPredictionArchive, ForecastJob
 
-admin.site.register(StockPrediction)
\ No newline at end of file
+admin.site.register(StockPrediction)
+
+@admin.register(ForecastJob)
+class ForecastJobAdmin(admin.ModelAdmin):
+    list_display = ['id', 'status', 'processed_rows', 'total_rows', 'created_at', 'finished_at']
+    list_filter = ['status']
+    readonly_fields = ['created_at', 'started_at', 'finished_at']
+
+
+@admin.register(StockPredictionArchive)
+class StockPredictionArchiveAdmin(admin.ModelAdmin):
+    list_display = ['original_id', 'product', 'store_id', 'week_year', 'month', 'week_number',
+                    'predicted_stock', 'created_at', 'archived_at']
+    list_filter = ['week_year']
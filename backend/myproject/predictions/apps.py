@@ -1,6 +1,33 @@
+import os
+import sys
+
 from django.apps import AppConfig
 
+# Entry points that run management commands rather than serve requests
+MANAGEMENT_ENTRY_POINTS = ('manage.py', 'django-admin', '__main__.py')
+
+
+def is_server_process(argv):
+    """
+    True when this process serves requests: a WSGI/ASGI server (gunicorn,
+    uwsgi, daphne, uvicorn...) or the runserver child that the autoreloader
+    starts. Other management commands never warm up the model.
+    """
+    if not argv or os.path.basename(argv[0]) not in MANAGEMENT_ENTRY_POINTS:
+        return True
+    if len(argv) < 2 or argv[1] != 'runserver':
+        return False
+    return os.environ.get('RUN_MAIN') == 'true' or '--noreload' in argv
+
 
 class PredictionsConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "predictions"
+
+    def ready(self):
+        # Optionally load and warm up the prediction model before serving
+        # traffic (see PREDICTIONS_WARMUP in settings.py); one place for the
+        # WSGI and ASGI entry points alike.
+        if is_server_process(sys.argv):
+            from .warmup import warm_up_on_startup
+            warm_up_on_startup()
@@ -0,0 +1,210 @@
+# predictions/backtest.py
+#
+# Offline backtest of the stock model against real sales.
+#
+# Actual demand is the quantity sold per product and model week (the same
+# week-of-month periods the model predicts), taken from OrderItem rows of
+# non-cancelled orders. Products are processed in chunks: each chunk runs one
+# grouped query (product x day, summed in the database, read with
+# values_list), the days are folded into weeks with NumPy, every (product,
+# store, week) of the chunk is scored in one predict call and only the
+# per-(product, store) error metrics are kept. Memory is bounded by the chunk
+# size, not by the number of order items.
+#
+# Orders are not attributed to a store, so each store's predictions are
+# compared with the same (total) sales of the product.
+import datetime
+
+import numpy as np
+from django.db.models import F, FloatField, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from orders.models import OrderItem
+from products.models import Product
+from .features import EXPECTED_FEATURES, derive_date_features
+from .inference import predict_frame
+
+DEFAULT_CHUNK_PRODUCTS = 200
+
+METRIC_FIELDS = ['sku_id', 'store_id', 'weeks', 'actual', 'predicted', 'mae', 'rmse', 'bias', 'wape']
+
+
+def backtest_weeks(start, end):
+    """
+    Model weeks between `start` (inclusive) and `end` (exclusive).
+
+    Returns (week_index, starts, week_number, month, year): week_index maps
+    every day of the range (as an offset from `start`) to its week.
+    """
+    days = np.arange(np.datetime64(start, 'D'), np.datetime64(end, 'D'), dtype='datetime64[D]')
+    week_number, month, year = derive_date_features(days)
+    keys = (year * 100 + month) * 10 + week_number
+    # days are sorted, so keys are non-decreasing and a week starts where the key changes
+    starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+    week_index = np.cumsum(np.r_[True, keys[1:] != keys[:-1]]) - 1
+    return week_index, days[starts], week_number[starts], month[starts], year[starts]
+
+
+def sales_by_day(product_ids, start, end):
+    """
+    Units sold and revenue per (product, day) for `product_ids` in one
+    grouped query. Returns (product_id, day, quantity, revenue) arrays.
+    """
+    tz = timezone.get_current_timezone()
+    rows = list(
+        OrderItem.objects
+        .filter(
+            product_id__in=product_ids,
+            order__created_at__gte=datetime.datetime.combine(start, datetime.time.min, tz),
+            order__created_at__lt=datetime.datetime.combine(end, datetime.time.min, tz),
+        )
+        .exclude(order__status='cancelled')
+        .annotate(day=TruncDate('order__created_at'))
+        .values('product_id', 'day')
+        .annotate(units=Sum('quantity'),
+                  revenue=Sum(F('price') * F('quantity'), output_field=FloatField()))
+        .order_by()
+        .values_list('product_id', 'day', 'units', 'revenue')
+    )
+    if not rows:
+        return (np.empty(0, dtype=np.int64), np.empty(0, dtype='datetime64[D]'),
+                np.empty(0), np.empty(0))
+    product_id, day, quantity, revenue = zip(*rows)
+    return (np.array(product_id, dtype=np.int64), np.array(day, dtype='datetime64[D]'),
+            np.array(quantity, dtype=float), np.array(revenue, dtype=float))
+
+
+def _feature_frame(product_ids, store_ids, unit_price, base_price, week_number, month, year):
+    """(product x store x week) feature grid, product-major, then store, then week."""
+    import pandas as pd
+    n_products, n_stores, n_weeks = len(product_ids), len(store_ids), len(week_number)
+    return pd.DataFrame({
+        'week_number': np.tile(week_number, n_products * n_stores),
+        'week_month': np.tile(month, n_products * n_stores),
+        'store_id': np.tile(np.repeat(np.asarray(store_ids, dtype=str), n_weeks), n_products),
+        'sku_id': np.repeat(product_ids, n_stores * n_weeks),
+        'total_price': np.repeat(unit_price, n_stores, axis=0).ravel(),
+        'base_price': np.repeat(base_price, n_stores * n_weeks),
+        'is_featured_sku': np.zeros(n_products * n_stores * n_weeks, dtype=np.int64),
+        'is_display_sku': np.zeros(n_products * n_stores * n_weeks, dtype=np.int64),
+        'week_year': np.tile(year, n_products * n_stores),
+    }, columns=EXPECTED_FEATURES)
+
+
+def backtest_chunk(products, store_ids, start, end, weeks):
+    """
+    Backtest one chunk of products.
+
+    `products` is a list of (product_id, price, created_at) tuples and
+    `weeks` the result of backtest_weeks(start, end). Returns a list of
+    metric dicts (METRIC_FIELDS), one per product and store.
+    """
+    week_index, week_starts, week_number, month, year = weeks
+    product_ids = np.array([product_id for product_id, _, _ in products], dtype=np.int64)
+    base_price = np.array([float(price) for _, price, _ in products])
+    n_products, n_stores, n_weeks = len(products), len(store_ids), len(week_number)
+
+    # Fold (product, day) sales into a (product x week) grid
+    sold_product, sold_day, quantity, revenue = sales_by_day(product_ids.tolist(), start, end)
+    p = np.searchsorted(product_ids, sold_product)
+    w = week_index[(sold_day - np.datetime64(start, 'D')).astype(np.int64)]
+    actual = np.zeros((n_products, n_weeks))
+    sold_revenue = np.zeros((n_products, n_weeks))
+    np.add.at(actual, (p, w), quantity)
+    np.add.at(sold_revenue, (p, w), revenue)
+    # Average selling price when the product sold that week, list price otherwise
+    unit_price = np.where(actual > 0, sold_revenue / np.maximum(actual, 1), base_price[:, None])
+
+    predicted = np.asarray(predict_frame(_feature_frame(
+        product_ids, store_ids, unit_price, base_price, week_number, month, year,
+    )), dtype=float).reshape(n_products, n_stores, n_weeks)
+
+    # Weeks that ended before the product was created do not count
+    created = np.array([timezone.localdate(created_at) for _, _, created_at in products], dtype='datetime64[D]')
+    week_ends = np.r_[week_starts[1:], np.datetime64(end, 'D')]
+    mask = (week_ends[None, :] > created[:, None]).astype(float)
+    n = mask.sum(axis=1)
+
+    error = (predicted - actual[:, None, :]) * mask[:, None, :]
+    actual_total = (actual * mask).sum(axis=1)
+    predicted_total = (predicted * mask[:, None, :]).sum(axis=2)
+    abs_error = np.abs(error).sum(axis=2)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mae = abs_error / n[:, None]
+        rmse = np.sqrt((error ** 2).sum(axis=2) / n[:, None])
+        bias = error.sum(axis=2) / n[:, None]
+        wape = abs_error / actual_total[:, None]
+
+    return [
+        {
+            'sku_id': int(product_ids[i]),
+            'store_id': store_id,
+            'weeks': int(n[i]),
+            'actual': float(actual_total[i]),
+            'predicted': float(predicted_total[i, s]),
+            'mae': float(mae[i, s]),
+            'rmse': float(rmse[i, s]),
+            'bias': float(bias[i, s]),
+            'wape': float(wape[i, s]) if actual_total[i] else None,
+        }
+        for i in range(n_products) if n[i]
+        for s, store_id in enumerate(store_ids)
+    ]
+
+
+def run_backtest(store_ids, start, end, chunk_products=DEFAULT_CHUNK_PRODUCTS, product_ids=None):
+    """
+    Backtest every product (or `product_ids`) over [start, end).
+    Yields the metric dicts of one product chunk at a time.
+    """
+    weeks = backtest_weeks(start, end)
+    if not len(weeks[0]):
+        return
+    tz = timezone.get_current_timezone()
+    products = Product.objects.filter(
+        created_at__lt=datetime.datetime.combine(end, datetime.time.min, tz)
+    ).order_by('pk')
+    if product_ids:
+        products = products.filter(pk__in=product_ids)
+    last_id = 0
+    while True:
+        chunk = list(products.filter(pk__gt=last_id).values_list('id', 'price', 'created_at')[:chunk_products])
+        if not chunk:
+            return
+        yield backtest_chunk(chunk, store_ids, start, end, weeks)
+        last_id = chunk[-1][0]
+
+
+class BacktestTotals:
+    """Running totals of the per-(product, store) metrics across chunks."""
+
+    def __init__(self):
+        self.series = 0
+        self.weeks = 0
+        self.actual = 0.0
+        self.predicted = 0.0
+        self.abs_error = 0.0
+        self.squared_error = 0.0
+
+    def add(self, rows):
+        for row in rows:
+            self.series += 1
+            self.weeks += row['weeks']
+            self.actual += row['actual']
+            self.predicted += row['predicted']
+            self.abs_error += row['mae'] * row['weeks']
+            self.squared_error += row['rmse'] ** 2 * row['weeks']
+
+    def summary(self):
+        weeks = self.weeks or 1
+        return {
+            'series': self.series,
+            'weeks': self.weeks,
+            'actual': self.actual,
+            'predicted': self.predicted,
+            'mae': self.abs_error / weeks,
+            'rmse': (self.squared_error / weeks) ** 0.5,
+            'bias': (self.predicted - self.actual) / weeks,
+            'wape': self.abs_error / self.actual if self.actual else None,
+        }
@@ -0,0 +1,186 @@
+# predictions/batching.py
+#
+# In-process micro-batching for concurrent single-row predictions.
+#
+# With threaded workers, many requests can call predict_stock at the same
+# moment and each pays the fixed per-call overhead of model.predict. The
+# MicroBatcher collects rows for up to PREDICTIONS_BATCH_WINDOW_MS (or until
+# PREDICTIONS_BATCH_MAX_SIZE rows are waiting), scores them with one predict
+# call on a background thread and hands every caller its own result.
+#
+# A window of 0 disables batching. When the queue already holds
+# PREDICTIONS_BATCH_QUEUE_DEPTH rows, callers score their row inline instead of
+# waiting, so a burst can never block requests indefinitely.
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import numpy as np
+from django.conf import settings
+
+from .registry import registry
+
+DEFAULT_WINDOW_MS = 0
+DEFAULT_MAX_SIZE = 64
+DEFAULT_QUEUE_DEPTH = 1024
+RESULT_TIMEOUT = 30  # seconds a caller waits for its batch before giving up
+
+# Upper bounds of the batch size histogram buckets
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256)
+
+
+def score_rows(rows):
+    """Score a list of feature dicts with one predict call; returns a float array."""
+    loaded = registry.get()
+    if loaded.fast_path is not None:
+        predictions = loaded.fast_path.predict_many(rows)
+    else:
+        # Imported here to avoid a circular import with inference.py
+        import pandas as pd
+        from .inference import prepare_features
+        predictions = loaded.model.predict(prepare_features(pd.DataFrame(rows)))
+    return np.clip(np.asarray(predictions, dtype=float), 0, None)
+
+
+class MicroBatcher:
+    """Coalesces concurrent predict calls into batched model.predict calls."""
+
+    def __init__(self, window_ms=None, max_size=None, queue_depth=None):
+        self._window_ms = window_ms
+        self._max_size = max_size
+        self._queue_depth = queue_depth
+        self._queue = None
+        self._thread = None
+        self._pid = None
+        self._start_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._reset_stats()
+
+    @property
+    def window_ms(self):
+        if self._window_ms is not None:
+            return self._window_ms
+        return getattr(settings, 'PREDICTIONS_BATCH_WINDOW_MS', DEFAULT_WINDOW_MS)
+
+    @property
+    def max_size(self):
+        if self._max_size is not None:
+            return self._max_size
+        return getattr(settings, 'PREDICTIONS_BATCH_MAX_SIZE', DEFAULT_MAX_SIZE)
+
+    @property
+    def queue_depth(self):
+        if self._queue_depth is not None:
+            return self._queue_depth
+        return getattr(settings, 'PREDICTIONS_BATCH_QUEUE_DEPTH', DEFAULT_QUEUE_DEPTH)
+
+    @property
+    def enabled(self):
+        return self.window_ms > 0 and self.max_size > 1
+
+    def predict(self, input_data):
+        """Score one feature dict, batched with whatever else is waiting."""
+        self._ensure_started()
+        future = Future()
+        try:
+            self._queue.put_nowait((input_data, future, time.perf_counter()))
+        except queue.Full:
+            with self._stats_lock:
+                self.overflows += 1
+            return float(score_rows([input_data])[0])
+        return future.result(timeout=RESULT_TIMEOUT)
+
+    def _ensure_started(self):
+        # The worker thread does not survive fork(); restart it in each process.
+        if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+                return
+            self._queue = queue.Queue(maxsize=self.queue_depth)
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='prediction-batcher', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        pending = self._queue
+        while True:
+            batch = [pending.get()]
+            deadline = time.perf_counter() + self.window_ms / 1000.0
+            max_size = self.max_size
+            while len(batch) < max_size:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(pending.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            self._score(batch)
+
+    def _score(self, batch):
+        started = time.perf_counter()
+        rows = [input_data for input_data, _, _ in batch]
+        try:
+            predictions = score_rows(rows)
+        except Exception as e:
+            for _, future, _ in batch:
+                future.set_exception(e)
+            with self._stats_lock:
+                self.failed_batches += 1
+            return
+        for (_, future, _), prediction in zip(batch, predictions):
+            future.set_result(float(prediction))
+        self._record(batch, started)
+
+    def _record(self, batch, started):
+        waits = [started - enqueued_at for _, _, enqueued_at in batch]
+        size = len(batch)
+        with self._stats_lock:
+            self.batches += 1
+            self.rows += size
+            self.max_batch = max(self.max_batch, size)
+            self.wait_seconds_total += sum(waits)
+            self.wait_seconds_max = max(self.wait_seconds_max, max(waits))
+            for bound in BATCH_SIZE_BUCKETS:
+                if size <= bound:
+                    self.size_histogram[bound] += 1
+                    break
+            else:
+                self.size_histogram['+Inf'] += 1
+
+    def _reset_stats(self):
+        self.batches = 0
+        self.rows = 0
+        self.max_batch = 0
+        self.failed_batches = 0
+        self.overflows = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+        self.size_histogram = {bound: 0 for bound in BATCH_SIZE_BUCKETS}
+        self.size_histogram['+Inf'] = 0
+
+    def stats(self):
+        with self._stats_lock:
+            return {
+                'enabled': self.enabled,
+                'window_ms': self.window_ms,
+                'max_size': self.max_size,
+                'queue_depth': self.queue_depth,
+                'queued': self._queue.qsize() if self._queue is not None else 0,
+                'batches': self.batches,
+                'rows': self.rows,
+                'mean_batch_size': round(self.rows / self.batches, 3) if self.batches else 0.0,
+                'max_batch_size': self.max_batch,
+                'batch_size_histogram': {str(k): v for k, v in self.size_histogram.items()},
+                'mean_wait_ms': round(self.wait_seconds_total / self.rows * 1000, 3) if self.rows else 0.0,
+                'max_wait_ms': round(self.wait_seconds_max * 1000, 3),
+                'failed_batches': self.failed_batches,
+                'overflows': self.overflows,
+            }
+
+
+# The process-wide batcher used by predict_stock when batching is enabled.
+micro_batcher = MicroBatcher()
@@ -0,0 +1,124 @@
+# predictions/cache.py
+#
+# Bounded LRU + TTL cache for single-row predictions.
+#
+# The model is deterministic given its feature vector, so a prediction can be
+# reused for an identical (canonicalized) feature tuple as long as the same
+# model version is being served. Entries are tagged with the model version;
+# when the registry swaps in a new model the whole cache is dropped.
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+
+from .features import EXPECTED_FEATURES, FEATURE_DTYPES
+
+DEFAULT_CACHE_SIZE = 10000
+DEFAULT_CACHE_TTL = 3600  # seconds
+
+
+def feature_key(input_data):
+    """
+    Canonical, hashable form of a feature dict: values are cast the same way
+    prepare_features casts them, in EXPECTED_FEATURES order.
+    Raises KeyError/ValueError/TypeError for incomplete or malformed input.
+    """
+    key = []
+    for feature in EXPECTED_FEATURES:
+        cast = FEATURE_DTYPES[feature]
+        value = input_data[feature]
+        if cast is int:
+            value = int(value)
+        elif cast is float:
+            value = float(value)
+        else:
+            value = str(value)
+        key.append(value)
+    return tuple(key)
+
+
+class PredictionCache:
+    """Thread-safe LRU cache with per-entry expiry and hit/miss counters."""
+
+    def __init__(self, maxsize=None, ttl=None):
+        self._maxsize = maxsize
+        self._ttl = ttl
+        self._data = OrderedDict()  # key -> (expires_at, value)
+        self._version = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def maxsize(self):
+        if self._maxsize is not None:
+            return self._maxsize
+        return getattr(settings, 'PREDICTIONS_CACHE_SIZE', DEFAULT_CACHE_SIZE)
+
+    @property
+    def ttl(self):
+        if self._ttl is not None:
+            return self._ttl
+        return getattr(settings, 'PREDICTIONS_CACHE_TTL', DEFAULT_CACHE_TTL)
+
+    @property
+    def enabled(self):
+        return self.maxsize > 0
+
+    def get(self, key, version):
+        """Return the cached value for key under model `version`, or None."""
+        with self._lock:
+            if version != self._version:
+                self._reset(version)
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._data[key]
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, version, value):
+        with self._lock:
+            if version != self._version:
+                self._reset(version)
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def _reset(self, version):
+        # A different model is being served: every cached value is stale.
+        self._data.clear()
+        self._version = version
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'enabled': self.enabled,
+                'size': len(self._data),
+                'maxsize': self.maxsize,
+                'ttl': self.ttl,
+                'model_version': self._version,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+
+# The process-wide cache used by predict_stock.
+prediction_cache = PredictionCache()
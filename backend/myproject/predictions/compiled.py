@@ -0,0 +1,362 @@
+# predictions/compiled.py
+#
+# Array-backed evaluator for the trained stock model.
+#
+# `manage.py compile_model` flattens the fitted pipeline in model.pkl into a
+# handful of numpy arrays:
+#   - one (kind, source feature, offset, scale) entry per model input column
+#     for the StandardScaler / identity columns,
+#   - sorted key/value lookup tables for the TargetEncoder columns,
+#   - the CatBoost oblivious trees as a table of distinct (feature, border)
+#     splits, a (depth x trees) index into that table and a (trees x 2**depth)
+#     leaf value table.
+# CompiledModel evaluates all trees for a block of rows at once with numpy
+# indexing, without importing pandas, scikit-learn or catboost.
+#
+# The artifact is either a single .npz archive or a directory of .npy files;
+# the directory layout is loaded with mmap_mode='r' so all workers on a host
+# share one page-cache copy of the arrays.
+import json
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+from .features import EXPECTED_FEATURES, FEATURE_DTYPES
+
+ARTIFACT_FORMAT = 1
+DEFAULT_COMPILED_MODEL_PATH = os.path.join(os.path.dirname(__file__), 'model_compiled')
+# Published artifacts are world-readable: serving processes may run as another user
+FILE_MODE = 0o644
+DIR_MODE = 0o755
+
+KIND_AFFINE = 0
+KIND_LOOKUP = 1
+KIND_IDENTITY = 2
+
+ROW_BLOCK = 1024  # rows evaluated per tree-traversal block (bounds temp memory)
+
+
+def _catboost_trees(estimator):
+    """
+    Export a fitted CatBoost model's oblivious trees as flat arrays.
+
+    Returns split_features/split_borders (one entry per distinct split),
+    tree_splits (depth x trees, indexes into the distinct splits), leaf_values
+    (trees x 2**depth) and the model's scale and bias.
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'model.json')
+        estimator.save_model(path, format='json')
+        with open(path) as f:
+            exported = json.load(f)
+
+    trees = exported['oblivious_trees']
+    depth = max(len(tree['splits']) for tree in trees)
+    # Padding split for shallower trees: compares against +inf, so always bit 0.
+    splits = {(0, np.float32(np.inf)): 0}
+    tree_splits = np.zeros((depth, len(trees)), dtype=np.int32)
+    leaf_values = np.zeros((len(trees), 2 ** depth), dtype=np.float64)
+    for t, tree in enumerate(trees):
+        for d, split in enumerate(tree['splits']):
+            if split['split_type'] != 'FloatFeature':
+                raise ValueError(f"Unsupported CatBoost split type: {split['split_type']}")
+            key = (split['float_feature_index'], np.float32(split['border']))
+            tree_splits[d, t] = splits.setdefault(key, len(splits))
+        values = tree['leaf_values']
+        leaf_values[t, :len(values)] = values
+
+    split_features = np.array([feature for feature, _ in splits], dtype=np.int32)
+    split_borders = np.array([border for _, border in splits], dtype=np.float32)
+    scale, bias = exported.get('scale_and_bias', [1, [0]])
+    bias = bias[0] if isinstance(bias, list) else bias
+    return split_features, split_borders, tree_splits, leaf_values, float(scale), float(bias)
+
+
+def compile_pipeline(model, source_version=None):
+    """
+    Flatten a fitted Pipeline(ColumnTransformer, CatBoostRegressor) into a dict
+    of numpy arrays. Raises ValueError for pipelines this evaluator cannot run.
+    """
+    from sklearn.compose import ColumnTransformer
+    from sklearn.pipeline import Pipeline
+    from sklearn.preprocessing import FunctionTransformer, StandardScaler
+
+    if not isinstance(model, Pipeline) or len(model.steps) != 2:
+        raise ValueError("Expected a two-step Pipeline (preprocessor, estimator).")
+    preproc, estimator = model.steps[0][1], model.steps[1][1]
+    if not isinstance(preproc, ColumnTransformer) or preproc.remainder != 'drop':
+        raise ValueError("Expected a ColumnTransformer with remainder='drop'.")
+    if type(estimator).__name__ != 'CatBoostRegressor':
+        raise ValueError(f"Unsupported estimator: {type(estimator).__name__}")
+
+    kinds, sources, offsets, scales = [], [], [], []
+    arrays = {}
+    lookups = []
+    for name, transformer, columns in preproc.transformers_:
+        if transformer == 'drop':
+            continue
+        for i, column in enumerate(columns):
+            if column not in FEATURE_DTYPES:
+                raise ValueError(f"Unknown input column: {column}")
+            sources.append(EXPECTED_FEATURES.index(column))
+            if transformer == 'passthrough' or (
+                    isinstance(transformer, FunctionTransformer) and transformer.func is None):
+                kinds.append(KIND_IDENTITY)
+                offsets.append(0.0)
+                scales.append(1.0)
+            elif isinstance(transformer, StandardScaler):
+                kinds.append(KIND_AFFINE)
+                offsets.append(float(transformer.mean_[i]) if transformer.with_mean else 0.0)
+                scales.append(float(transformer.scale_[i]) if transformer.with_std else 1.0)
+            elif type(transformer).__name__ == 'TargetEncoder' and hasattr(transformer, 'ordinal_encoder'):
+                if transformer.handle_unknown != 'value':
+                    raise ValueError("Only TargetEncoder(handle_unknown='value') is supported.")
+                ordinal = {m['col']: m['mapping'] for m in transformer.ordinal_encoder.mapping}[column]
+                encoded = transformer.mapping[column]
+                pairs = [(key, float(encoded.loc[code])) for key, code in ordinal.items()
+                         if not (isinstance(key, float) and np.isnan(key))]
+                pairs.sort(key=lambda pair: pair[0])
+                key_kind = 'str' if all(isinstance(key, str) for key, _ in pairs) else 'int'
+                k = len(lookups)
+                arrays[f'lookup{k}_keys'] = np.array(
+                    [key for key, _ in pairs], dtype=str if key_kind == 'str' else np.int64
+                )
+                arrays[f'lookup{k}_values'] = np.array([value for _, value in pairs], dtype=np.float64)
+                unknown = float(encoded.loc[-1]) if -1 in encoded.index else float(transformer._mean)
+                lookups.append({'key_kind': key_kind, 'unknown': unknown})
+                kinds.append(KIND_LOOKUP)
+                offsets.append(float(k))  # index into the lookup tables
+                scales.append(1.0)
+            else:
+                raise ValueError(f"Unsupported transformer for {column}: {transformer!r}")
+
+    split_features, split_borders, tree_splits, leaf_values, scale, bias = _catboost_trees(estimator)
+    meta = {
+        'format': ARTIFACT_FORMAT,
+        'source_version': source_version,
+        'lookups': lookups,
+        'scale': scale,
+        'bias': bias,
+    }
+    arrays.update({
+        'meta': np.array(json.dumps(meta)),
+        'col_kind': np.array(kinds, dtype=np.int8),
+        'col_source': np.array(sources, dtype=np.int32),
+        'col_offset': np.array(offsets, dtype=np.float64),
+        'col_scale': np.array(scales, dtype=np.float64),
+        'split_features': split_features,
+        'split_borders': split_borders,
+        'tree_splits': tree_splits,
+        'leaf_values': leaf_values,
+    })
+    return arrays
+
+
+def save_compiled(arrays, path):
+    """
+    Write compiled arrays to `path` atomically.
+
+    A path ending in .npz gets a single archive (temp file + rename). Any other
+    path gets the memory-mappable layout: one .npy file per array in a
+    versioned directory `<path>-<source_version>`, with `path` itself a symlink
+    that is swapped atomically to the new directory. Workers that still map an
+    older directory keep reading it; its files are unlinked, not overwritten.
+    """
+    path = os.path.abspath(path)
+    directory = os.path.dirname(path)
+    if path.endswith('.npz'):
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.npz')
+        os.close(fd)
+        try:
+            np.savez(tmp_path, **arrays)
+            os.chmod(tmp_path, FILE_MODE)  # mkstemp creates it 0600
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        return path
+
+    meta = json.loads(str(arrays['meta']))
+    target = f"{path}-{meta.get('source_version') or 'unversioned'}"
+    tmp_dir = tempfile.mkdtemp(dir=directory, prefix=os.path.basename(path) + '.tmp-')
+    try:
+        for name, array in arrays.items():
+            np.save(os.path.join(tmp_dir, f'{name}.npy'), array)
+            os.chmod(os.path.join(tmp_dir, f'{name}.npy'), FILE_MODE)
+        # mkdtemp creates the directory 0700 and the rename keeps it; workers
+        # running as another user than compile_model must be able to map it
+        os.chmod(tmp_dir, DIR_MODE)
+        if os.path.isdir(target) and not os.path.islink(target):
+            shutil.rmtree(target)
+        os.rename(tmp_dir, target)
+    finally:
+        if os.path.exists(tmp_dir):
+            shutil.rmtree(tmp_dir)
+
+    link_tmp = f"{path}.link-{os.getpid()}"
+    if os.path.lexists(link_tmp):
+        os.remove(link_tmp)
+    os.symlink(os.path.basename(target), link_tmp)
+    previous = os.path.realpath(path) if os.path.islink(path) else None
+    os.replace(link_tmp, path)
+    if previous and previous != os.path.realpath(target) and os.path.isdir(previous):
+        shutil.rmtree(previous)
+    return target
+
+
+def read_meta(path):
+    if os.path.isdir(path):
+        return json.loads(str(np.load(os.path.join(path, 'meta.npy'))))
+    with np.load(path) as data:
+        return json.loads(str(data['meta']))
+
+
+def parity_sample(model, n_rows, seed=0):
+    """Random feature rows covering known and unknown category values."""
+    import pandas as pd
+    rng = np.random.default_rng(seed)
+    encoder = model.steps[0][1].named_transformers_.get('cat')
+    known_stores = ['unknown']
+    if encoder is not None and hasattr(encoder, 'ordinal_encoder'):
+        for mapping in encoder.ordinal_encoder.mapping:
+            if mapping['col'] == 'store_id':
+                known_stores += [key for key in mapping['mapping'].index if isinstance(key, str)]
+    return pd.DataFrame({
+        'week_number': rng.integers(1, 6, n_rows),
+        'week_month': rng.integers(1, 13, n_rows),
+        'store_id': rng.choice(known_stores, n_rows),
+        'sku_id': rng.integers(1, 1000000, n_rows),
+        'total_price': rng.uniform(1, 1000, n_rows),
+        'base_price': rng.uniform(1, 1000, n_rows),
+        'is_featured_sku': rng.integers(0, 2, n_rows),
+        'is_display_sku': rng.integers(0, 2, n_rows),
+        'week_year': rng.integers(2010, 2031, n_rows),
+    }, columns=EXPECTED_FEATURES).astype(FEATURE_DTYPES)
+
+
+class CompiledModel:
+    """Vectorized evaluator over compiled model arrays."""
+
+    def __init__(self, arrays):
+        meta = json.loads(str(arrays['meta']))
+        if meta.get('format') != ARTIFACT_FORMAT:
+            raise ValueError(f"Unsupported compiled model format: {meta.get('format')}")
+        self.source_version = meta.get('source_version')
+        self.col_kind = arrays['col_kind']
+        self.col_source = arrays['col_source']
+        self.col_offset = arrays['col_offset']
+        self.col_scale = arrays['col_scale']
+        self.lookups = [
+            (arrays[f'lookup{k}_keys'], arrays[f'lookup{k}_values'], info['key_kind'], info['unknown'])
+            for k, info in enumerate(meta['lookups'])
+        ]
+        self.split_features = arrays['split_features']
+        self.split_borders = arrays['split_borders'][:, None]
+        self.tree_splits = arrays['tree_splits']
+        self.leaf_values = arrays['leaf_values']
+        self.scale = meta['scale']
+        self.bias = meta['bias']
+        n_trees, n_leaves = self.leaf_values.shape
+        # Offset of each tree's leaves in the flattened leaf table
+        self._leaf_offsets = (np.arange(n_trees, dtype=np.int64) * n_leaves)[:, None]
+
+    @classmethod
+    def load(cls, path):
+        """
+        Load an .npz archive into private memory, or a compiled directory as
+        read-only memory maps: every process mapping the same files shares one
+        copy of the arrays in the page cache.
+        """
+        if os.path.isdir(path):
+            arrays = {}
+            for filename in os.listdir(path):
+                if filename.endswith('.npy'):
+                    arrays[filename[:-4]] = np.load(os.path.join(path, filename), mmap_mode='r')
+            return cls(arrays)
+        with np.load(path) as data:
+            return cls({key: data[key] for key in data.files})
+
+    # --- feature encoding ---
+
+    def _lookup(self, k, values):
+        keys, table, key_kind, unknown = self.lookups[k]
+        out = np.full(len(values), unknown, dtype=np.float64)
+        values = np.asarray(values)
+        input_kind = 'str' if values.dtype.kind in 'US' else 'int' if values.dtype.kind in 'iu' else None
+        # The pipeline only matches keys of the same Python type (str vs int),
+        # so e.g. integer inputs never hit a table fitted on string keys.
+        if input_kind != key_kind or not len(keys):
+            return out
+        positions = np.searchsorted(keys, values)
+        positions = np.minimum(positions, len(keys) - 1)
+        found = keys[positions] == values
+        out[found] = table[positions[found]]
+        return out
+
+    def encode_columns(self, columns):
+        """
+        columns: mapping feature name -> sequence already cast per FEATURE_DTYPES.
+        Returns the (n_rows, n_model_inputs) float32 matrix the trees consume.
+        """
+        n_rows = len(columns[EXPECTED_FEATURES[0]])
+        X = np.empty((n_rows, len(self.col_kind)), dtype=np.float64)
+        for j, (kind, source) in enumerate(zip(self.col_kind, self.col_source)):
+            values = columns[EXPECTED_FEATURES[source]]
+            if kind == KIND_LOOKUP:
+                X[:, j] = self._lookup(int(self.col_offset[j]), values)
+            elif kind == KIND_AFFINE:
+                X[:, j] = (np.asarray(values, dtype=np.float64) - self.col_offset[j]) / self.col_scale[j]
+            else:
+                X[:, j] = np.asarray(values, dtype=np.float64)
+        # CatBoost compares float32 feature values against float32 borders
+        return X.astype(np.float32)
+
+    # --- tree evaluation ---
+
+    def predict_encoded(self, X):
+        """
+        Evaluate every tree for every row. Work is done feature-major
+        (splits x rows) so each gather below copies contiguous rows.
+        """
+        flat_leaves = self.leaf_values.reshape(-1)
+        out = np.empty(len(X), dtype=np.float64)
+        for start in range(0, len(X), ROW_BLOCK):
+            block = np.ascontiguousarray(X[start:start + ROW_BLOCK].T)
+            # Each distinct split is evaluated once per row: (splits, rows)
+            bits = (block[self.split_features] > self.split_borders).view(np.uint8)
+            # Leaf index of every tree: bit d comes from the tree's d-th split
+            leaves = bits[self.tree_splits[0]]
+            for d in range(1, len(self.tree_splits)):
+                leaves |= bits[self.tree_splits[d]] << d
+            out[start:start + ROW_BLOCK] = flat_leaves[leaves + self._leaf_offsets].sum(axis=0)
+        return out * self.scale + self.bias
+
+    # --- public prediction API (mirrors pipeline.predict / FastPredictor) ---
+
+    def predict(self, df):
+        """Predict from a DataFrame (or dict of columns) holding EXPECTED_FEATURES."""
+        columns = {}
+        for feature in EXPECTED_FEATURES:
+            values = np.asarray(df[feature])
+            cast = FEATURE_DTYPES[feature]
+            columns[feature] = values.astype(str if cast is str else np.int64 if cast is int else np.float64)
+        return self.predict_encoded(self.encode_columns(columns))
+
+    def predict_many(self, rows):
+        from .fastpath import cast_feature
+        try:
+            columns = {
+                feature: [cast_feature(feature, row[feature]) for row in rows]
+                for feature in EXPECTED_FEATURES
+            }
+        except KeyError:
+            missing = {f for f in EXPECTED_FEATURES if any(f not in row for row in rows)}
+            raise ValueError(f"columns are missing: {missing}")
+        except (TypeError, ValueError) as e:
+            raise ValueError(f"Error during data type conversion: {e}")
+        return self.predict_encoded(self.encode_columns(columns))
+
+    def predict_one(self, input_data):
+        return float(self.predict_many([input_data])[0])
@@ -0,0 +1,175 @@
+# predictions/fastpath.py
+#
+# Pandas-free single-row inference.
+#
+# The served pipeline is preproc (ColumnTransformer) -> regressor. For one row,
+# building a DataFrame, casting columns and running the ColumnTransformer costs
+# far more than the regressor itself. FastPredictor re-implements the fitted
+# preprocessing with plain dict lookups and float arithmetic, writes the result
+# straight into a numpy vector in the transformer's output order and hands that
+# to the final estimator.
+#
+# Only the transformer types below are supported. For any other pipeline
+# compile_fast_path() returns None and callers fall back to the DataFrame path.
+import math
+
+import numpy as np
+
+from .features import EXPECTED_FEATURES, FEATURE_DTYPES
+
+# Row used to check the fast path against the full pipeline before enabling it
+PROBE_ROWS = [
+    {
+        'week_number': 2, 'week_month': 4, 'store_id': '8091', 'sku_id': 3,
+        'total_price': 100.0, 'base_price': 110.0, 'is_featured_sku': 0,
+        'is_display_sku': 1, 'week_year': 2025,
+    },
+    {
+        'week_number': 5, 'week_month': 12, 'store_id': 'unknown', 'sku_id': 216418,
+        'total_price': 250.5, 'base_price': 199.0, 'is_featured_sku': 1,
+        'is_display_sku': 0, 'week_year': 2013,
+    },
+]
+
+
+def cast_feature(feature, value):
+    """Cast one raw value the way prepare_features casts its column."""
+    cast = FEATURE_DTYPES[feature]
+    if cast is str:
+        return str(value)
+    return cast(value)
+
+
+def _is_missing(value):
+    return value is None or (isinstance(value, float) and math.isnan(value))
+
+
+def _scaler_step(transformer, columns):
+    """(feature, offset, scale) per column for a fitted StandardScaler."""
+    steps = []
+    for i, column in enumerate(columns):
+        mean = float(transformer.mean_[i]) if transformer.with_mean else 0.0
+        scale = float(transformer.scale_[i]) if transformer.with_std else 1.0
+        steps.append(('affine', column, (mean, scale)))
+    return steps
+
+
+def _target_encoder_step(transformer, columns):
+    """Lookup tables for a fitted category_encoders TargetEncoder."""
+    if transformer.handle_unknown != 'value' or transformer.handle_missing != 'value':
+        return None
+    steps = []
+    ordinal_mappings = {m['col']: m['mapping'] for m in transformer.ordinal_encoder.mapping}
+    for column in columns:
+        ordinal = ordinal_mappings[column]
+        encoded = transformer.mapping[column]
+        table = {}
+        missing_value = float(encoded.loc[-2]) if -2 in encoded.index else float(transformer._mean)
+        for key, code in ordinal.items():
+            if not _is_missing(key):
+                table[key] = float(encoded.loc[code])
+        unknown_value = float(encoded.loc[-1]) if -1 in encoded.index else float(transformer._mean)
+        steps.append(('lookup', column, (table, unknown_value, missing_value)))
+    return steps
+
+
+def _identity_step(columns):
+    return [('identity', column, None) for column in columns]
+
+
+class FastPredictor:
+    """Row-wise predictor equivalent to pipeline.predict on the same rows as a frame."""
+
+    def __init__(self, steps, estimator):
+        self.steps = steps          # one (kind, feature, params) per output column
+        self.estimator = estimator
+        self.n_outputs = len(steps)
+
+    def transform_one(self, input_data):
+        """Feature dict -> (1, n_outputs) float64 array."""
+        vector = np.empty((1, self.n_outputs), dtype=np.float64)
+        self._fill_row(vector[0], input_data)
+        return vector
+
+    def transform_many(self, rows):
+        """List of feature dicts -> (len(rows), n_outputs) float64 array."""
+        matrix = np.empty((len(rows), self.n_outputs), dtype=np.float64)
+        for row, input_data in zip(matrix, rows):
+            self._fill_row(row, input_data)
+        return matrix
+
+    def _fill_row(self, row, input_data):
+        for i, (kind, feature, params) in enumerate(self.steps):
+            try:
+                value = cast_feature(feature, input_data[feature])
+            except KeyError:
+                missing = {f for f in EXPECTED_FEATURES if f not in input_data}
+                raise ValueError(f"columns are missing: {missing}")
+            except (TypeError, ValueError) as e:
+                raise ValueError(f"Error during data type conversion: {e}")
+            if kind == 'affine':
+                mean, scale = params
+                row[i] = (value - mean) / scale
+            elif kind == 'lookup':
+                table, unknown_value, missing_value = params
+                if _is_missing(value):
+                    row[i] = missing_value
+                else:
+                    row[i] = table.get(value, unknown_value)
+            else:
+                row[i] = value
+
+    def predict_one(self, input_data):
+        return float(self.estimator.predict(self.transform_one(input_data))[0])
+
+    def predict_many(self, rows):
+        return np.asarray(self.estimator.predict(self.transform_many(rows)), dtype=float)
+
+
+def compile_fast_path(model):
+    """
+    Build a FastPredictor for a fitted Pipeline(ColumnTransformer, estimator),
+    or return None if the pipeline contains anything we do not replicate.
+    """
+    import pandas as pd
+    from sklearn.compose import ColumnTransformer
+    from sklearn.pipeline import Pipeline
+    from sklearn.preprocessing import FunctionTransformer, StandardScaler
+
+    if not isinstance(model, Pipeline) or len(model.steps) != 2:
+        return None
+    preproc, estimator = model.steps[0][1], model.steps[1][1]
+    if not isinstance(preproc, ColumnTransformer) or preproc.remainder != 'drop':
+        return None
+
+    steps = []
+    for name, transformer, columns in preproc.transformers_:
+        if transformer == 'drop':
+            continue
+        if not all(isinstance(column, str) and column in FEATURE_DTYPES for column in columns):
+            return None
+        if transformer == 'passthrough':
+            steps.extend(_identity_step(columns))
+        elif isinstance(transformer, StandardScaler):
+            steps.extend(_scaler_step(transformer, columns))
+        elif isinstance(transformer, FunctionTransformer) and transformer.func is None:
+            steps.extend(_identity_step(columns))
+        elif type(transformer).__name__ == 'TargetEncoder' and hasattr(transformer, 'ordinal_encoder'):
+            encoder_steps = _target_encoder_step(transformer, columns)
+            if encoder_steps is None:
+                return None
+            steps.extend(encoder_steps)
+        else:
+            return None
+
+    fast = FastPredictor(steps, estimator)
+
+    # Only enable the fast path if it reproduces the pipeline exactly
+    try:
+        for row in PROBE_ROWS:
+            expected = model.predict(pd.DataFrame([row])[EXPECTED_FEATURES].astype(FEATURE_DTYPES))[0]
+            if not np.isclose(fast.predict_one(row), expected, rtol=1e-9, atol=1e-9):
+                return None
+    except Exception:
+        return None
+    return fast
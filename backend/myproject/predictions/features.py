@@ -0,0 +1,114 @@
+# predictions/features.py
+#
+# Feature derivation shared by the single, batch and horizon prediction paths.
+# The week-of-month rule must match what the model was trained with:
+# weeks start on Monday and are capped to the 1-5 range.
+# pandas is imported inside the frame builders so importing this module is cheap.
+import numpy as np
+
+# Columns (and order) the trained pipeline expects
+EXPECTED_FEATURES = [
+    'week_number', 'week_month', 'store_id', 'sku_id',
+    'total_price', 'base_price', 'is_featured_sku', 'is_display_sku',
+    'week_year',
+]
+
+# dtype each feature is cast to before model.predict
+FEATURE_DTYPES = {
+    'week_number': int,
+    'week_month': int,
+    'store_id': str,
+    'sku_id': int,
+    'total_price': float,
+    'base_price': float,
+    'is_featured_sku': int,
+    'is_display_sku': int,
+    'week_year': int,
+}
+
+
+def week_of_month(input_date):
+    """Week of the month (1-5) for a date, weeks starting on Monday."""
+    first_day_weekday = input_date.replace(day=1).weekday()  # Monday=0, Sunday=6
+    week_number = (input_date.day + first_day_weekday - 1) // 7 + 1
+    return max(1, min(week_number, 5))
+
+
+def derive_date_features(dates):
+    """
+    Vectorized version of week_of_month for an array of dates.
+
+    Returns (week_number, month, year) as int arrays.
+    """
+    days = np.asarray(dates, dtype='datetime64[D]')
+    months = days.astype('datetime64[M]')
+    day_of_month = (days - months.astype('datetime64[D]')).astype(np.int64) + 1
+    # 1970-01-01 was a Thursday (weekday 3 with Monday=0)
+    first_day_weekday = (months.astype('datetime64[D]').astype(np.int64) + 3) % 7
+    week_number = np.clip((day_of_month + first_day_weekday - 1) // 7 + 1, 1, 5)
+    month = months.astype(np.int64) % 12 + 1
+    year = days.astype('datetime64[Y]').astype(np.int64) + 1970
+    return week_number, month, year
+
+
+def build_feature_frame(rows):
+    """
+    Build the model input frame for many validated rows in one go.
+
+    Each row needs 'product' (or 'sku_id'), 'store_id', 'total_price',
+    'base_price', 'is_featured_sku', 'is_display_sku' and 'date'.
+    """
+    import pandas as pd
+    week_number, month, year = derive_date_features([row['date'] for row in rows])
+    return pd.DataFrame({
+        'week_number': week_number,
+        'week_month': month,
+        'store_id': [str(row['store_id']) for row in rows],
+        'sku_id': [row['product'].id if 'product' in row else row['sku_id'] for row in rows],
+        'total_price': [row['total_price'] for row in rows],
+        'base_price': [row['base_price'] for row in rows],
+        'is_featured_sku': [int(row['is_featured_sku']) for row in rows],
+        'is_display_sku': [int(row['is_display_sku']) for row in rows],
+        'week_year': year,
+    }, columns=EXPECTED_FEATURES)
+
+
+def horizon_weeks(start, months):
+    """
+    All (week_year, month, week_number) periods from `start` to the end of the
+    K-th calendar month (the month containing `start` counts as the first).
+
+    Returns (start_dates, week_number, month, year) arrays, one entry per week,
+    where start_dates is the first day of each week inside the horizon.
+    """
+    first = np.datetime64(start, 'D')
+    end = (first.astype('datetime64[M]') + months).astype('datetime64[D]')
+    days = np.arange(first, end, dtype='datetime64[D]')
+    week_number, month, year = derive_date_features(days)
+    # days are sorted, so the first occurrence of each key is the week start
+    keys = (year * 100 + month) * 10 + week_number
+    _, first_index = np.unique(keys, return_index=True)
+    first_index.sort()
+    return days[first_index], week_number[first_index], month[first_index], year[first_index]
+
+
+def build_horizon_frame(sku_id, store_ids, week_number, month, year,
+                        total_price, base_price, is_featured_sku=False, is_display_sku=False):
+    """
+    Cartesian (store x week) feature grid for one product, store-major:
+    row i * n_weeks + j is store i, week j.
+    """
+    import pandas as pd
+    n_stores, n_weeks = len(store_ids), len(week_number)
+    size = n_stores * n_weeks
+    return pd.DataFrame({
+        'week_number': np.tile(week_number, n_stores),
+        'week_month': np.tile(month, n_stores),
+        'store_id': np.repeat(np.asarray(store_ids, dtype=str), n_weeks),
+        'sku_id': np.full(size, sku_id, dtype=np.int64),
+        'total_price': np.full(size, total_price, dtype=float),
+        'base_price': np.full(size, base_price, dtype=float),
+        'is_featured_sku': np.full(size, int(is_featured_sku), dtype=np.int64),
+        'is_display_sku': np.full(size, int(is_display_sku), dtype=np.int64),
+        'week_year': np.tile(year, n_stores),
+    }, columns=EXPECTED_FEATURES)
@@ -1,85 +1,167 @@
 # predictions/inference.py
-import joblib
-import pandas as pd
-import os
+#
+# pandas is imported inside the functions that build frames, so a worker that
+# sends its predictions to the model server (see modelserver.py) never loads it.
+import numpy as np
+from .batching import micro_batcher
+from .cache import feature_key, prediction_cache
+from .features import EXPECTED_FEATURES, FEATURE_DTYPES
+from .instrumentation import log_payload, logger, timed
+from .modelserver import ModelServerUnavailable, model_server_client
+from .registry import registry
+from .shadow import shadow_scorer
 
-def predict_stock(input_data):
-    print("Input data for prediction:", input_data)
+
+def prepare_features(df):
+    """
+    Check that every expected feature is present and cast the columns to the
+    dtypes the model was trained with. Returns a frame in EXPECTED_FEATURES order.
+    """
+    # --- Feature Check (includes week_year now) ---
+    missing_features = [feature for feature in EXPECTED_FEATURES if feature not in df.columns]
+    if missing_features:
+        # Raise specific error listing *all* missing features
+        raise ValueError(f"columns are missing: {set(missing_features)}")
+
+    # Note: category encoding happens INSIDE the model pipeline,
+    # so we only need basic type casting here.
+    try:
+        return df[EXPECTED_FEATURES].astype(FEATURE_DTYPES)
+    except Exception as e:
+        raise ValueError(f"Error during data type conversion: {e}")
+
+
+def check_row(input_data):
+    """Raise ValueError if a feature dict is incomplete or cannot be cast."""
     try:
-        # Load the trained model
-        model_path = os.path.join(os.path.dirname(__file__), 'model.pkl')
-        if not os.path.exists(model_path):
-            raise FileNotFoundError(f"Model file not found at {model_path}")
-        model = joblib.load(model_path)
-        print("Model loaded successfully")
-
-        # Prepare input data
-        df = pd.DataFrame([input_data])
-        print("Input DataFrame:", df)
-
-        # --- ADD 'week_year' TO EXPECTED FEATURES ---
-        expected_features = [
-            'week_number', 'week_month', 'store_id', 'sku_id',
-            'total_price', 'base_price', 'is_featured_sku', 'is_display_sku',
-            'week_year' # Added week_year
-        ]
-        # ------------------------------------------
-
-        # --- Feature Check (includes week_year now) ---
-        missing_features = [feature for feature in expected_features if feature not in df.columns]
-        if missing_features:
-            # Raise specific error listing *all* missing features
-            raise ValueError(f"columns are missing: {set(missing_features)}")
-        # ----------------------------------------------
-
-        # --- Preprocess data to match training (add week_year) ---
-        # Ensure dtypes match expectations before model.predict
-        # Note: category encoding happens INSIDE the model pipeline now usually
-        # So we might only need basic type casting here.
-        # Check how your model.pkl expects these (raw strings or codes?)
-        # Assuming the model handles encoding:
+        feature_key(input_data)
+    except KeyError:
+        missing_features = [feature for feature in EXPECTED_FEATURES if feature not in input_data]
+        raise ValueError(f"columns are missing: {set(missing_features)}")
+    except (TypeError, ValueError) as e:
+        raise ValueError(f"Error during data type conversion: {e}")
+
+
+def predict_frame(df):
+    """
+    Score many rows with a single model.predict call.
+
+    Returns a float numpy array of non-negative predictions, one per row.
+    """
+    with timed('model_load'):
+        model = registry.get().model
+    with timed('preprocess'):
+        df = prepare_features(df)
+    with timed('predict'):
+        prediction = model.predict(df)
+    return np.clip(np.asarray(prediction, dtype=float), 0, None)
+
+
+def serving_version():
+    """Version of the model scoring predict_stock calls, stored with each prediction."""
+    if model_server_client.enabled and not registry.is_loaded:
+        if model_server_client.last_version:
+            return model_server_client.last_version
         try:
-            df['store_id'] = df['store_id'].astype(str) # Ensure string if model expects string
-            df['sku_id'] = df['sku_id'].astype(int)    # Ensure int (product ID)
-            df['is_featured_sku'] = df['is_featured_sku'].astype(int)
-            df['is_display_sku'] = df['is_display_sku'].astype(int)
-            df['week_number'] = df['week_number'].astype(int)
-            df['week_month'] = df['week_month'].astype(int)
-            df['week_year'] = df['week_year'].astype(int) # Added week_year processing
-            df['total_price'] = df['total_price'].astype(float)
-            df['base_price'] = df['base_price'].astype(float)
-
-             # Reorder columns to exactly match the order the model expects, if necessary
-             # This order depends on how your model's ColumnTransformer/Pipeline was set up.
-             # If model.predict still fails, you might need to manually set the order:
-             # df = df[expected_features] # Uncomment this line if needed
-
-        except Exception as e:
-             raise ValueError(f"Error during data type conversion: {e}")
-        # ----------------------------------------------------------
+            return model_server_client.ping()
+        except (ModelServerUnavailable, RuntimeError) as e:
+            logger.warning("Model server did not report its version (%s); using the local model", e)
+    return registry.get().version
+
+
+def predict_stock(input_data):
+    # Hand the row to the out-of-process model server when one is configured;
+    # if it cannot be reached or fails on its side, score it in this process instead.
+    if model_server_client.available:
+        check_row(input_data)
+        try:
+            with timed('model_server'):
+                return model_server_client.predict_one(input_data)
+        except (ModelServerUnavailable, RuntimeError) as e:
+            logger.warning("Model server failed (%s); predicting in-process", e)
+    predicted_stock = predict_stock_local(input_data)
+    if shadow_scorer.enabled:
+        shadow_scorer.submit([input_data], [predicted_stock])
+    return predicted_stock
+
+
+def predict_stock_local(input_data):
+    log_payload("Input data for prediction: %s", input_data)
+    try:
+        # Get the trained model from the process-wide registry
+        # (loaded once per process, reloaded only when model.pkl changes)
+        with timed('model_load'):
+            loaded = registry.get()
+        model = loaded.model
+
+        # Repeated feature vectors are answered from the prediction cache
+        cache_key = None
+        if prediction_cache.enabled:
+            with timed('cache'):
+                try:
+                    cache_key = feature_key(input_data)
+                except (KeyError, TypeError, ValueError):
+                    cache_key = None  # let the normal path report the problem
+                else:
+                    cached = prediction_cache.get(cache_key, loaded.version)
+            if cache_key is not None and cached is not None:
+                return cached
+
+        # Concurrent callers are coalesced into one batched model.predict
+        if micro_batcher.enabled:
+            if cache_key is None:
+                with timed('preprocess'):
+                    check_row(input_data)  # reject bad rows before they join a batch
+            with timed('predict'):
+                predicted_stock = micro_batcher.predict(input_data)
+            if cache_key is not None:
+                prediction_cache.set(cache_key, loaded.version, predicted_stock)
+            return predicted_stock
+
+        # Fast path: feature vector straight into numpy, no DataFrame
+        fast_path = loaded.fast_path
+        if fast_path is not None:
+            if hasattr(fast_path, 'transform_one'):
+                with timed('preprocess'):
+                    vector = fast_path.transform_one(input_data)
+                with timed('predict'):
+                    predicted_stock = float(fast_path.estimator.predict(vector)[0])
+            else:
+                # The compiled evaluator encodes and scores in one step
+                with timed('predict'):
+                    predicted_stock = fast_path.predict_one(input_data)
+            predicted_stock = max(predicted_stock, 0.0)
+            if cache_key is not None:
+                prediction_cache.set(cache_key, loaded.version, predicted_stock)
+            log_payload("Predicted stock: %s", predicted_stock)
+            return predicted_stock
+
+        # Prepare input data, check features and cast dtypes to match training
+        with timed('preprocess'):
+            import pandas as pd
+            df = prepare_features(pd.DataFrame([input_data]))
+        log_payload("Model input frame:\n%s\ndtypes:\n%s", df, df.dtypes)
 
         # Predict
-        print(f"DataFrame columns before prediction: {df.columns.tolist()}")
-        print(f"DataFrame dtypes before prediction:\n{df.dtypes}")
-        prediction = model.predict(df[expected_features]) # Pass dataframe with correct columns
-        print("Raw prediction:", prediction)
+        with timed('predict'):
+            prediction = model.predict(df) # Pass dataframe with correct columns
 
         # --- Process prediction ---
         predicted_stock = float(prediction[0])
         if predicted_stock < 0:
             predicted_stock = 0 # Ensure non-negative prediction
-        print("Final predicted stock:", predicted_stock)
+        log_payload("Raw prediction: %s, final predicted stock: %s", prediction, predicted_stock)
+        if cache_key is not None:
+            prediction_cache.set(cache_key, loaded.version, predicted_stock)
         return predicted_stock
         # --------------------------
 
     except ValueError as e: # Catch specific errors like missing features or type issues
-         print(f"Prediction ValueError: {str(e)}")
+         logger.info("Prediction ValueError: %s", e)
          raise # Re-raise the ValueError to be caught by the view
     except FileNotFoundError as e:
-         print(f"Model loading error: {str(e)}")
+         logger.error("Model loading error: %s", e)
          raise # Re-raise FileNotFoundError
-    except Exception as e:
-        print(f"Unexpected prediction error: {str(e)}")
-        import traceback
-        traceback.print_exc() # Print detailed traceback
-        raise # Re-raise any other exceptions
\ No newline at end of file
+    except Exception:
+        logger.exception("Unexpected prediction error") # Logs the detailed traceback
+        raise # Re-raise any other exceptions
@@ -0,0 +1,175 @@
+# predictions/instrumentation.py
+#
+# Stage timings for the prediction pipeline.
+#
+# Code wraps each stage in `with timed('stage'):`. The duration goes into a
+# process-wide histogram per stage (scraped from /predictions/metrics/ in the
+# Prometheus text format) and, during a request, into that request's timings,
+# which ServerTimingMiddleware returns as a `Server-Timing` header.
+#
+# Input/output payloads are only logged for a sampled fraction of requests
+# (PREDICTIONS_PAYLOAD_LOG_SAMPLE_RATE, 0 by default): formatting dicts and
+# frames on every request costs more than the prediction itself.
+import contextvars
+import logging
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+
+logger = logging.getLogger('predictions')
+payload_logger = logging.getLogger('predictions.payload')
+
+# Upper bounds (seconds) of the stage duration histogram buckets
+STAGE_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+# Timings of the request being handled in this thread: {'stages': {...}, 'log_payload': bool}
+_request = contextvars.ContextVar('prediction_request', default=None)
+
+
+class Histogram:
+    """Cumulative-bucket duration histogram (Prometheus semantics)."""
+
+    def __init__(self, buckets=STAGE_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, seconds):
+        for i, bound in enumerate(self.buckets):
+            if seconds <= bound:
+                break
+        else:
+            i = len(self.buckets)
+        with self._lock:
+            self.counts[i] += 1
+            self.sum += seconds
+            self.count += 1
+
+    def snapshot(self):
+        with self._lock:
+            counts, total, count = list(self.counts), self.sum, self.count
+        cumulative, running = [], 0
+        for bound, n in zip(list(self.buckets) + ['+Inf'], counts):
+            running += n
+            cumulative.append((bound, running))
+        return cumulative, total, count
+
+
+class StageMetrics:
+    """One Histogram per pipeline stage, created on first use."""
+
+    def __init__(self):
+        self._histograms = {}
+        self._lock = threading.Lock()
+
+    def observe(self, stage, seconds):
+        histogram = self._histograms.get(stage)
+        if histogram is None:
+            with self._lock:
+                histogram = self._histograms.setdefault(stage, Histogram())
+        histogram.observe(seconds)
+
+    def stats(self):
+        data = {}
+        for stage, histogram in sorted(self._histograms.items()):
+            _, total, count = histogram.snapshot()
+            data[stage] = {
+                'count': count,
+                'mean_ms': round(total / count * 1000, 3) if count else 0.0,
+            }
+        return data
+
+    def render(self):
+        """Prometheus text exposition of every stage histogram."""
+        name = 'prediction_stage_duration_seconds'
+        lines = [
+            f'# HELP {name} Duration of each stock prediction pipeline stage.',
+            f'# TYPE {name} histogram',
+        ]
+        for stage, histogram in sorted(self._histograms.items()):
+            lines.extend(histogram_lines(name, f'stage="{stage}"', histogram))
+        return '\n'.join(lines) + '\n'
+
+
+def histogram_lines(name, labels, histogram):
+    """Prometheus sample lines of one Histogram; `labels` is 'key="value",...'."""
+    cumulative, total, count = histogram.snapshot()
+    lines = [f'{name}_bucket{{{labels},le="{bound}"}} {n}' for bound, n in cumulative]
+    lines.append(f'{name}_sum{{{labels}}} {total:.9f}')
+    lines.append(f'{name}_count{{{labels}}} {count}')
+    return lines
+
+
+# The process-wide stage histograms.
+stage_metrics = StageMetrics()
+
+
+@contextmanager
+def timed(stage):
+    """Record the duration of the enclosed block under `stage`."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        stage_metrics.observe(stage, elapsed)
+        current = _request.get()
+        if current is not None:
+            stages = current['stages']
+            stages[stage] = stages.get(stage, 0.0) + elapsed
+
+
+def _sample_payload():
+    rate = getattr(settings, 'PREDICTIONS_PAYLOAD_LOG_SAMPLE_RATE', 0.0)
+    return rate > 0 and (rate >= 1 or random.random() < rate)
+
+
+def start_request():
+    """Begin collecting stage timings for the current request; returns a reset token."""
+    return _request.set({'stages': {}, 'log_payload': _sample_payload()})
+
+
+def finish_request(token):
+    """Stop collecting and return the request's {stage: seconds}."""
+    current = _request.get()
+    _request.reset(token)
+    return current['stages'] if current is not None else {}
+
+
+def payload_logging_enabled():
+    current = _request.get()
+    if current is not None:
+        return current['log_payload']
+    return _sample_payload()
+
+
+def log_payload(message, *args):
+    """Log request/response payloads for sampled requests only (formatting is deferred)."""
+    if payload_logging_enabled():
+        payload_logger.info(message, *args)
+
+
+def server_timing_header(stages):
+    return ', '.join(f'{stage};dur={seconds * 1000:.3f}' for stage, seconds in stages.items())
+
+
+class ServerTimingMiddleware:
+    """Collects stage timings per request and returns them as a Server-Timing header."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        token = start_request()
+        try:
+            response = self.get_response(request)
+        finally:
+            stages = finish_request(token)
+        if stages and getattr(settings, 'PREDICTIONS_SERVER_TIMING', True):
+            response['Server-Timing'] = server_timing_header(stages)
+        return response
@@ -0,0 +1,192 @@
+# predictions/jobs.py
+#
+# Execution of ForecastJob rows.
+#
+# The ForecastJob table is the queue: the run_forecast_jobs worker claims the
+# oldest pending job with a conditional UPDATE (so several workers never run
+# the same job), splits its product list into chunks and scores the chunks in
+# a process pool. The parent process upserts each scored chunk (so re-running
+# a job overwrites its earlier predictions) and updates progress, checking for
+# cancellation between chunks.
+#
+# A worker that is killed mid-job leaves the job 'running'. Starting a worker
+# puts jobs that have been running for longer than PREDICTIONS_JOB_STALE_SECONDS
+# back in the queue, so that value must exceed the longest expected run.
+import datetime
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from products.models import Product
+from .features import horizon_weeks, build_horizon_frame
+from .models import ForecastJob, StockPrediction
+from .registry import registry
+
+DEFAULT_CHUNK_PRODUCTS = 50  # products scored per pool task
+DEFAULT_STALE_SECONDS = 6 * 3600  # a job 'running' for longer is assumed orphaned
+
+
+def job_products(spec):
+    """Products a job spec covers, in primary-key order."""
+    products = Product.objects.filter(available=True)
+    if spec.get('product_ids'):
+        products = Product.objects.filter(pk__in=spec['product_ids'])
+    return products.order_by('pk').only('id', 'price')
+
+
+def job_weeks(spec):
+    start = spec.get('start') or timezone.localdate()
+    return horizon_weeks(np.datetime64(start, 'D'), spec['months'])
+
+
+def count_job_rows(spec):
+    _, week_number, _, _ = job_weeks(spec)
+    return job_products(spec).count() * len(spec['store_ids']) * len(week_number)
+
+
+def _init_worker():
+    # Pool processes started with "spawn" need Django configured before the
+    # model registry can read settings; forked processes already have it.
+    import django
+    from django.apps import apps
+    if not apps.ready:
+        django.setup()
+
+
+def score_chunk(products, store_ids, week_number, month, year, is_featured_sku, is_display_sku):
+    """
+    Pool task: score every (product, store, week) combination for a chunk.
+
+    `products` is a list of (product_id, price) pairs. Returns a float array
+    ordered product-major, then store, then week.
+    """
+    import pandas as pd
+    from .inference import predict_frame
+    frame = pd.concat([
+        build_horizon_frame(
+            product_id, store_ids, week_number, month, year,
+            price, price, is_featured_sku, is_display_sku,
+        )
+        for product_id, price in products
+    ], ignore_index=True)
+    return predict_frame(frame)
+
+
+def claim_next_job():
+    """Atomically move the oldest pending job to running and return it (or None)."""
+    while True:
+        job_id = ForecastJob.objects.filter(status='pending').order_by('created_at', 'id') \
+            .values_list('id', flat=True).first()
+        if job_id is None:
+            return None
+        claimed = ForecastJob.objects.filter(pk=job_id, status='pending').update(
+            status='running', started_at=timezone.now()
+        )
+        if claimed:
+            return ForecastJob.objects.get(pk=job_id)
+        # Another worker claimed it first; try the next one.
+
+
+def requeue_stale_jobs(stale_seconds=None):
+    """
+    Put jobs left 'running' for longer than `stale_seconds` by a crashed or
+    killed worker back in the queue (or mark them cancelled if that was
+    requested). Returns the number of jobs requeued.
+    """
+    if stale_seconds is None:
+        stale_seconds = getattr(settings, 'PREDICTIONS_JOB_STALE_SECONDS', DEFAULT_STALE_SECONDS)
+    stale = ForecastJob.objects.filter(
+        status='running', started_at__lt=timezone.now() - datetime.timedelta(seconds=stale_seconds)
+    )
+    stale.filter(cancel_requested=True).update(status='cancelled', finished_at=timezone.now())
+    # Re-running a job overwrites the predictions it had saved, so it can start over
+    return stale.filter(cancel_requested=False).update(status='pending', started_at=None, processed_rows=0)
+
+
+def _cancel_requested(job):
+    return ForecastJob.objects.filter(pk=job.pk, cancel_requested=True).exists()
+
+
+def _finish(job, status, error=''):
+    ForecastJob.objects.filter(pk=job.pk).update(
+        status=status, error=error, finished_at=timezone.now()
+    )
+
+
+def run_job(job, executor, chunk_products=DEFAULT_CHUNK_PRODUCTS, max_in_flight=None):
+    """
+    Execute one claimed job. Scoring runs in `executor`; up to `max_in_flight`
+    chunks are scored ahead while the parent saves finished ones.
+    """
+    spec = job.spec
+    store_ids = spec['store_ids']
+    featured = spec.get('is_featured_sku', False)
+    display = spec.get('is_display_sku', False)
+    _, week_number, month, year = job_weeks(spec)
+    n_weeks = len(week_number)
+    model_version = registry.get().version
+    max_in_flight = max_in_flight or getattr(executor, '_max_workers', 1) * 2
+
+    products = [(product.id, float(product.price)) for product in job_products(spec).iterator()]
+    chunks = [products[i:i + chunk_products] for i in range(0, len(products), chunk_products)]
+
+    ForecastJob.objects.filter(pk=job.pk).update(
+        total_rows=len(products) * len(store_ids) * n_weeks, processed_rows=0
+    )
+
+    try:
+        in_flight = []
+        next_chunk = 0
+        while next_chunk < len(chunks) or in_flight:
+            while next_chunk < len(chunks) and len(in_flight) < max_in_flight:
+                chunk = chunks[next_chunk]
+                in_flight.append((chunk, executor.submit(
+                    score_chunk, chunk, store_ids, week_number, month, year, featured, display
+                )))
+                next_chunk += 1
+
+            chunk, future = in_flight.pop(0)
+            predictions = future.result().reshape(len(chunk), len(store_ids), n_weeks)
+
+            if _cancel_requested(job):
+                for _, pending in in_flight:
+                    pending.cancel()
+                _finish(job, 'cancelled')
+                return 'cancelled'
+
+            with transaction.atomic():
+                StockPrediction.objects.upsert([
+                    StockPrediction(
+                        product_id=product_id,
+                        store_id=store_id,
+                        total_price=price,
+                        base_price=price,
+                        is_featured_sku=featured,
+                        is_display_sku=display,
+                        week_number=int(week_number[w]),
+                        month=int(month[w]),
+                        week_year=int(year[w]),
+                        predicted_stock=float(predictions[p, s, w]),
+                        model_version=model_version,
+                    )
+                    for p, (product_id, price) in enumerate(chunk)
+                    for s, store_id in enumerate(store_ids)
+                    for w in range(n_weeks)
+                ], batch_size=1000)
+                ForecastJob.objects.filter(pk=job.pk).update(
+                    processed_rows=F('processed_rows') + predictions.size
+                )
+    except Exception as e:
+        _finish(job, 'failed', error=str(e))
+        raise
+
+    _finish(job, 'completed')
+    return 'completed'
+
+
+def make_executor(workers):
+    return ProcessPoolExecutor(max_workers=workers, initializer=_init_worker)
@@ -0,0 +1,193 @@
+# predictions/management/commands/backfill_predictions.py
+import csv
+import os
+import time
+
+import numpy as np
+import pandas as pd
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from predictions.features import EXPECTED_FEATURES, derive_date_features
+from predictions.inference import predict_frame
+from predictions.jobs import make_executor
+from predictions.models import StockPrediction
+from predictions.registry import registry
+from products.models import Product
+
+CSV_COLUMNS = ['store_id', 'sku_id', 'total_price', 'base_price', 'is_featured_sku', 'is_display_sku']
+TRUE_VALUES = ('1', 'true', 't', 'yes', 'y')
+
+
+def _flags(series):
+    if series.dtype == bool:
+        return series.to_numpy()
+    return series.astype(str).str.strip().str.lower().isin(TRUE_VALUES).to_numpy()
+
+
+def prepare_chunk(chunk, date_column, date_format=None):
+    """
+    Vectorized features for one CSV chunk.
+
+    Returns (frame, n_invalid): `frame` holds the model features of the rows
+    whose numbers and dates parse; the others are dropped and counted.
+    """
+    dates = pd.to_datetime(chunk[date_column], format=date_format, errors='coerce')
+    sku_id = pd.to_numeric(chunk['sku_id'], errors='coerce')
+    total_price = pd.to_numeric(chunk['total_price'], errors='coerce')
+    base_price = pd.to_numeric(chunk['base_price'], errors='coerce')
+    valid = (dates.notna() & sku_id.notna() & total_price.notna() & base_price.notna()
+             & chunk['store_id'].notna()).to_numpy()
+
+    week_number, month, year = derive_date_features(dates[valid].to_numpy(dtype='datetime64[D]'))
+    frame = pd.DataFrame({
+        'week_number': week_number,
+        'week_month': month,
+        'store_id': chunk['store_id'][valid].astype(str).str.strip().to_numpy(),
+        'sku_id': sku_id[valid].to_numpy(dtype=np.int64),
+        'total_price': total_price[valid].to_numpy(dtype=float),
+        'base_price': base_price[valid].to_numpy(dtype=float),
+        'is_featured_sku': _flags(chunk['is_featured_sku'][valid]).astype(np.int64),
+        'is_display_sku': _flags(chunk['is_display_sku'][valid]).astype(np.int64),
+        'week_year': year,
+    }, columns=EXPECTED_FEATURES)
+    return frame, int((~valid).sum())
+
+
+class Command(BaseCommand):
+    help = (
+        "Score a CSV of (store_id, sku_id, total_price, base_price, is_featured_sku, "
+        "is_display_sku, date) rows in chunks and upsert the predictions."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('csv_path')
+        parser.add_argument('--chunk-size', type=int, default=50000, help="Rows read, scored and saved at a time.")
+        parser.add_argument('--workers', type=int, default=0,
+                            help="Scoring processes (0 scores in this process).")
+        parser.add_argument('--start-row', type=int, default=0,
+                            help="Skip this many data rows (resume an interrupted run).")
+        parser.add_argument('--limit', type=int, help="Stop after this many data rows.")
+        parser.add_argument('--date-column', default='date')
+        parser.add_argument('--date-format', help="strftime format of the date column, e.g. %%d/%%m/%%y.")
+        parser.add_argument('--delimiter', default=',')
+        parser.add_argument('--dry-run', action='store_true', help="Score the rows but save nothing.")
+
+    def handle(self, *args, **options):
+        path = options['csv_path']
+        if not os.path.exists(path):
+            raise CommandError(f"CSV file not found at {path}")
+        if options['chunk_size'] < 1:
+            raise CommandError("--chunk-size must be positive")
+
+        model_version = registry.get().version  # load before the pool forks
+        with open(path, newline='') as f:
+            reader = csv.reader(f, delimiter=options['delimiter'])
+            header = [name.strip() for name in next(reader, [])]
+            missing = set(CSV_COLUMNS + [options['date_column']]) - set(header)
+            if missing:
+                raise CommandError(f"CSV is missing columns: {', '.join(sorted(missing))}")
+            # Skip already processed rows as CSV records, the unit the resume
+            # offset counts in: a quoted field may span several lines. Blank
+            # lines are not records, as for pandas below.
+            skipped = 0
+            while skipped < options['start_row']:
+                record = next(reader, None)
+                if record is None:
+                    break
+                if record:
+                    skipped += 1
+
+            chunks = pd.read_csv(
+                f, names=header, header=None, sep=options['delimiter'], chunksize=options['chunk_size'],
+                usecols=CSV_COLUMNS + [options['date_column']], dtype={'store_id': str},
+                nrows=options['limit'],
+            )
+            if options['workers'] > 0:
+                with make_executor(options['workers']) as executor:
+                    self._run(chunks, options, model_version, executor)
+            else:
+                self._run(chunks, options, model_version, None)
+
+    def _run(self, chunks, options, model_version, executor):
+        totals = {'read': 0, 'invalid': 0, 'unknown_product': 0, 'saved': 0}
+        offset = options['start_row']
+        max_in_flight = options['workers'] * 2 if executor is not None else 1
+        in_flight = []  # (chunk length, frame, future or predictions)
+        started = time.perf_counter()
+
+        def drain(count):
+            nonlocal offset
+            while len(in_flight) > count:
+                length, frame, pending = in_flight.pop(0)
+                predictions = pending.result() if hasattr(pending, 'result') else pending
+                chunk_started = time.perf_counter()
+                saved, unknown = self._save(frame, predictions, model_version, options['dry_run'])
+                offset += length
+                totals['saved'] += saved
+                totals['unknown_product'] += unknown
+                if options['verbosity'] > 1:
+                    self.stdout.write(
+                        f"  rows up to {offset}: saved {saved}, unknown products {unknown} "
+                        f"(save {time.perf_counter() - chunk_started:.2f}s)"
+                    )
+
+        for chunk in chunks:
+            frame, invalid = prepare_chunk(chunk, options['date_column'], options['date_format'])
+            totals['read'] += len(chunk)
+            totals['invalid'] += invalid
+            if not len(frame):
+                in_flight.append((len(chunk), frame, None))
+            elif executor is not None:
+                in_flight.append((len(chunk), frame, executor.submit(predict_frame, frame)))
+            else:
+                in_flight.append((len(chunk), frame, predict_frame(frame)))
+            drain(max_in_flight - 1)
+            elapsed = time.perf_counter() - started
+            self.stdout.write(
+                f"{totals['read']} rows read, {totals['saved']} saved, "
+                f"{totals['read'] / elapsed:.0f} rows/s; resume with --start-row {offset}"
+            )
+        drain(0)
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Backfill finished: {totals['read']} rows in {elapsed:.1f}s "
+            f"({totals['read'] / elapsed if elapsed else 0:.0f} rows/s); "
+            f"{totals['saved']} saved, {totals['invalid']} invalid, "
+            f"{totals['unknown_product']} with unknown products"
+            + (" (dry run)" if options['dry_run'] else "")
+        ))
+
+    def _save(self, frame, predictions, model_version, dry_run):
+        """Upsert one scored chunk in a single transaction; returns (saved, unknown products)."""
+        if not len(frame):
+            return 0, 0
+        known = set(Product.objects.filter(pk__in=np.unique(frame['sku_id']).tolist())
+                    .values_list('id', flat=True))
+        keep = frame['sku_id'].isin(known).to_numpy()
+        if dry_run:
+            return int(keep.sum()), int((~keep).sum())
+        columns = {name: frame[name].to_numpy()[keep] for name in frame.columns}
+        objs = [
+            StockPrediction(
+                product_id=int(sku_id),
+                store_id=store_id,
+                total_price=float(total_price),
+                base_price=float(base_price),
+                is_featured_sku=bool(featured),
+                is_display_sku=bool(display),
+                week_number=int(week_number),
+                month=int(month),
+                week_year=int(year),
+                predicted_stock=float(predicted),
+                model_version=model_version,
+            )
+            for sku_id, store_id, total_price, base_price, featured, display, week_number, month, year, predicted
+            in zip(columns['sku_id'], columns['store_id'], columns['total_price'], columns['base_price'],
+                   columns['is_featured_sku'], columns['is_display_sku'], columns['week_number'],
+                   columns['week_month'], columns['week_year'], np.asarray(predictions)[keep])
+        ]
+        with transaction.atomic():
+            StockPrediction.objects.upsert(objs, batch_size=1000)
+        return len(objs), int((~keep).sum())
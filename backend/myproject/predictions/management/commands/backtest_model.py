@@ -0,0 +1,71 @@
+# predictions/management/commands/backtest_model.py
+import csv
+import datetime
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from predictions.backtest import (
+    BacktestTotals, METRIC_FIELDS, DEFAULT_CHUNK_PRODUCTS, backtest_weeks, run_backtest,
+)
+from predictions.registry import registry
+from predictions.replenishment import replenishment_store_ids
+
+
+def _date(value):
+    try:
+        return datetime.date.fromisoformat(value)
+    except ValueError:
+        raise CommandError(f"Invalid date {value!r}, expected YYYY-MM-DD")
+
+
+class Command(BaseCommand):
+    help = "Score past weeks and compare them with OrderItem sales; writes error metrics per SKU and store."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--start', help="First day (YYYY-MM-DD), defaults to 12 weeks ago.")
+        parser.add_argument('--end', help="Day after the last one (YYYY-MM-DD), defaults to today.")
+        parser.add_argument('--store-ids', nargs='+', help="Defaults to PREDICTIONS_STORE_IDS "
+                                                           "or every store with past predictions.")
+        parser.add_argument('--product-ids', nargs='+', type=int)
+        parser.add_argument('--chunk-products', type=int, default=DEFAULT_CHUNK_PRODUCTS,
+                            help="Products queried and scored at a time.")
+        parser.add_argument('--output', help="CSV file for the per-SKU/store metrics (default: stdout).")
+
+    def handle(self, *args, **options):
+        end = _date(options['end']) if options['end'] else timezone.localdate()
+        start = _date(options['start']) if options['start'] else end - datetime.timedelta(weeks=12)
+        if start >= end:
+            raise CommandError("--start must be before --end")
+        if options['chunk_products'] < 1:
+            raise CommandError("--chunk-products must be positive")
+        store_ids = options['store_ids'] or replenishment_store_ids()
+        if not store_ids:
+            raise CommandError("No stores to score: pass --store-ids or set PREDICTIONS_STORE_IDS")
+
+        model_version = registry.get().version
+        started = time.perf_counter()
+        totals = BacktestTotals()
+        output = open(options['output'], 'w', newline='') if options['output'] else sys.stdout
+        try:
+            writer = csv.DictWriter(output, fieldnames=METRIC_FIELDS)
+            writer.writeheader()
+            for rows in run_backtest(store_ids, start, end, options['chunk_products'], options['product_ids']):
+                writer.writerows(rows)
+                totals.add(rows)
+        finally:
+            if output is not sys.stdout:
+                output.close()
+
+        summary = totals.summary()
+        wape = f"{summary['wape']:.3f}" if summary['wape'] is not None else "n/a"
+        self.stderr.write(self.style.SUCCESS(
+            f"Backtest of model {model_version} from {start} to {end} "
+            f"({len(backtest_weeks(start, end)[1])} weeks, {len(store_ids)} stores): "
+            f"{summary['series']} series, MAE {summary['mae']:.3f}, RMSE {summary['rmse']:.3f}, "
+            f"bias {summary['bias']:.3f}, WAPE {wape}, "
+            f"actual {summary['actual']:.0f} vs predicted {summary['predicted']:.0f} units "
+            f"in {time.perf_counter() - started:.1f}s"
+        ))
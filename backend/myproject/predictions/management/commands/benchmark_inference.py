@@ -0,0 +1,73 @@
+# predictions/management/commands/benchmark_inference.py
+import os
+import time
+
+import numpy as np
+import pandas as pd
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from predictions.compiled import CompiledModel, DEFAULT_COMPILED_MODEL_PATH
+from predictions.fastpath import PROBE_ROWS
+from predictions.inference import prepare_features
+from predictions.registry import registry
+
+
+class Command(BaseCommand):
+    help = "Measure per-call latency of single-row inference paths (DataFrame, fast path, compiled)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=2000)
+        parser.add_argument('--warmup', type=int, default=50)
+
+    def handle(self, *args, **options):
+        loaded = registry.get()
+        row = PROBE_ROWS[0]
+
+        def dataframe_path():
+            df = prepare_features(pd.DataFrame([row]))
+            return float(loaded.model.predict(df)[0])
+
+        paths = [('dataframe', dataframe_path)]
+        if loaded.fast_path is not None and not isinstance(loaded.fast_path, CompiledModel):
+            paths.append(('fast_path', lambda: loaded.fast_path.predict_one(row)))
+        else:
+            self.stdout.write(self.style.WARNING("Fast path unavailable for this model."))
+
+        compiled_path = getattr(settings, 'PREDICTIONS_COMPILED_MODEL_PATH', DEFAULT_COMPILED_MODEL_PATH)
+        if os.path.exists(compiled_path):
+            compiled = CompiledModel.load(compiled_path)
+            paths.append(('compiled', lambda: compiled.predict_one(row)))
+        else:
+            self.stdout.write(self.style.WARNING("No compiled model; run `manage.py compile_model` to time it."))
+
+        results = {}
+        for name, func in paths:
+            results[name] = self._time(func, options['iterations'], options['warmup'])
+
+        values = {name: func() for name, func in paths}
+        if len(set(np.round(list(values.values()), 9))) > 1:
+            raise CommandError(f"Paths disagree: {values}")
+
+        self.stdout.write(f"model {loaded.version}, {options['iterations']} calls per path")
+        self.stdout.write(f"{'path':<12}{'mean us':>12}{'p50 us':>12}{'p99 us':>12}")
+        for name, timings in results.items():
+            self.stdout.write(
+                f"{name:<12}{timings.mean():>12.1f}{np.percentile(timings, 50):>12.1f}"
+                f"{np.percentile(timings, 99):>12.1f}"
+            )
+        for name in results:
+            if name != 'dataframe':
+                speedup = results['dataframe'].mean() / results[name].mean()
+                self.stdout.write(self.style.SUCCESS(f"{name} speedup: {speedup:.1f}x"))
+
+    @staticmethod
+    def _time(func, iterations, warmup):
+        for _ in range(warmup):
+            func()
+        timings = np.empty(iterations)
+        for i in range(iterations):
+            started = time.perf_counter()
+            func()
+            timings[i] = (time.perf_counter() - started) * 1e6
+        return timings
@@ -0,0 +1,64 @@
+# predictions/management/commands/compile_model.py
+import os
+import time
+
+import joblib
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from predictions.compiled import (
+    CompiledModel, compile_pipeline, parity_sample, save_compiled, DEFAULT_COMPILED_MODEL_PATH,
+)
+from predictions.registry import DEFAULT_MODEL_PATH, file_digest
+
+
+class Command(BaseCommand):
+    help = "Compile model.pkl into the array-backed evaluator artifact and check parity."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--model', default=getattr(settings, 'PREDICTIONS_MODEL_PATH', DEFAULT_MODEL_PATH))
+        parser.add_argument('--output', default=getattr(
+            settings, 'PREDICTIONS_COMPILED_MODEL_PATH', DEFAULT_COMPILED_MODEL_PATH))
+        parser.add_argument('--check-rows', type=int, default=5000,
+                            help="Random rows compared against model.predict before writing.")
+        parser.add_argument('--tolerance', type=float, default=1e-6)
+
+    def handle(self, *args, **options):
+        model_path = options['model']
+        if not os.path.exists(model_path):
+            raise CommandError(f"Model file not found at {model_path}")
+
+        model = joblib.load(model_path)
+        version = file_digest(model_path)[:12]
+        try:
+            arrays = compile_pipeline(model, source_version=version)
+        except ValueError as e:
+            raise CommandError(f"Cannot compile this model: {e}")
+        compiled = CompiledModel(arrays)
+
+        # --- Parity check against the original pipeline ---
+        frame = parity_sample(model, options['check_rows'])
+        started = time.perf_counter()
+        expected = model.predict(frame)
+        pipeline_seconds = time.perf_counter() - started
+        started = time.perf_counter()
+        actual = compiled.predict(frame)
+        compiled_seconds = time.perf_counter() - started
+        max_error = float(np.abs(expected - actual).max()) if len(frame) else 0.0
+        if max_error > options['tolerance']:
+            raise CommandError(f"Parity check failed: max abs difference {max_error}")
+
+        written = save_compiled(arrays, options['output'])
+        if os.path.isdir(written):
+            size = sum(os.path.getsize(os.path.join(written, name)) for name in os.listdir(written))
+        else:
+            size = os.path.getsize(written)
+        self.stdout.write(
+            f"Parity on {len(frame)} rows: max abs difference {max_error:.3g} "
+            f"(pipeline {pipeline_seconds * 1000:.1f} ms, compiled {compiled_seconds * 1000:.1f} ms)"
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"Compiled model {version} written to {options['output']} "
+            f"({size / 1024:.0f} KB)"
+        ))
@@ -0,0 +1,131 @@
+# predictions/management/commands/measure_model_memory.py
+#
+# Starts N worker processes that load the model the same way a serving worker
+# would, keeps them all alive together and reports per-worker memory from
+# /proc/<pid>/smaps_rollup. RSS counts shared pages in every process that maps
+# them; PSS splits them between the processes and USS (private pages) is what
+# each extra worker really costs.
+import multiprocessing
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from predictions.compiled import DEFAULT_COMPILED_MODEL_PATH
+from predictions.fastpath import PROBE_ROWS
+from predictions.registry import DEFAULT_MODEL_PATH
+
+MODES = ('pickle', 'compiled', 'compiled-mmap')
+
+
+def read_memory(pid='self'):
+    """RSS, PSS and USS of a process in KB, from smaps_rollup."""
+    fields = {}
+    with open(f'/proc/{pid}/smaps_rollup') as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) >= 2 and parts[1].isdigit():
+                fields[parts[0].rstrip(':')] = int(parts[1])
+    return {
+        'rss': fields.get('Rss', 0),
+        'pss': fields.get('Pss', 0),
+        'uss': fields.get('Private_Clean', 0) + fields.get('Private_Dirty', 0),
+    }
+
+
+def _load(mode, model_path, compiled_path):
+    if mode == 'pickle':
+        import joblib
+        import pandas as pd
+        from predictions.inference import prepare_features
+        model = joblib.load(model_path)
+        model.predict(prepare_features(pd.DataFrame(PROBE_ROWS)))
+        return model
+    from predictions.compiled import CompiledModel
+    model = CompiledModel.load(compiled_path)
+    model.predict_many(PROBE_ROWS)
+    return model
+
+
+def _worker(mode, model_path, compiled_path, loaded_barrier, measured_barrier, results):
+    import django
+    from django.apps import apps
+    if not apps.ready:
+        django.setup()
+    before = read_memory()
+    model = _load(mode, model_path, compiled_path)  # noqa: F841 (kept alive until measured)
+    # Measure only once every worker holds its model, so shared pages are split.
+    loaded_barrier.wait()
+    results.put((os.getpid(), before, read_memory()))
+    measured_barrier.wait()
+
+
+class Command(BaseCommand):
+    help = "Report per-worker RSS/PSS/USS for the pickled and compiled model artifacts."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4)
+        parser.add_argument('--mode', choices=MODES + ('all',), default='all')
+        parser.add_argument('--model', default=getattr(settings, 'PREDICTIONS_MODEL_PATH', DEFAULT_MODEL_PATH))
+        parser.add_argument('--compiled', help="Compiled artifact; the mmap mode needs the directory layout.")
+        parser.add_argument('--start-method', choices=('spawn', 'fork', 'forkserver'), default='spawn',
+                            help="spawn matches workers that each import the app themselves.")
+
+    def handle(self, *args, **options):
+        if not os.path.exists('/proc/self/smaps_rollup'):
+            raise CommandError("Needs Linux /proc/<pid>/smaps_rollup")
+        default_compiled = getattr(settings, 'PREDICTIONS_COMPILED_MODEL_PATH', DEFAULT_COMPILED_MODEL_PATH)
+        modes = MODES if options['mode'] == 'all' else (options['mode'],)
+        context = multiprocessing.get_context(options['start_method'])
+        workers = options['workers']
+
+        for mode in modes:
+            compiled_path = options['compiled'] or default_compiled
+            if mode == 'compiled' and os.path.isdir(compiled_path):
+                # Same arrays, read into private memory instead of mapped.
+                compiled_path = self._as_npz(compiled_path)
+            if mode != 'pickle' and not os.path.exists(compiled_path):
+                self.stdout.write(self.style.WARNING(
+                    f"{mode}: no compiled artifact at {compiled_path}; run manage.py compile_model"))
+                continue
+            if mode == 'compiled-mmap' and not os.path.isdir(compiled_path):
+                self.stdout.write(self.style.WARNING(
+                    f"{mode}: {compiled_path} is not the directory layout; skipping"))
+                continue
+
+            loaded_barrier = context.Barrier(workers)
+            measured_barrier = context.Barrier(workers + 1)
+            results = context.Queue()
+            processes = [
+                context.Process(target=_worker, args=(
+                    mode, options['model'], compiled_path, loaded_barrier, measured_barrier, results))
+                for _ in range(workers)
+            ]
+            for process in processes:
+                process.start()
+            rows = [results.get(timeout=300) for _ in processes]
+            measured_barrier.wait()
+            for process in processes:
+                process.join()
+
+            self.stdout.write(f"{mode} ({workers} workers, {options['start_method']}):")
+            for pid, before, after in sorted(rows):
+                self.stdout.write(
+                    f"  pid {pid}: rss {after['rss'] / 1024:.1f} MB "
+                    f"(+{(after['rss'] - before['rss']) / 1024:.1f}), "
+                    f"pss {after['pss'] / 1024:.1f} MB, uss {after['uss'] / 1024:.1f} MB"
+                )
+            total_pss = sum(after['pss'] for _, _, after in rows)
+            mean_uss = sum(after['uss'] for _, _, after in rows) / len(rows)
+            self.stdout.write(
+                f"  total pss {total_pss / 1024:.1f} MB, mean uss {mean_uss / 1024:.1f} MB per worker")
+
+    def _as_npz(self, directory):
+        import numpy as np
+        import tempfile
+        path = os.path.join(tempfile.gettempdir(), 'measure_model_memory.npz')
+        if not os.path.exists(path) or os.path.getmtime(path) < os.path.getmtime(directory):
+            arrays = {name[:-4]: np.load(os.path.join(directory, name))
+                      for name in os.listdir(directory) if name.endswith('.npy')}
+            np.savez(path, **arrays)
+        return path
@@ -0,0 +1,42 @@
+# predictions/management/commands/promote_model.py
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from predictions.registry import DEFAULT_MODEL_PATH, ModelRegistry, file_digest, install_model
+
+
+class Command(BaseCommand):
+    help = (
+        "Make a shadow model (a PREDICTIONS_SHADOW_MODELS name or a model file) the served model. "
+        "Compare the versions first in the 'shadow' section of /api/predictions/predictions/model/."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('model', help="Shadow model name or path to a model file.")
+        parser.add_argument('--no-backup', action='store_true',
+                            help="Do not keep the replaced model as <model path>.prev.")
+
+    def handle(self, *args, **options):
+        shadow_models = getattr(settings, 'PREDICTIONS_SHADOW_MODELS', None) or {}
+        source = shadow_models.get(options['model'], options['model'])
+        if not os.path.exists(source):
+            raise CommandError(f"No shadow model named {options['model']!r} and no model file at {source}")
+        target = getattr(settings, 'PREDICTIONS_MODEL_PATH', DEFAULT_MODEL_PATH)
+
+        # Load the candidate the way the workers will, so a broken file is never installed
+        candidate = ModelRegistry(path=source, check_interval=0).get()
+        current = file_digest(target)[:12] if os.path.exists(target) else None
+        if candidate.version == current:
+            self.stdout.write(f"Model {candidate.version} is already served")
+            return
+
+        backup = install_model(source, target, keep_previous=not options['no_backup'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Promoted {candidate.version} (was {current}) to {target}; workers reload it within "
+            f"PREDICTIONS_MODEL_CHECK_INTERVAL seconds"
+            + (f". Previous model kept at {backup}" if backup else "")
+        ))
+        if getattr(settings, 'PREDICTIONS_USE_COMPILED_MODEL', False):
+            self.stdout.write("Run `manage.py compile_model` to rebuild the compiled evaluator for it.")
@@ -0,0 +1,56 @@
+# predictions/management/commands/prune_predictions.py
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from predictions import retention
+
+
+class Command(BaseCommand):
+    help = (
+        "Apply the prediction retention policy: compact old predictions to the latest one per "
+        "product/store/week and move rows past the archive horizon to the archive table. "
+        "Safe to run from cron; work is done in short per-chunk transactions."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full-days', type=int, default=getattr(
+            settings, 'PREDICTIONS_RETENTION_FULL_DAYS', retention.DEFAULT_FULL_DAYS),
+            help="Keep every prediction newer than this many days.")
+        parser.add_argument('--archive-days', type=int, default=getattr(
+            settings, 'PREDICTIONS_RETENTION_ARCHIVE_DAYS', retention.DEFAULT_ARCHIVE_DAYS),
+            help="Archive predictions older than this many days.")
+        parser.add_argument('--chunk-size', type=int, default=getattr(
+            settings, 'PREDICTIONS_RETENTION_CHUNK_SIZE', retention.DEFAULT_CHUNK_SIZE),
+            help="Rows per transaction.")
+        parser.add_argument('--pause', type=float, default=0.0,
+                            help="Seconds to sleep between chunks, to leave room for other writers.")
+        parser.add_argument('--dry-run', action='store_true', help="Count the rows without changing them (the archive count then includes rows compaction would remove).")
+
+    def handle(self, *args, **options):
+        if options['archive_days'] < options['full_days']:
+            raise CommandError("--archive-days must not be smaller than --full-days")
+        if options['chunk_size'] < 1:
+            raise CommandError("--chunk-size must be positive")
+        chunk = dict(chunk_size=options['chunk_size'], dry_run=options['dry_run'], pause=options['pause'])
+        verb = "would be" if options['dry_run'] else "were"
+
+        # Compact first, so only the surviving rows are archived.
+        phases = [
+            ('compacted', retention.compact(retention.cutoff(options['full_days']), **chunk)),
+            ('archived', retention.archive(retention.cutoff(options['archive_days']), **chunk)),
+        ]
+        started = time.perf_counter()
+        for name, chunks in phases:
+            phase_started = time.perf_counter()
+            rows = 0
+            for count in chunks:
+                rows += count
+                if options['verbosity'] > 1:
+                    self.stdout.write(f"  {name} {count} rows (total {rows})")
+            elapsed = time.perf_counter() - phase_started
+            self.stdout.write(f"{rows} rows {verb} {name} in {elapsed:.2f}s")
+        self.stdout.write(self.style.SUCCESS(
+            f"Retention finished in {time.perf_counter() - started:.2f}s"
+        ))
@@ -0,0 +1,92 @@
+# predictions/management/commands/retrain_model.py
+import datetime
+import os
+import subprocess
+import tempfile
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from predictions.registry import DEFAULT_MODEL_PATH, install_model
+from predictions.training import (
+    DEFAULT_ARTIFACT_DIR, DEFAULT_CHUNK_SIZE, extract_training_data, store_artifact, train_in_subprocess,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Retrain the served model on recent StockPrediction/OrderItem history (warm start), validate it "
+        "on the most recent weeks and install it as a new versioned artifact; workers reload it live."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=365, help="Weeks of history used, in days.")
+        parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE,
+                            help="StockPrediction rows read per query.")
+        parser.add_argument('--iterations', type=int, default=200,
+                            help="Trees added on top of the current model (or n_estimators increment).")
+        parser.add_argument('--holdout-fraction', type=float, default=0.2,
+                            help="Share of the most recent weeks kept out of training for validation.")
+        parser.add_argument('--max-regression', type=float, default=0.0,
+                            help="Accept a holdout MAE up to this fraction worse than the current model's.")
+        parser.add_argument('--full', action='store_true', help="Refit from scratch instead of warm starting.")
+        parser.add_argument('--no-install', action='store_true',
+                            help="Only write the artifact (e.g. to try it in PREDICTIONS_SHADOW_MODELS).")
+        parser.add_argument('--timeout', type=int, default=3600, help="Seconds allowed for training.")
+
+    def handle(self, *args, **options):
+        if not 0 < options['holdout_fraction'] < 1:
+            raise CommandError("--holdout-fraction must be between 0 and 1")
+        model_path = getattr(settings, 'PREDICTIONS_MODEL_PATH', DEFAULT_MODEL_PATH)
+        if not os.path.exists(model_path):
+            raise CommandError(f"Model file not found at {model_path}")
+        artifact_dir = getattr(settings, 'PREDICTIONS_MODEL_ARTIFACT_DIR', DEFAULT_ARTIFACT_DIR)
+        os.makedirs(artifact_dir, exist_ok=True)
+        since = timezone.localdate() - datetime.timedelta(days=options['days'])
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            # --- Extract ---
+            started = time.perf_counter()
+            data_path = os.path.join(tmp_dir, 'training.csv')
+            rows = extract_training_data(data_path, since, options['chunk_size'])
+            self.stdout.write(f"Extracted {rows} training rows since {since} in {time.perf_counter() - started:.1f}s")
+            if not rows:
+                raise CommandError("No training rows: no predictions for weeks that are over")
+
+            # --- Train in a child process ---
+            # Written inside the artifact directory so the final rename is atomic
+            output_path = os.path.join(artifact_dir, f'.training-{os.getpid()}.pkl')
+            try:
+                summary = train_in_subprocess(
+                    model_path, data_path, output_path, options['iterations'],
+                    options['holdout_fraction'], options['full'], options['timeout'],
+                )
+            except (CommandError, subprocess.TimeoutExpired) as e:
+                if os.path.exists(output_path):
+                    os.remove(output_path)
+                raise CommandError(str(e))
+
+        self.stdout.write(
+            f"Trained with {summary['method']} on {summary['train_rows']} rows in {summary['seconds']:.1f}s; "
+            f"holdout ({summary['holdout_rows']} rows) MAE {summary['base_mae']:.4f} -> {summary['new_mae']:.4f}"
+        )
+
+        # --- Validate ---
+        if summary['new_mae'] > summary['base_mae'] * (1 + options['max_regression']):
+            os.remove(output_path)
+            raise CommandError("New model is worse on the holdout weeks; keeping the current model")
+
+        version, artifact = store_artifact(output_path, artifact_dir)
+        if options['no_install']:
+            self.stdout.write(self.style.SUCCESS(f"Model {version} written to {artifact} (not installed)"))
+            return
+
+        # --- Hot swap: workers pick the new file up at their next change check ---
+        install_model(artifact, model_path)
+        self.stdout.write(self.style.SUCCESS(
+            f"Model {version} written to {artifact} and installed at {model_path}"
+        ))
+        if getattr(settings, 'PREDICTIONS_USE_COMPILED_MODEL', False):
+            self.stdout.write("Run `manage.py compile_model` to rebuild the compiled evaluator for it.")
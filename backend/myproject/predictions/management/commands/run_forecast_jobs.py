@@ -0,0 +1,67 @@
+# predictions/management/commands/run_forecast_jobs.py
+import os
+import time
+import traceback
+from concurrent.futures.process import BrokenProcessPool
+
+from django.core.management.base import BaseCommand
+
+from predictions.jobs import claim_next_job, make_executor, requeue_stale_jobs, run_job, DEFAULT_CHUNK_PRODUCTS
+from predictions.registry import registry
+
+
+class Command(BaseCommand):
+    help = "Process queued forecast jobs, scoring chunks in a process pool."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                            help="Scoring processes in the pool.")
+        parser.add_argument('--chunk-products', type=int, default=DEFAULT_CHUNK_PRODUCTS,
+                            help="Products per scoring task.")
+        parser.add_argument('--poll-interval', type=float, default=2.0,
+                            help="Seconds to sleep when the queue is empty.")
+        parser.add_argument('--once', action='store_true',
+                            help="Exit once the queue is empty instead of polling.")
+        parser.add_argument('--stale-seconds', type=int,
+                            help="Requeue jobs running for longer than this at start-up "
+                                 "(default PREDICTIONS_JOB_STALE_SECONDS).")
+
+    def handle(self, *args, **options):
+        requeued = requeue_stale_jobs(options['stale_seconds'])
+        if requeued:
+            self.stdout.write(f"Requeued {requeued} stale running job(s)")
+
+        # Load the model before the pool forks so workers share the loaded copy.
+        registry.get()
+        executor = make_executor(options['workers'])
+        try:
+            while True:
+                job = claim_next_job()
+                if job is None:
+                    if options['once']:
+                        return
+                    time.sleep(options['poll_interval'])
+                    continue
+
+                self.stdout.write(f"Running forecast job #{job.id}")
+                started = time.perf_counter()
+                try:
+                    status = run_job(job, executor, chunk_products=options['chunk_products'])
+                except BrokenProcessPool as e:
+                    # A pool process died (killed, out of memory); the pool is unusable from now on
+                    self.stderr.write(self.style.ERROR(f"Forecast job #{job.id} failed: {e}; restarting the pool"))
+                    executor.shutdown(wait=False, cancel_futures=True)
+                    executor = make_executor(options['workers'])
+                    continue
+                except Exception as e:
+                    traceback.print_exc()
+                    self.stderr.write(self.style.ERROR(f"Forecast job #{job.id} failed: {e}"))
+                    continue
+                job.refresh_from_db()
+                elapsed = time.perf_counter() - started
+                self.stdout.write(self.style.SUCCESS(
+                    f"Forecast job #{job.id} {status}: {job.processed_rows}/{job.total_rows} rows "
+                    f"in {elapsed:.1f}s"
+                ))
+        finally:
+            executor.shutdown()
@@ -0,0 +1,69 @@
+# predictions/management/commands/run_model_server.py
+import os
+import signal
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from predictions.batching import micro_batcher
+from predictions.modelserver import ModelServer, model_server_client
+from predictions.warmup import warm_up
+
+
+class Command(BaseCommand):
+    help = "Serve stock predictions over a Unix socket for PREDICTIONS_MODEL_SERVER_SOCKET clients."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--socket', default=getattr(settings, 'PREDICTIONS_MODEL_SERVER_SOCKET', None))
+        parser.add_argument('--processes', type=int, default=os.cpu_count() or 1,
+                            help="Server processes accepting on the socket (forked after the model loads).")
+        parser.add_argument('--batch-window-ms', type=float, default=2.0,
+                            help="Micro-batching window for concurrent single rows (0 disables).")
+
+    def handle(self, *args, **options):
+        socket_path = options['socket']
+        if not socket_path:
+            raise CommandError("Pass --socket or set PREDICTIONS_MODEL_SERVER_SOCKET")
+        micro_batcher._window_ms = options['batch_window_ms']
+        # This process is the server: predict in-process even if settings name the socket.
+        model_server_client._socket_path = ''
+
+        # Bind and load the model in the parent so the forked processes share
+        # the listening socket and the model's memory pages.
+        server = ModelServer(socket_path)
+        state = warm_up()
+        if state['status'] != 'ready':
+            server.server_close()
+            raise CommandError(f"Could not load the model: {state['error']}")
+
+        children = []
+        for _ in range(max(options['processes'], 1) - 1):
+            pid = os.fork()
+            if pid == 0:
+                signal.signal(signal.SIGTERM, signal.SIG_DFL)
+                try:
+                    server.serve_forever()
+                finally:
+                    os._exit(0)
+            children.append(pid)
+
+        def stop(signum, frame):
+            raise KeyboardInterrupt
+
+        signal.signal(signal.SIGTERM, stop)
+        self.stdout.write(self.style.SUCCESS(
+            f"Model server listening on {socket_path} with {len(children) + 1} process(es), "
+            f"model {state['model_version']}"
+        ))
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            for pid in children:
+                try:
+                    os.kill(pid, signal.SIGTERM)
+                    os.waitpid(pid, 0)
+                except OSError:
+                    pass
+            server.server_close()
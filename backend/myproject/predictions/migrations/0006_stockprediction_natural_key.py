@@ -0,0 +1,67 @@
+# Generated by Django 5.2 on 2026-10-18 10:17
+
+from django.db import migrations, models
+from django.db.models import Max
+
+
+def backfill_and_dedupe(apps, schema_editor):
+    StockPrediction = apps.get_model('predictions', 'StockPrediction')
+    # Older rows never stored the year they predicted; the year they were
+    # created in is the closest thing we have.
+    for year in StockPrediction.objects.dates('created_at', 'year'):
+        StockPrediction.objects.filter(week_year__isnull=True, created_at__year=year.year) \
+            .update(week_year=year.year)
+    # Keep only the newest row per natural key so the unique constraint applies.
+    # `keep` stays a subquery: one DELETE ... WHERE id NOT IN (SELECT MAX(id)
+    # ... GROUP BY key), however many rows the table has.
+    key = ('product', 'store_id', 'week_year', 'month', 'week_number', 'model_version')
+    keep = StockPrediction.objects.values(*key).annotate(keep_id=Max('id')).values('keep_id')
+    StockPrediction.objects.exclude(id__in=keep).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('predictions', '0005_forecastjob'),
+        ('products', '0005_product_stock'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='stockprediction',
+            name='model_version',
+            field=models.CharField(blank=True, default='', max_length=64),
+        ),
+        migrations.AddField(
+            model_name='stockprediction',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddField(
+            model_name='stockprediction',
+            name='week_year',
+            field=models.IntegerField(null=True),
+        ),
+        migrations.RunPython(backfill_and_dedupe, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='stockprediction',
+            name='week_year',
+            field=models.IntegerField(),
+        ),
+        migrations.AddIndex(
+            model_name='stockprediction',
+            index=models.Index(fields=['created_at', 'id'], name='stockpred_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='stockprediction',
+            index=models.Index(fields=['product', 'created_at'], name='stockpred_product_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='stockprediction',
+            index=models.Index(fields=['store_id', 'created_at'], name='stockpred_store_created_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='stockprediction',
+            constraint=models.UniqueConstraint(fields=('product', 'store_id', 'week_year', 'month', 'week_number', 'model_version'), name='stockprediction_natural_key'),
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.2 on 2026-10-18 10:19
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('predictions', '0006_stockprediction_natural_key'),
+        ('products', '0005_product_stock'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockPredictionArchive',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('original_id', models.BigIntegerField(unique=True)),
+                ('week_number', models.IntegerField()),
+                ('month', models.IntegerField()),
+                ('week_year', models.IntegerField()),
+                ('store_id', models.CharField(max_length=50)),
+                ('total_price', models.FloatField()),
+                ('base_price', models.FloatField()),
+                ('is_featured_sku', models.BooleanField(default=False)),
+                ('is_display_sku', models.BooleanField(default=False)),
+                ('predicted_stock', models.FloatField()),
+                ('model_version', models.CharField(blank=True, default='', max_length=64)),
+                ('created_at', models.DateTimeField()),
+                ('updated_at', models.DateTimeField()),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+                ('product', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, to='products.product')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['product', 'week_year', 'month'], name='stockpred_arch_product_idx'), models.Index(fields=['created_at'], name='stockpred_arch_created_idx')],
+            },
+        ),
+    ]
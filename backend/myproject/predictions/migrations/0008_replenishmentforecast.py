@@ -0,0 +1,34 @@
+# Generated by Django 5.2 on 2026-10-18 10:22
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('predictions', '0007_stockpredictionarchive'),
+        ('products', '0005_product_stock'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReplenishmentForecast',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('store_id', models.CharField(max_length=50)),
+                ('period_start', models.DateField()),
+                ('period_end', models.DateField()),
+                ('predicted_demand', models.FloatField()),
+                ('stock_on_hand', models.IntegerField()),
+                ('shortfall', models.FloatField()),
+                ('model_version', models.CharField(blank=True, default='', max_length=64)),
+                ('computed_at', models.DateTimeField()),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='replenishment_forecasts', to='products.product')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['-shortfall'], name='replenishment_shortfall_idx'), models.Index(fields=['store_id', '-shortfall'], name='replenishment_store_idx')],
+                'constraints': [models.UniqueConstraint(fields=('product', 'store_id', 'period_start'), name='replenishment_product_store_period')],
+            },
+        ),
+    ]
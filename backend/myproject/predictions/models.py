@@ -1,17 +1,182 @@
 from django.db import models
+from django.utils import timezone
 from products.models import Product
 
+# One prediction per product, store, week and model version; saving the same
+# key again updates the existing row instead of adding another one.
+NATURAL_KEY = ('product', 'store_id', 'week_year', 'month', 'week_number', 'model_version')
+# Columns refreshed when an existing prediction is upserted
+UPSERT_FIELDS = ('total_price', 'base_price', 'is_featured_sku', 'is_display_sku',
+                 'predicted_stock', 'updated_at')
+# Primary keys per query when reading upserted rows back (below SQLite's variable limit)
+READ_BACK_CHUNK = 500
+
+
+class StockPredictionQuerySet(models.QuerySet):
+    def upsert(self, objs, batch_size=None):
+        """
+        Insert predictions, updating rows whose natural key already exists.
+
+        Rows repeating a key within `objs` are collapsed (the last one wins).
+        Afterwards every object carries the primary key and the stored
+        created_at/updated_at of its row (an updated row keeps its original
+        created_at). Returns the number of rows inserted rather than updated.
+        """
+        unique = {}
+        for obj in objs:
+            unique[obj.natural_key()] = obj
+        started = timezone.now()
+        self.bulk_create(
+            list(unique.values()), batch_size=batch_size,
+            update_conflicts=True, unique_fields=NATURAL_KEY, update_fields=UPSERT_FIELDS,
+        )
+
+        # The timestamps bulk_create leaves on the objects are the in-memory
+        # ones; read the stored values back
+        pks = [obj.pk for obj in unique.values()]
+        stored = {}
+        for start in range(0, len(pks), READ_BACK_CHUNK):
+            rows = self.model.objects.filter(pk__in=pks[start:start + READ_BACK_CHUNK]) \
+                .values_list('pk', 'created_at', 'updated_at')
+            stored.update((pk, (created_at, updated_at)) for pk, created_at, updated_at in rows)
+        for obj in objs:
+            obj.pk = unique[obj.natural_key()].pk
+            obj.created_at, obj.updated_at = stored[obj.pk]
+        # Rows that existed before this call were created before it started
+        return sum(1 for created_at, _ in stored.values() if created_at >= started)
+
+
 class StockPrediction(models.Model):
     product = models.ForeignKey(Product, on_delete=models.CASCADE)
     week_number = models.IntegerField(default=1)  # Week of the month (1-5)
     month = models.IntegerField(default=1)       # Month number (1-12)
+    week_year = models.IntegerField()             # Year the week belongs to
     store_id = models.CharField(max_length=50)
     total_price = models.FloatField()
     base_price = models.FloatField()
     is_featured_sku = models.BooleanField(default=False)
     is_display_sku = models.BooleanField(default=False)
     predicted_stock = models.FloatField(default=0)
+    model_version = models.CharField(max_length=64, blank=True, default='')  # registry version that scored it
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = StockPredictionQuerySet.as_manager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=NATURAL_KEY, name='stockprediction_natural_key'),
+        ]
+        indexes = [
+            # Newest-first listing, with id as the tie-breaker
+            models.Index(fields=['created_at', 'id'], name='stockpred_created_idx'),
+            # Listing filtered by product or store
+            models.Index(fields=['product', 'created_at'], name='stockpred_product_created_idx'),
+            models.Index(fields=['store_id', 'created_at'], name='stockpred_store_created_idx'),
+        ]
+
+    def natural_key(self):
+        return (self.product_id, self.store_id, self.week_year, self.month, self.week_number,
+                self.model_version)
+
+    def __str__(self):
+        return f"Prediction for {self.product.name} at store {self.store_id} for month {self.month}, week {self.week_number}"
+
+class ForecastJob(models.Model):
+    """
+    A large forecast run (products x stores x weeks) executed off the request
+    thread by the run_forecast_jobs worker. The table doubles as the job queue.
+    """
+    STATUS_CHOICES = (
+        ('pending', 'Pending'),
+        ('running', 'Running'),
+        ('completed', 'Completed'),
+        ('failed', 'Failed'),
+        ('cancelled', 'Cancelled'),
+    )
+
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending', db_index=True)
+    spec = models.JSONField()  # validated ForecastJobSpecSerializer data
+    total_rows = models.PositiveIntegerField(default=0)
+    processed_rows = models.PositiveIntegerField(default=0)
+    cancel_requested = models.BooleanField(default=False)
+    error = models.TextField(blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"Forecast job #{self.id} ({self.status})"
+
+    @property
+    def progress(self):
+        if not self.total_rows:
+            return 0.0
+        return round(self.processed_rows / self.total_rows, 4)
+
+    @property
+    def is_finished(self):
+        return self.status in ('completed', 'failed', 'cancelled')
+
+
+class StockPredictionArchive(models.Model):
+    """
+    StockPrediction rows moved out of the live table by `manage.py
+    prune_predictions` once they are older than the archive horizon.
+    """
+    original_id = models.BigIntegerField(unique=True)  # id the row had in StockPrediction
+    # No FK constraint: archived history outlives deleted products
+    product = models.ForeignKey(Product, on_delete=models.DO_NOTHING, db_constraint=False)
+    week_number = models.IntegerField()
+    month = models.IntegerField()
+    week_year = models.IntegerField()
+    store_id = models.CharField(max_length=50)
+    total_price = models.FloatField()
+    base_price = models.FloatField()
+    is_featured_sku = models.BooleanField(default=False)
+    is_display_sku = models.BooleanField(default=False)
+    predicted_stock = models.FloatField()
+    model_version = models.CharField(max_length=64, blank=True, default='')
+    created_at = models.DateTimeField()
+    updated_at = models.DateTimeField()
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['product', 'week_year', 'month'], name='stockpred_arch_product_idx'),
+            models.Index(fields=['created_at'], name='stockpred_arch_created_idx'),
+        ]
+
+    def __str__(self):
+        return f"Archived prediction #{self.original_id} for product {self.product_id} at store {self.store_id}"
+
+
+class ReplenishmentForecast(models.Model):
+    """
+    Nightly snapshot of forecast demand against stock on hand, written by
+    `manage.py compute_replenishment` and read by the dashboard. One row per
+    product and store for the upcoming period.
+    """
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='replenishment_forecasts')
+    store_id = models.CharField(max_length=50)
+    period_start = models.DateField()
+    period_end = models.DateField()  # inclusive
+    predicted_demand = models.FloatField()  # predicted units over the period
+    stock_on_hand = models.IntegerField()   # Product.stock when the forecast was computed
+    shortfall = models.FloatField()         # predicted_demand - stock_on_hand (> 0: reorder)
+    model_version = models.CharField(max_length=64, blank=True, default='')
+    computed_at = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['product', 'store_id', 'period_start'],
+                                    name='replenishment_product_store_period'),
+        ]
+        indexes = [
+            # Largest shortfalls first, overall or for one store
+            models.Index(fields=['-shortfall'], name='replenishment_shortfall_idx'),
+            models.Index(fields=['store_id', '-shortfall'], name='replenishment_store_idx'),
+        ]
 
     def __str__(self):
-        return f"Prediction for {self.product.name} at store {self.store_id} for month {self.month}, week {self.week_number}"
\ No newline at end of file
+        return f"Replenishment for {self.product_id} at store {self.store_id} from {self.period_start}"
@@ -0,0 +1,320 @@
+# predictions/modelserver.py
+#
+# Out-of-process model server and its thin client.
+#
+# `manage.py run_model_server` loads the model once, listens on a Unix socket
+# and serves predictions from one or more forked processes (micro-batching
+# concurrent single rows the same way predict_stock does in-process). With
+# PREDICTIONS_MODEL_SERVER_SOCKET set, predict_stock sends each row there
+# instead of loading the model, so Django workers never import pandas,
+# scikit-learn or catboost. If the server cannot be reached, predict_stock
+# falls back to in-process inference and the client waits
+# PREDICTIONS_MODEL_SERVER_RETRY_INTERVAL seconds before trying it again.
+#
+# Wire format: every message is a 4-byte big-endian length followed by the body.
+#   request:  op (B), row count (H), rows
+#             row = ROW struct + store_id length (H) + store_id utf-8
+#   response: status (B), then
+#             STATUS_OK: count (H), count float64 predictions, version length (B), version
+#             otherwise: utf-8 error message
+# This module only imports the standard library and the feature definitions,
+# so the client side stays light.
+import os
+import socket
+import socketserver
+import struct
+import threading
+import time
+
+from django.conf import settings
+
+from .cache import feature_key
+from .features import EXPECTED_FEATURES
+
+DEFAULT_TIMEOUT = 2.0  # seconds for connect and for each request
+DEFAULT_RETRY_INTERVAL = 5.0  # seconds to skip the server after a failure
+
+OP_PREDICT = 1
+OP_PING = 2
+
+STATUS_OK = 0
+STATUS_INPUT_ERROR = 1  # raised as ValueError on the client, like in-process validation
+STATUS_SERVER_ERROR = 2
+
+MAX_ROWS = 65535  # rows per request (the count is a uint16)
+
+_LENGTH = struct.Struct('!I')
+_HEADER = struct.Struct('!BH')
+_STATUS = struct.Struct('!B')
+_COUNT = struct.Struct('!H')
+_STR_LENGTH = struct.Struct('!H')
+# week_number, week_month, sku_id, total_price, base_price,
+# is_featured_sku, is_display_sku, week_year (store_id follows separately)
+_ROW = struct.Struct('!iiqddbbi')
+_STORE_INDEX = EXPECTED_FEATURES.index('store_id')
+_NUMERIC_INDEXES = [i for i, feature in enumerate(EXPECTED_FEATURES) if feature != 'store_id']
+
+
+class ModelServerUnavailable(Exception):
+    """The model server could not be reached or did not answer in time."""
+
+
+# --- Protocol -----------------------------------------------------------------
+
+def encode_rows(op, keys):
+    """Request body for `op` and a list of feature_key() tuples."""
+    parts = [_HEADER.pack(op, len(keys))]
+    for key in keys:
+        store_id = key[_STORE_INDEX].encode('utf-8')
+        try:
+            parts.append(_ROW.pack(*[key[i] for i in _NUMERIC_INDEXES]))
+        except struct.error as e:
+            raise ValueError(f"Error during data type conversion: {e}")
+        parts.append(_STR_LENGTH.pack(len(store_id)))
+        parts.append(store_id)
+    return b''.join(parts)
+
+
+def decode_rows(body):
+    """Inverse of encode_rows: (op, list of feature dicts)."""
+    op, count = _HEADER.unpack_from(body)
+    offset = _HEADER.size
+    rows = []
+    for _ in range(count):
+        values = list(_ROW.unpack_from(body, offset))
+        offset += _ROW.size
+        (length,) = _STR_LENGTH.unpack_from(body, offset)
+        offset += _STR_LENGTH.size
+        values.insert(_STORE_INDEX, body[offset:offset + length].decode('utf-8'))
+        offset += length
+        rows.append(dict(zip(EXPECTED_FEATURES, values)))
+    return op, rows
+
+
+def encode_result(predictions, version):
+    version = (version or '').encode('ascii')
+    return b''.join([
+        _STATUS.pack(STATUS_OK), _COUNT.pack(len(predictions)),
+        struct.pack(f'!{len(predictions)}d', *predictions),
+        struct.pack('!B', len(version)), version,
+    ])
+
+
+def encode_error(status, message):
+    return _STATUS.pack(status) + str(message).encode('utf-8')
+
+
+def decode_result(body):
+    """(predictions, version) from a response body; raises on error statuses."""
+    (status,) = _STATUS.unpack_from(body)
+    if status == STATUS_INPUT_ERROR:
+        raise ValueError(body[1:].decode('utf-8'))
+    if status != STATUS_OK:
+        raise RuntimeError(f"Model server error: {body[1:].decode('utf-8')}")
+    (count,) = _COUNT.unpack_from(body, 1)
+    offset = 1 + _COUNT.size
+    predictions = struct.unpack_from(f'!{count}d', body, offset)
+    offset += 8 * count
+    length = body[offset]
+    return list(predictions), body[offset + 1:offset + 1 + length].decode('ascii')
+
+
+def send_frame(sock, body):
+    sock.sendall(_LENGTH.pack(len(body)) + body)
+
+
+def _recv_exactly(sock, size):
+    chunks = []
+    while size:
+        chunk = sock.recv(size)
+        if not chunk:
+            return None
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b''.join(chunks)
+
+
+def recv_frame(sock):
+    """Next message body, or None when the peer closed the connection."""
+    header = _recv_exactly(sock, _LENGTH.size)
+    if header is None:
+        return None
+    (length,) = _LENGTH.unpack(header)
+    return _recv_exactly(sock, length)
+
+
+# --- Client -------------------------------------------------------------------
+
+class ModelServerClient:
+    """Thin client keeping one persistent connection per thread."""
+
+    def __init__(self, socket_path=None, timeout=None, retry_interval=None):
+        self._socket_path = socket_path
+        self._timeout = timeout
+        self._retry_interval = retry_interval
+        self._local = threading.local()
+        self._down_until = 0.0
+        self._stats_lock = threading.Lock()
+        self.requests = 0
+        self.failures = 0
+        self.last_error = None
+        self.last_version = None  # model version reported by the last response
+
+    @property
+    def socket_path(self):
+        if self._socket_path is not None:
+            return self._socket_path
+        return getattr(settings, 'PREDICTIONS_MODEL_SERVER_SOCKET', None)
+
+    @property
+    def timeout(self):
+        if self._timeout is not None:
+            return self._timeout
+        return getattr(settings, 'PREDICTIONS_MODEL_SERVER_TIMEOUT', DEFAULT_TIMEOUT)
+
+    @property
+    def retry_interval(self):
+        if self._retry_interval is not None:
+            return self._retry_interval
+        return getattr(settings, 'PREDICTIONS_MODEL_SERVER_RETRY_INTERVAL', DEFAULT_RETRY_INTERVAL)
+
+    @property
+    def enabled(self):
+        return bool(self.socket_path)
+
+    @property
+    def available(self):
+        """False while backing off after a failed request."""
+        return self.enabled and time.monotonic() >= self._down_until
+
+    def predict_one(self, input_data):
+        return self.predict_many([input_data])[0]
+
+    def predict_many(self, rows):
+        """Score feature dicts on the server; rows must already be valid (see check_row)."""
+        if len(rows) > MAX_ROWS:
+            raise ValueError(f"At most {MAX_ROWS} rows per model server request")
+        predictions, _ = self._call(encode_rows(OP_PREDICT, [feature_key(row) for row in rows]))
+        return predictions
+
+    def ping(self):
+        """Model version served by the server."""
+        _, version = self._call(encode_rows(OP_PING, []))
+        return version
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        # Sockets are not shared across fork(); reconnect in a new process.
+        if conn is not None and self._local.pid == os.getpid():
+            return conn
+        conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        conn.settimeout(self.timeout)
+        conn.connect(self.socket_path)
+        self._local.conn = conn
+        self._local.pid = os.getpid()
+        return conn
+
+    def _close(self):
+        conn = getattr(self._local, 'conn', None)
+        self._local.conn = None
+        if conn is not None:
+            try:
+                conn.close()
+            except OSError:
+                pass
+
+    def _call(self, body):
+        with self._stats_lock:
+            self.requests += 1
+        try:
+            conn = self._connection()
+            send_frame(conn, body)
+            response = recv_frame(conn)
+            if response is None:
+                raise ConnectionResetError("model server closed the connection")
+        except OSError as e:  # includes socket.timeout, refused and missing socket
+            self._close()
+            self._down_until = time.monotonic() + self.retry_interval
+            with self._stats_lock:
+                self.failures += 1
+                self.last_error = str(e)
+            raise ModelServerUnavailable(str(e)) from e
+        predictions, version = decode_result(response)
+        self.last_version = version
+        return predictions, version
+
+    def stats(self):
+        with self._stats_lock:
+            return {
+                'enabled': self.enabled,
+                'socket': self.socket_path,
+                'available': self.available,
+                'requests': self.requests,
+                'failures': self.failures,
+                'last_error': self.last_error,
+                'model_version': self.last_version,
+            }
+
+
+# The process-wide client used by predict_stock when a socket is configured.
+model_server_client = ModelServerClient()
+
+
+# --- Server -------------------------------------------------------------------
+
+def handle_request(body):
+    """Response body for one request body."""
+    # Imported here: only the server process loads the model stack.
+    from .batching import score_rows
+    from .inference import check_row, predict_stock_local
+    from .registry import registry
+    from .shadow import shadow_scorer
+
+    try:
+        op, rows = decode_rows(body)
+        if op == OP_PING:
+            return encode_result([], registry.get().version)
+        if op != OP_PREDICT:
+            return encode_error(STATUS_SERVER_ERROR, f"unknown op {op}")
+        for row in rows:
+            check_row(row)
+        if len(rows) == 1:
+            # Single rows go through the cache and micro-batcher
+            predictions = [predict_stock_local(rows[0])]
+        else:
+            predictions = [float(p) for p in score_rows(rows)]
+        if shadow_scorer.enabled:
+            shadow_scorer.submit(rows, predictions)
+        return encode_result(predictions, registry.get().version)
+    except ValueError as e:
+        return encode_error(STATUS_INPUT_ERROR, e)
+    except Exception as e:
+        return encode_error(STATUS_SERVER_ERROR, e)
+
+
+class _RequestHandler(socketserver.BaseRequestHandler):
+    def handle(self):
+        while True:
+            try:
+                body = recv_frame(self.request)
+            except OSError:
+                return
+            if body is None:
+                return
+            send_frame(self.request, handle_request(body))
+
+
+class ModelServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """One thread per client connection; clients keep connections open."""
+    daemon_threads = True
+
+    def __init__(self, socket_path):
+        if os.path.exists(socket_path):
+            os.remove(socket_path)  # stale socket from a previous run
+        super().__init__(socket_path, _RequestHandler)
+        self.socket_path = socket_path
+
+    def server_close(self):
+        super().server_close()
+        if os.path.exists(self.socket_path):
+            os.remove(self.socket_path)
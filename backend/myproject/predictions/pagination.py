@@ -0,0 +1,14 @@
+# predictions/pagination.py
+from rest_framework.pagination import CursorPagination
+
+
+class StockPredictionCursorPagination(CursorPagination):
+    """
+    Keyset pagination, newest first. Pages are located by the (created_at, id)
+    of the last row seen, so neither a COUNT(*) nor an OFFSET scan is needed
+    however far back a client pages.
+    """
+    ordering = ('-created_at', '-id')
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 1000
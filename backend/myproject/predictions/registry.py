@@ -0,0 +1,227 @@
+# predictions/registry.py
+#
+# Process-wide model registry.
+#
+# The trained pipeline is loaded once per process and served from memory.
+# The file on disk is re-checked at most every PREDICTIONS_MODEL_CHECK_INTERVAL
+# seconds; when its mtime/size changes (and its content hash differs) a new
+# model is loaded and swapped in with a single attribute assignment, so the
+# request path never takes a lock unless a reload is actually needed.
+import hashlib
+import os
+import shutil
+import threading
+import time
+
+from django.conf import settings
+from django.utils import timezone
+
+from .compiled import CompiledModel, DEFAULT_COMPILED_MODEL_PATH, read_meta
+from .fastpath import compile_fast_path
+from .instrumentation import logger
+
+DEFAULT_MODEL_PATH = os.path.join(os.path.dirname(__file__), 'model.pkl')
+DEFAULT_CHECK_INTERVAL = 5.0  # seconds between mtime checks
+
+
+def file_digest(path):
+    """Return the sha256 hex digest of a file, read in 1 MB blocks."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def rss_kb():
+    """Resident set size of this process in KB (None where /proc is unavailable)."""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') // 1024
+    except (OSError, ValueError):
+        return None
+
+
+class LoadedModel:
+    """Immutable snapshot of a model artifact loaded from disk."""
+
+    __slots__ = ('model', 'path', 'version', 'mtime_ns', 'size', 'loaded_at', 'load_seconds',
+                 'fast_path', 'memory_kb')
+
+    def __init__(self, model, path, version, mtime_ns, size, loaded_at, load_seconds,
+                 fast_path=None, memory_kb=None):
+        self.model = model
+        self.path = path
+        self.version = version
+        self.mtime_ns = mtime_ns
+        self.size = size
+        self.loaded_at = loaded_at
+        self.load_seconds = load_seconds
+        self.fast_path = fast_path  # FastPredictor, or None when unsupported/disabled
+        self.memory_kb = memory_kb  # RSS growth while loading (approximate when other threads allocate)
+
+    def info(self):
+        return {
+            'path': self.path,
+            'version': self.version,
+            'size_bytes': self.size,
+            'loaded_at': self.loaded_at,
+            'load_seconds': round(self.load_seconds, 6),
+            'model_class': type(self.model).__name__,
+            'fast_path': self.fast_path is not None,
+            'memory_kb': self.memory_kb,
+        }
+
+
+class ModelRegistry:
+    """Loads the model once per process and hot-reloads it when the file changes."""
+
+    def __init__(self, path=None, check_interval=None):
+        self._path = path
+        self._check_interval = check_interval
+        self._current = None
+        self._next_check = 0.0
+        self._lock = threading.Lock()
+        self.reload_count = 0
+
+    @property
+    def path(self):
+        return self._path or getattr(settings, 'PREDICTIONS_MODEL_PATH', DEFAULT_MODEL_PATH)
+
+    @property
+    def check_interval(self):
+        if self._check_interval is not None:
+            return self._check_interval
+        return getattr(settings, 'PREDICTIONS_MODEL_CHECK_INTERVAL', DEFAULT_CHECK_INTERVAL)
+
+    @property
+    def is_loaded(self):
+        return self._current is not None
+
+    def get(self):
+        """
+        Return the current LoadedModel, loading or reloading it if needed.
+
+        Readers only ever see a fully loaded snapshot: a reload builds the new
+        LoadedModel first and then replaces the reference.
+        """
+        current = self._current
+        if current is None:
+            return self._load()
+
+        now = time.monotonic()
+        if now < self._next_check:
+            return current
+        self._next_check = now + self.check_interval
+
+        try:
+            stat = os.stat(current.path)
+        except FileNotFoundError:
+            # The file was removed or is mid-replace; keep serving what we have.
+            return current
+        if stat.st_mtime_ns == current.mtime_ns and stat.st_size == current.size:
+            return current
+        return self._load()
+
+    def reload(self):
+        """Force a reload check regardless of the check interval."""
+        self._next_check = 0.0
+        return self._load()
+
+    def _load(self):
+        with self._lock:
+            current = self._current
+            path = self.path
+            if not os.path.exists(path):
+                if current is not None:
+                    return current
+                raise FileNotFoundError(f"Model file not found at {path}")
+
+            stat = os.stat(path)
+            # Another thread may have reloaded while we waited for the lock.
+            if current is not None and current.path == path and \
+                    stat.st_mtime_ns == current.mtime_ns and stat.st_size == current.size:
+                return current
+
+            version = file_digest(path)[:12]
+            if current is not None and current.version == version:
+                # Touched but unchanged: keep the model, remember the new stat.
+                self._current = LoadedModel(
+                    current.model, path, version, stat.st_mtime_ns, stat.st_size,
+                    current.loaded_at, current.load_seconds, current.fast_path, current.memory_kb,
+                )
+                return self._current
+
+            rss_before = rss_kb()
+            started = time.perf_counter()
+            model, fast_path = self._load_artifact(path, version)
+            load_seconds = time.perf_counter() - started
+            rss_after = rss_kb()
+            memory_kb = rss_after - rss_before if rss_before is not None and rss_after is not None else None
+
+            self._current = LoadedModel(
+                model, path, version, stat.st_mtime_ns, stat.st_size,
+                timezone.now(), load_seconds, fast_path, memory_kb,
+            )
+            self._next_check = time.monotonic() + self.check_interval
+            self.reload_count += 1
+            logger.info("Model %s loaded from %s in %.3fs", version, path, load_seconds)
+            return self._current
+
+    def _load_artifact(self, path, version):
+        """
+        Return (model, fast_path) for the model file at `path`.
+
+        With PREDICTIONS_USE_COMPILED_MODEL the array-backed evaluator built by
+        `manage.py compile_model` is served instead of the pickle, as long as it
+        was compiled from this exact model version.
+        """
+        if getattr(settings, 'PREDICTIONS_USE_COMPILED_MODEL', False):
+            compiled_path = getattr(settings, 'PREDICTIONS_COMPILED_MODEL_PATH', DEFAULT_COMPILED_MODEL_PATH)
+            if os.path.exists(compiled_path) and read_meta(compiled_path).get('source_version') == version:
+                compiled = CompiledModel.load(compiled_path)
+                return compiled, compiled
+            logger.warning("Compiled model at %s is missing or stale; loading %s instead", compiled_path, path)
+
+        import joblib
+        model = joblib.load(path)
+        fast_path = None
+        if getattr(settings, 'PREDICTIONS_FAST_PATH', True):
+            fast_path = compile_fast_path(model)
+        return model, fast_path
+
+    def info(self):
+        current = self._current
+        data = current.info() if current is not None else {'path': self.path, 'version': None}
+        data['loaded'] = current is not None
+        data['reload_count'] = self.reload_count
+        return data
+
+
+def install_model(source, target=None, keep_previous=True):
+    """
+    Atomically replace the served model file with a copy of `source`.
+
+    The copy is written next to the target and renamed over it, so a worker
+    never reads a half-written file; every registry picks it up at its next
+    change check. The replaced file is kept as `<target>.prev` unless
+    `keep_previous` is False. Returns the path of that backup (or None).
+    """
+    target = target or getattr(settings, 'PREDICTIONS_MODEL_PATH', DEFAULT_MODEL_PATH)
+    tmp_path = f'{target}.tmp-{os.getpid()}'
+    shutil.copyfile(source, tmp_path)
+    backup = None
+    if keep_previous and os.path.exists(target):
+        backup = f'{target}.prev'
+        shutil.copyfile(target, backup)
+    os.replace(tmp_path, target)
+    return backup
+
+
+# The process-wide registry used by predict_stock and the views.
+registry = ModelRegistry()
+
+
+def get_model():
+    """Shortcut returning the currently served model object."""
+    return registry.get().model
@@ -0,0 +1,114 @@
+# predictions/replenishment.py
+#
+# Nightly replenishment snapshot.
+#
+# compute_replenishment() scores the next PREDICTIONS_REPLENISHMENT_WEEKS
+# weeks of demand for every available product in every store, sums it per
+# product and store, and stores the shortfall against Product.stock in the
+# ReplenishmentForecast table. The dashboard then reads that table with one
+# indexed query instead of running the model per request.
+import datetime
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from products.models import Product
+from .features import horizon_weeks
+from .jobs import score_chunk
+from .models import ReplenishmentForecast, StockPrediction
+from .registry import registry
+
+DEFAULT_WEEKS = 4
+DEFAULT_CHUNK_PRODUCTS = 200
+
+
+def replenishment_store_ids():
+    """Stores to forecast: PREDICTIONS_STORE_IDS, or every store seen in past predictions."""
+    store_ids = getattr(settings, 'PREDICTIONS_STORE_IDS', None)
+    if store_ids:
+        return [str(store_id) for store_id in store_ids]
+    return list(StockPrediction.objects.order_by('store_id').values_list('store_id', flat=True).distinct())
+
+
+def replenishment_period(start, weeks):
+    """
+    The first `weeks` model weeks from `start`.
+
+    Returns (period_end, week_number, month, year); period_end is the day
+    before the following week starts.
+    """
+    starts, week_number, month, year = horizon_weeks(start, weeks // 4 + 2)
+    end = starts[weeks] - np.timedelta64(1, 'D')
+    return end.astype(datetime.date), week_number[:weeks], month[:weeks], year[:weeks]
+
+
+def compute_replenishment(store_ids, start=None, weeks=DEFAULT_WEEKS, chunk_products=DEFAULT_CHUNK_PRODUCTS,
+                          executor=None, max_in_flight=None):
+    """
+    Rebuild the replenishment table for the period starting at `start`
+    (default: tomorrow). Each product chunk is scored with one predict call
+    and upserted in its own transaction; rows from earlier runs are removed
+    at the end. With an executor, up to `max_in_flight` chunks are scored
+    ahead of the one being saved. Returns the number of rows written.
+    """
+    start = start or timezone.localdate() + datetime.timedelta(days=1)
+    period_end, week_number, month, year = replenishment_period(start, weeks)
+    computed_at = timezone.now()
+    model_version = registry.get().version
+
+    products = list(Product.objects.filter(available=True).order_by('pk').values_list('id', 'price', 'stock'))
+    chunks = [products[i:i + chunk_products] for i in range(0, len(products), chunk_products)]
+
+    def score_args(chunk):
+        return ([(product_id, float(price)) for product_id, price, _ in chunk],
+                store_ids, week_number, month, year, False, False)
+
+    def scored():
+        """Yield (chunk, predictions) in order, never holding more than max_in_flight results."""
+        if executor is None:
+            for chunk in chunks:
+                yield chunk, score_chunk(*score_args(chunk))
+            return
+        limit = max_in_flight or getattr(executor, '_max_workers', 1) * 2
+        in_flight = []
+        for chunk in chunks:
+            in_flight.append((chunk, executor.submit(score_chunk, *score_args(chunk))))
+            if len(in_flight) >= limit:
+                done, future = in_flight.pop(0)
+                yield done, future.result()
+        for done, future in in_flight:
+            yield done, future.result()
+
+    written = 0
+    for chunk, predictions in scored():
+        # (products x stores x weeks) -> demand over the period per product and store
+        demand = predictions.reshape(len(chunk), len(store_ids), len(week_number)).sum(axis=2)
+        rows = [
+            ReplenishmentForecast(
+                product_id=product_id,
+                store_id=store_id,
+                period_start=start,
+                period_end=period_end,
+                predicted_demand=float(demand[p, s]),
+                stock_on_hand=stock,
+                shortfall=float(demand[p, s]) - stock,
+                model_version=model_version,
+                computed_at=computed_at,
+            )
+            for p, (product_id, _, stock) in enumerate(chunk)
+            for s, store_id in enumerate(store_ids)
+        ]
+        with transaction.atomic():
+            ReplenishmentForecast.objects.bulk_create(
+                rows, batch_size=1000, update_conflicts=True,
+                unique_fields=['product', 'store_id', 'period_start'],
+                update_fields=['period_end', 'predicted_demand', 'stock_on_hand', 'shortfall',
+                               'model_version', 'computed_at'],
+            )
+        written += len(rows)
+
+    # Drop earlier periods and products that are no longer available
+    ReplenishmentForecast.objects.filter(computed_at__lt=computed_at).delete()
+    return written
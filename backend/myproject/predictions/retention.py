@@ -0,0 +1,104 @@
+# predictions/retention.py
+#
+# Retention policy for StockPrediction rows.
+#
+#   newer than PREDICTIONS_RETENTION_FULL_DAYS     kept as they are
+#   older than that                                compacted: only the latest
+#                                                  prediction per (product,
+#                                                  store, week) is kept
+#   older than PREDICTIONS_RETENTION_ARCHIVE_DAYS  moved to StockPredictionArchive
+#
+# Both passes walk the table in primary-key order in chunks of at most
+# `chunk_size` rows. Every chunk is its own short transaction, so writers
+# are never blocked for longer than one chunk; an interrupted run simply
+# resumes on the next invocation.
+import datetime
+import time
+
+from django.db import transaction
+from django.db.models import Exists, OuterRef, Q
+from django.utils import timezone
+
+from .models import StockPrediction, StockPredictionArchive
+
+DEFAULT_FULL_DAYS = 90
+DEFAULT_ARCHIVE_DAYS = 365
+DEFAULT_CHUNK_SIZE = 5000
+
+# Fields copied into the archive (besides the id, stored as original_id)
+ARCHIVE_FIELDS = (
+    'product_id', 'week_number', 'month', 'week_year', 'store_id', 'total_price', 'base_price',
+    'is_featured_sku', 'is_display_sku', 'predicted_stock', 'model_version', 'created_at', 'updated_at',
+)
+
+
+def cutoff(days, now=None):
+    return (now or timezone.now()) - datetime.timedelta(days=days)
+
+
+def superseded_predictions(before):
+    """
+    Rows created before `before` for which a more recent prediction of the
+    same product, store and week exists (under any model version). The
+    subquery is served by the natural-key unique index.
+    """
+    newer = StockPrediction.objects.filter(
+        product=OuterRef('product'),
+        store_id=OuterRef('store_id'),
+        week_year=OuterRef('week_year'),
+        month=OuterRef('month'),
+        week_number=OuterRef('week_number'),
+    ).filter(
+        Q(updated_at__gt=OuterRef('updated_at')) |
+        Q(updated_at=OuterRef('updated_at'), id__gt=OuterRef('id'))
+    )
+    return StockPrediction.objects.filter(created_at__lt=before).filter(Exists(newer))
+
+
+def _chunks(queryset, chunk_size):
+    """Yield lists of ids from `queryset`, keyset-paginated on id."""
+    last_id = 0
+    while True:
+        ids = list(queryset.filter(id__gt=last_id).order_by('id').values_list('id', flat=True)[:chunk_size])
+        if not ids:
+            return
+        yield ids
+        last_id = ids[-1]
+
+
+def compact(before, chunk_size=DEFAULT_CHUNK_SIZE, dry_run=False, pause=0.0):
+    """
+    Delete superseded predictions created before `before`.
+    Yields the number of rows removed per chunk.
+    """
+    for ids in _chunks(superseded_predictions(before), chunk_size):
+        if not dry_run:
+            with transaction.atomic():
+                # Re-check inside the transaction: a row may have changed since it was listed
+                ids = list(superseded_predictions(before).filter(id__in=ids).values_list('id', flat=True))
+                StockPrediction.objects.filter(id__in=ids).delete()
+        yield len(ids)
+        if pause:
+            time.sleep(pause)
+
+
+def archive(before, chunk_size=DEFAULT_CHUNK_SIZE, dry_run=False, pause=0.0):
+    """
+    Move predictions created before `before` into StockPredictionArchive.
+    Yields the number of rows moved per chunk.
+    """
+    queryset = StockPrediction.objects.filter(created_at__lt=before)
+    for ids in _chunks(queryset, chunk_size):
+        if not dry_run:
+            with transaction.atomic():
+                rows = StockPrediction.objects.filter(id__in=ids).values_list('id', *ARCHIVE_FIELDS)
+                StockPredictionArchive.objects.bulk_create(
+                    [StockPredictionArchive(original_id=row[0], **dict(zip(ARCHIVE_FIELDS, row[1:])))
+                     for row in rows],
+                    batch_size=1000,
+                    ignore_conflicts=True,  # already archived by an interrupted run
+                )
+                StockPrediction.objects.filter(id__in=ids).delete()
+        yield len(ids)
+        if pause:
+            time.sleep(pause)
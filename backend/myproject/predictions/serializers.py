@@ -1,7 +1,8 @@
 # backend/predictions/serializers.py
 
 from rest_framework import serializers
-from .models import StockPrediction
+from .models import StockPrediction, ForecastJob
+from .instrumentation import log_payload
 from products.models import Product # Assuming products app exists
 
 # Serializer for nested Product data representation
@@ -29,14 +30,14 @@ class StockPredictionSerializer(serializers.ModelSerializer):
         model = StockPrediction
         fields = [
             'id', 'product', 'product_id',
-            'week_number', 'month', 'store_id',
+            'week_number', 'month', 'week_year', 'store_id',
             'total_price', 'base_price', 'is_featured_sku', 'is_display_sku',
-            'predicted_stock', 'created_at',
+            'predicted_stock', 'model_version', 'created_at', 'updated_at',
             'date', # Keep 'date' here so it's processed during validation
         ]
         read_only_fields = [
-            'id', 'product', 'week_number', 'month',
-            'predicted_stock', 'created_at'
+            'id', 'product', 'week_number', 'month', 'week_year',
+            'predicted_stock', 'model_version', 'created_at', 'updated_at'
         ]
 
     # --- Validation Methods (Keep as they were) ---
@@ -64,8 +65,99 @@ class StockPredictionSerializer(serializers.ModelSerializer):
         validated_data.pop('date', None) # Safely remove 'date' if it exists
 
         # Now validated_data only contains fields that ARE valid
-        # arguments for StockPrediction.objects.create()
-        print(f"Data being passed to StockPrediction.objects.create: {validated_data}")
-        instance = StockPrediction.objects.create(**validated_data)
+        # StockPrediction arguments. A prediction for the same natural key
+        # (product, store, week, model version) updates the existing row.
+        log_payload("Data being upserted as a StockPrediction: %s", validated_data)
+        instance = StockPrediction(**validated_data)
+        # An updated row keeps its original created_at
+        StockPrediction.objects.upsert([instance])
         return instance
-    # --- END OF OVERRIDE ---
\ No newline at end of file
+    # --- END OF OVERRIDE ---
+
+# Query parameters of the prediction list endpoint
+class StockPredictionListFilterSerializer(serializers.Serializer):
+    product = serializers.IntegerField(min_value=1, required=False)
+    store_id = serializers.CharField(max_length=50, required=False)
+    date_from = serializers.DateField(required=False)
+    date_to = serializers.DateField(required=False)
+    stream = serializers.ChoiceField(choices=['ndjson'], required=False)
+
+    def validate(self, attrs):
+        if 'date_from' in attrs and 'date_to' in attrs and attrs['date_from'] > attrs['date_to']:
+            raise serializers.ValidationError("date_from must not be after date_to.")
+        return attrs
+
+
+# Serializer for one row of a batch prediction request.
+# product_id is a plain integer here: the batch view resolves all products
+# with a single in_bulk() query instead of one lookup per row.
+class StockPredictionBatchRowSerializer(serializers.Serializer):
+    product_id = serializers.IntegerField(min_value=1)
+    store_id = serializers.CharField(max_length=50)
+    total_price = serializers.FloatField()
+    base_price = serializers.FloatField()
+    is_featured_sku = serializers.BooleanField(default=False)
+    is_display_sku = serializers.BooleanField(default=False)
+    date = serializers.DateField()
+
+    def validate_total_price(self, value):
+        if value <= 0:
+            raise serializers.ValidationError("Total price must be greater than 0.")
+        return value
+
+    def validate_base_price(self, value):
+        if value <= 0:
+            raise serializers.ValidationError("Base price must be greater than 0.")
+        return value
+
+
+# Serializer for a forecast-horizon request: one product, many stores,
+# every week of the next `months` calendar months.
+class StockPredictionHorizonSerializer(serializers.Serializer):
+    product_id = serializers.PrimaryKeyRelatedField(queryset=Product.objects.all(), source='product')
+    store_ids = serializers.ListField(
+        child=serializers.CharField(max_length=50), allow_empty=False, max_length=500
+    )
+    start = serializers.DateField(required=False)  # defaults to today
+    months = serializers.IntegerField(min_value=1, max_value=24, default=3)
+    total_price = serializers.FloatField(required=False)  # defaults to product price
+    base_price = serializers.FloatField(required=False)   # defaults to product price
+    is_featured_sku = serializers.BooleanField(default=False)
+    is_display_sku = serializers.BooleanField(default=False)
+    persist = serializers.BooleanField(default=False)
+
+    def validate_total_price(self, value):
+        if value <= 0:
+            raise serializers.ValidationError("Total price must be greater than 0.")
+        return value
+
+    def validate_base_price(self, value):
+        if value <= 0:
+            raise serializers.ValidationError("Base price must be greater than 0.")
+        return value
+
+
+# Serializer for the spec of an asynchronous forecast job
+class ForecastJobSpecSerializer(serializers.Serializer):
+    product_ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1), required=False, allow_empty=True
+    )  # defaults to every available product
+    store_ids = serializers.ListField(
+        child=serializers.CharField(max_length=50), allow_empty=False, max_length=500
+    )
+    start = serializers.DateField(required=False)  # defaults to the day the job runs
+    months = serializers.IntegerField(min_value=1, max_value=24, default=3)
+    is_featured_sku = serializers.BooleanField(default=False)
+    is_display_sku = serializers.BooleanField(default=False)
+
+
+class ForecastJobSerializer(serializers.ModelSerializer):
+    progress = serializers.FloatField(read_only=True)
+
+    class Meta:
+        model = ForecastJob
+        fields = [
+            'id', 'status', 'spec', 'total_rows', 'processed_rows', 'progress',
+            'cancel_requested', 'error', 'created_at', 'started_at', 'finished_at',
+        ]
+        read_only_fields = fields
@@ -0,0 +1,234 @@
+# predictions/shadow.py
+#
+# Shadow scoring of candidate model versions.
+#
+# PREDICTIONS_SHADOW_MODELS names extra model files ({'name': path}); each is
+# held by its own ModelRegistry, so it is loaded once and hot-reloaded like
+# the served model. After a request has been answered, its feature rows and
+# the served predictions are handed to a small background thread pool. There
+# the served model and every shadow model score the same rows; per version we
+# record the latency, the memory its load took and how far its predictions
+# are from the ones that were served.
+#
+# Nothing of this runs on the request path: submit() only enqueues, and when
+# PREDICTIONS_SHADOW_QUEUE_DEPTH requests are already waiting the request is
+# left out of the comparison instead of queueing behind them.
+#
+# `manage.py promote_model <name>` makes a shadow model the served one.
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from django.conf import settings
+
+from .instrumentation import Histogram, histogram_lines, logger
+from .registry import ModelRegistry, registry
+
+SERVED = 'served'  # stats name of the model answering requests
+
+DEFAULT_SAMPLE_RATE = 1.0
+DEFAULT_WORKERS = 1
+DEFAULT_QUEUE_DEPTH = 64
+
+
+class VersionStats:
+    """Latency histogram and prediction differences of one model version."""
+
+    def __init__(self, loaded):
+        self.version = loaded.version
+        self.path = loaded.path
+        self.memory_kb = loaded.memory_kb
+        self.load_seconds = loaded.load_seconds
+        self.latency = Histogram()
+        self.rows = 0
+        self.diff_sum = 0.0
+        self.abs_diff_sum = 0.0
+        self.squared_diff_sum = 0.0
+        self.max_abs_diff = 0.0
+        self._lock = threading.Lock()
+
+    def record(self, seconds, diffs):
+        self.latency.observe(seconds)
+        abs_diffs = np.abs(diffs)
+        with self._lock:
+            self.rows += len(diffs)
+            self.diff_sum += float(diffs.sum())
+            self.abs_diff_sum += float(abs_diffs.sum())
+            self.squared_diff_sum += float((diffs ** 2).sum())
+            if len(diffs):
+                self.max_abs_diff = max(self.max_abs_diff, float(abs_diffs.max()))
+
+    def stats(self):
+        _, total, count = self.latency.snapshot()
+        with self._lock:
+            rows = self.rows
+            diff_sum, abs_diff_sum = self.diff_sum, self.abs_diff_sum
+            squared_diff_sum, max_abs_diff = self.squared_diff_sum, self.max_abs_diff
+        return {
+            'version': self.version,
+            'path': self.path,
+            'memory_kb': self.memory_kb,
+            'load_seconds': round(self.load_seconds, 6),
+            'calls': count,
+            'rows': rows,
+            'mean_ms': round(total / count * 1000, 3) if count else 0.0,
+            'mean_ms_per_row': round(total / rows * 1000, 4) if rows else 0.0,
+            # Differences to the predictions that were served
+            'mean_diff': diff_sum / rows if rows else 0.0,
+            'mean_abs_diff': abs_diff_sum / rows if rows else 0.0,
+            'rms_diff': (squared_diff_sum / rows) ** 0.5 if rows else 0.0,
+            'max_abs_diff': max_abs_diff,
+        }
+
+
+class ShadowScorer:
+    """Scores served requests again with the shadow models, off the request path."""
+
+    def __init__(self, models=None, sample_rate=None, workers=None, queue_depth=None):
+        self._models = models
+        self._sample_rate = sample_rate
+        self._workers = workers
+        self._queue_depth = queue_depth
+        self._registries = {}
+        self._stats = {}
+        self._executor = None
+        self._pending = 0
+        self._lock = threading.Lock()
+        self.dropped = 0
+        self.errors = 0
+
+    @property
+    def models(self):
+        if self._models is not None:
+            return self._models
+        return getattr(settings, 'PREDICTIONS_SHADOW_MODELS', None) or {}
+
+    @property
+    def sample_rate(self):
+        if self._sample_rate is not None:
+            return self._sample_rate
+        return getattr(settings, 'PREDICTIONS_SHADOW_SAMPLE_RATE', DEFAULT_SAMPLE_RATE)
+
+    @property
+    def queue_depth(self):
+        if self._queue_depth is not None:
+            return self._queue_depth
+        return getattr(settings, 'PREDICTIONS_SHADOW_QUEUE_DEPTH', DEFAULT_QUEUE_DEPTH)
+
+    @property
+    def enabled(self):
+        return bool(self.models) and self.sample_rate > 0
+
+    def registry_for(self, name):
+        """The ModelRegistry holding shadow model `name` (created on first use)."""
+        shadow_registry = self._registries.get(name)
+        if shadow_registry is None:
+            with self._lock:
+                shadow_registry = self._registries.setdefault(name, ModelRegistry(path=self.models[name]))
+        return shadow_registry
+
+    def _get_executor(self):
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    workers = self._workers or getattr(settings, 'PREDICTIONS_SHADOW_WORKERS', DEFAULT_WORKERS)
+                    self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='shadow')
+        return self._executor
+
+    def submit(self, rows, served):
+        """
+        Queue feature `rows` (a DataFrame or a list of feature dicts) and the
+        predictions served for them. Returns False when the request is not
+        compared (disabled, not sampled or the queue is full).
+        """
+        if not self.enabled:
+            return False
+        rate = self.sample_rate
+        if rate < 1 and random.random() >= rate:
+            return False
+        with self._lock:
+            if self._pending >= self.queue_depth:
+                self.dropped += 1
+                return False
+            self._pending += 1
+        try:
+            self._get_executor().submit(self._score, rows, np.array(served, dtype=float, ndmin=1))
+        except RuntimeError:  # interpreter shutting down
+            with self._lock:
+                self._pending -= 1
+            return False
+        return True
+
+    def _score(self, rows, served):
+        try:
+            import pandas as pd
+            from .inference import prepare_features
+            frame = prepare_features(rows if isinstance(rows, pd.DataFrame) else pd.DataFrame(rows))
+            versions = [(SERVED, registry)] + [(name, self.registry_for(name)) for name in self.models]
+            for name, model_registry in versions:
+                loaded = model_registry.get()
+                started = time.perf_counter()
+                predictions = np.clip(np.asarray(loaded.model.predict(frame), dtype=float), 0, None)
+                elapsed = time.perf_counter() - started
+                self._stats_for(name, loaded).record(elapsed, predictions - served)
+        except Exception:
+            self.errors += 1
+            logger.exception("Shadow scoring failed")
+        finally:
+            with self._lock:
+                self._pending -= 1
+
+    def _stats_for(self, name, loaded):
+        # A reloaded file is a new version: its numbers start from zero
+        stats = self._stats.get(name)
+        if stats is None or stats.version != loaded.version:
+            with self._lock:
+                stats = self._stats.get(name)
+                if stats is None or stats.version != loaded.version:
+                    stats = self._stats[name] = VersionStats(loaded)
+        return stats
+
+    def stats(self):
+        return {
+            'enabled': self.enabled,
+            'models': dict(self.models),
+            'sample_rate': self.sample_rate,
+            'pending': self._pending,
+            'dropped': self.dropped,
+            'errors': self.errors,
+            'versions': {name: stats.stats() for name, stats in sorted(self._stats.items())},
+        }
+
+    def render(self):
+        """Prometheus text exposition of the per-version latency and differences."""
+        if not self._stats:
+            return ''
+        latency = 'prediction_model_latency_seconds'
+        lines = [
+            f'# HELP {latency} Shadow comparison: model.predict duration per model version.',
+            f'# TYPE {latency} histogram',
+        ]
+        gauges = {
+            'mean_abs_diff': ('Mean absolute difference to the served predictions.', []),
+            'max_abs_diff': ('Largest absolute difference to the served predictions.', []),
+            'memory_bytes': ('Resident memory added by loading the model.', []),
+        }
+        for name, stats in sorted(self._stats.items()):
+            labels = f'model="{name}",version="{stats.version}"'
+            lines.extend(histogram_lines(latency, labels, stats.latency))
+            data = stats.stats()
+            gauges['mean_abs_diff'][1].append((labels, f'{data["mean_abs_diff"]:.9f}'))
+            gauges['max_abs_diff'][1].append((labels, f'{data["max_abs_diff"]:.9f}'))
+            if stats.memory_kb is not None:
+                gauges['memory_bytes'][1].append((labels, stats.memory_kb * 1024))
+        for gauge, (help_text, samples) in gauges.items():
+            lines.append(f'# HELP prediction_model_{gauge} {help_text}')
+            lines.append(f'# TYPE prediction_model_{gauge} gauge')
+            lines.extend(f'prediction_model_{gauge}{{{labels}}} {value}' for labels, value in samples)
+        return '\n'.join(lines) + '\n'
+
+
+# The process-wide shadow scorer.
+shadow_scorer = ShadowScorer()
@@ -1,3 +1,465 @@
-from django.test import TestCase
+import datetime
+import io
+import json
+import os
+import stat
+import subprocess
+import tempfile
+import threading
+from concurrent.futures.process import BrokenProcessPool
+from unittest import mock
 
-# Create your tests here.
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+
+import joblib
+import numpy as np
+import pandas as pd
+
+from .apps import is_server_process
+from .batching import MicroBatcher
+from .compiled import CompiledModel, compile_pipeline, parity_sample, save_compiled
+from .fastpath import PROBE_ROWS
+from .inference import predict_stock, predict_stock_local, prepare_features, serving_version
+from .jobs import requeue_stale_jobs
+from .models import ForecastJob, StockPrediction, StockPredictionArchive
+from .modelserver import ModelServer, ModelServerClient, ModelServerUnavailable
+from .registry import DEFAULT_MODEL_PATH, ModelRegistry, registry
+from .training import train_in_subprocess
+from products.models import Category, Product
+
+
+def make_product(name='p'):
+    category = Category.objects.get_or_create(name='c', slug='c')[0]
+    return Product.objects.create(name=name, slug=name, description='', price=10, category=category, stock=5)
+
+
+def make_prediction(product, store_id='1', week_number=1, predicted_stock=1.0, **fields):
+    return StockPrediction(product=product, store_id=store_id, total_price=10, base_price=10,
+                           week_number=week_number, month=1, week_year=2026,
+                           predicted_stock=predicted_stock, **fields)
+
+
+class CompiledModelParityTests(TestCase):
+    """The compiled array evaluator must reproduce model.pkl's predictions."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.model = joblib.load(DEFAULT_MODEL_PATH)
+        cls.compiled = CompiledModel(compile_pipeline(cls.model, source_version='test'))
+
+    def test_saved_artifact_is_readable_by_other_users(self):
+        with tempfile.TemporaryDirectory() as directory:
+            target = save_compiled(compile_pipeline(self.model, source_version='test'),
+                                   os.path.join(directory, 'model_compiled'))
+            self.assertEqual(stat.S_IMODE(os.stat(target).st_mode), 0o755)
+            for name in os.listdir(target):
+                self.assertEqual(stat.S_IMODE(os.stat(os.path.join(target, name)).st_mode), 0o644, name)
+            frame = parity_sample(self.model, 10)
+            np.testing.assert_allclose(CompiledModel.load(os.path.join(directory, 'model_compiled')).predict(frame),
+                                       self.compiled.predict(frame), atol=1e-9)
+
+    def test_frame_parity(self):
+        frame = parity_sample(self.model, 2000)
+        np.testing.assert_allclose(self.compiled.predict(frame), self.model.predict(frame), atol=1e-6)
+
+    def test_single_row_parity(self):
+        for row in PROBE_ROWS:
+            expected = float(self.model.predict(prepare_features(pd.DataFrame([row])))[0])
+            self.assertAlmostEqual(self.compiled.predict_one(row), expected, places=6)
+
+
+class ModelServerTests(SimpleTestCase):
+    """The socket client must return what in-process inference returns."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.tmp = tempfile.TemporaryDirectory()
+        cls.socket_path = os.path.join(cls.tmp.name, 'model.sock')
+        cls.server = ModelServer(cls.socket_path)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        cls.tmp.cleanup()
+        super().tearDownClass()
+
+    def test_predictions_match_in_process(self):
+        client = ModelServerClient(socket_path=self.socket_path)
+        expected = [predict_stock_local(row) for row in PROBE_ROWS]
+        self.assertEqual(client.predict_many(PROBE_ROWS), expected)
+        self.assertEqual(client.predict_one(PROBE_ROWS[1]), expected[1])
+
+    def test_invalid_row_raises_value_error(self):
+        client = ModelServerClient(socket_path=self.socket_path)
+        row = dict(PROBE_ROWS[0], week_number=2 ** 40)
+        with self.assertRaises(ValueError):
+            client.predict_one(row)
+
+    def test_unreachable_server(self):
+        client = ModelServerClient(socket_path=os.path.join(self.tmp.name, 'missing.sock'))
+        with self.assertRaises(ModelServerUnavailable):
+            client.predict_one(PROBE_ROWS[0])
+        self.assertFalse(client.available)
+
+
+class ModelServerFallbackTests(SimpleTestCase):
+    """Server-side failures are scored in-process instead of reaching the client."""
+
+    def server_client(self, **attrs):
+        client = mock.Mock(available=True, enabled=True, last_version=None, **attrs)
+        return mock.patch('predictions.inference.model_server_client', client)
+
+    def test_server_error_falls_back_to_local_model(self):
+        with self.server_client(predict_one=mock.Mock(side_effect=RuntimeError("Model server error: boom"))):
+            self.assertEqual(predict_stock(PROBE_ROWS[0]), predict_stock_local(PROBE_ROWS[0]))
+
+    def test_unreachable_server_falls_back_to_local_model(self):
+        with self.server_client(predict_one=mock.Mock(side_effect=ModelServerUnavailable("refused"))):
+            self.assertEqual(predict_stock(PROBE_ROWS[0]), predict_stock_local(PROBE_ROWS[0]))
+
+    def test_serving_version_falls_back_when_ping_fails(self):
+        local_version = registry.get().version
+        for error in (ModelServerUnavailable("refused"), RuntimeError("Model server error: boom")):
+            with self.server_client(ping=mock.Mock(side_effect=error)), \
+                    mock.patch.object(ModelRegistry, 'is_loaded', new_callable=mock.PropertyMock, return_value=False):
+                self.assertEqual(serving_version(), local_version)
+
+
+@override_settings(PREDICTIONS_FAST_PATH=False, PREDICTIONS_USE_COMPILED_MODEL=False)
+class ModelRegistryReloadTests(SimpleTestCase):
+    """The registry swaps in a changed model file without disturbing callers of the old one."""
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.path = os.path.join(tmp.name, 'model.pkl')
+        self.write_model('first')
+
+    def write_model(self, name, mtime_offset=0):
+        joblib.dump({'name': name}, self.path)
+        stat_result = os.stat(self.path)
+        # Push the mtime forward so filesystems with coarse timestamps still see a change
+        os.utime(self.path, ns=(stat_result.st_atime_ns, stat_result.st_mtime_ns + mtime_offset))
+
+    def test_changed_file_is_swapped_in(self):
+        registry = ModelRegistry(path=self.path, check_interval=0)
+        old = registry.get()
+        self.write_model('second', mtime_offset=10 ** 9)
+
+        new = registry.get()
+        self.assertIsNot(new, old)
+        self.assertNotEqual(new.version, old.version)
+        self.assertEqual(new.model, {'name': 'second'})
+        self.assertEqual(registry.reload_count, 2)
+        # A request still holding the previous snapshot keeps a complete model
+        self.assertEqual(old.model, {'name': 'first'})
+        self.assertIs(registry.get(), new)
+
+    def test_touched_file_keeps_the_loaded_model(self):
+        registry = ModelRegistry(path=self.path, check_interval=0)
+        old = registry.get()
+        self.write_model('first', mtime_offset=10 ** 9)
+
+        new = registry.get()
+        self.assertEqual(new.version, old.version)
+        self.assertIs(new.model, old.model)
+        self.assertEqual(registry.reload_count, 1)
+
+    def test_file_is_not_rechecked_within_the_interval(self):
+        registry = ModelRegistry(path=self.path, check_interval=3600)
+        old = registry.get()
+        self.write_model('second', mtime_offset=10 ** 9)
+        self.assertIs(registry.get(), old)
+        self.assertEqual(registry.reload().model, {'name': 'second'})
+
+    def test_removed_file_keeps_serving_the_loaded_model(self):
+        registry = ModelRegistry(path=self.path, check_interval=0)
+        old = registry.get()
+        os.remove(self.path)
+        self.assertIs(registry.get(), old)
+
+
+class MicroBatcherTests(SimpleTestCase):
+    """Concurrent callers share predict calls but each gets its own outcome."""
+
+    callers = 8
+
+    def call_concurrently(self, batcher):
+        outcomes = [None] * self.callers
+        start = threading.Barrier(self.callers)
+
+        def call(i):
+            start.wait()
+            try:
+                outcomes[i] = batcher.predict({'x': i})
+            except Exception as e:
+                outcomes[i] = e
+
+        threads = [threading.Thread(target=call, args=(i,)) for i in range(self.callers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return outcomes
+
+    def test_each_caller_gets_its_own_result(self):
+        batcher = MicroBatcher(window_ms=200, max_size=self.callers)
+        with mock.patch('predictions.batching.score_rows',
+                        side_effect=lambda rows: np.array([row['x'] * 10.0 for row in rows])):
+            outcomes = self.call_concurrently(batcher)
+        self.assertEqual(outcomes, [i * 10.0 for i in range(self.callers)])
+        stats = batcher.stats()
+        self.assertEqual(stats['rows'], self.callers)
+        self.assertLess(stats['batches'], self.callers)
+
+    def test_batch_error_reaches_every_caller(self):
+        batcher = MicroBatcher(window_ms=200, max_size=self.callers)
+        error = ValueError("bad batch")
+        with mock.patch('predictions.batching.score_rows', side_effect=error):
+            outcomes = self.call_concurrently(batcher)
+        self.assertEqual(outcomes, [error] * self.callers)
+        self.assertGreaterEqual(batcher.stats()['failed_batches'], 1)
+        self.assertEqual(batcher.stats()['rows'], 0)
+
+
+class UpsertTests(TestCase):
+    """StockPrediction.objects.upsert() on the (product, store, week, model version) key."""
+
+    def setUp(self):
+        self.product = make_product()
+
+    def test_duplicates_collapse_and_existing_rows_update(self):
+        existing = make_prediction(self.product, predicted_stock=1)
+        self.assertEqual(StockPrediction.objects.upsert([existing]), 1)
+
+        objs = [
+            make_prediction(self.product, predicted_stock=2),  # same key as `existing`
+            make_prediction(self.product, week_number=2, predicted_stock=3),
+            make_prediction(self.product, week_number=2, predicted_stock=4),  # repeats the previous key
+        ]
+        self.assertEqual(StockPrediction.objects.upsert(objs), 1)
+        self.assertEqual(StockPrediction.objects.count(), 2)
+        self.assertEqual(objs[0].pk, existing.pk)
+        self.assertEqual(objs[1].pk, objs[2].pk)
+        self.assertEqual(StockPrediction.objects.get(pk=objs[1].pk).predicted_stock, 4)
+
+        # Every object carries the stored timestamps; the updated row kept its created_at
+        stored = StockPrediction.objects.get(pk=existing.pk)
+        self.assertEqual((objs[0].created_at, objs[0].updated_at), (stored.created_at, stored.updated_at))
+        self.assertEqual(stored.created_at, existing.created_at)
+        self.assertEqual(objs[1].created_at, objs[2].created_at)
+        self.assertIsNotNone(objs[2].updated_at)
+
+    def test_batch_endpoint_counts(self):
+        row = {'product_id': self.product.pk, 'store_id': '1', 'total_price': 10, 'base_price': 10,
+               'date': '2026-03-02'}
+        response = self.client.post('/api/predictions/predictions/batch/', [row, row], content_type='application/json')
+        self.assertEqual(response.status_code, 201, response.content)
+        data = response.json()
+        self.assertEqual((data['created'], data['updated']), (1, 0))
+        self.assertTrue(all(result['created_at'] for result in data['results']))
+
+        response = self.client.post('/api/predictions/predictions/batch/', [row, dict(row, store_id='2')],
+                                    content_type='application/json')
+        data = response.json()
+        self.assertEqual((data['created'], data['updated']), (1, 1))
+
+
+class NaturalKeyMigrationTests(TransactionTestCase):
+    """Migration 0006 keeps the newest row of each duplicated key."""
+    migrate_from = [('predictions', '0005_forecastjob')]
+    migrate_to = [('predictions', '0006_stockprediction_natural_key')]
+
+    def test_duplicates_are_removed(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate(self.migrate_from)
+        old_apps = executor.loader.project_state(self.migrate_from).apps
+        OldPrediction = old_apps.get_model('predictions', 'StockPrediction')
+        OldProduct = old_apps.get_model('products', 'Product')
+        product = OldProduct.objects.create(
+            name='p', slug='p', description='', price=10, stock=5,
+            category=old_apps.get_model('products', 'Category').objects.create(name='c', slug='c'),
+        )
+        ids = [
+            OldPrediction.objects.create(product=product, store_id=store_id, total_price=10, base_price=10,
+                                         week_number=1, month=1).id
+            for store_id in ('1', '1', '1', '2')
+        ]
+
+        executor = MigrationExecutor(connection)
+        executor.loader.build_graph()
+        executor.migrate(self.migrate_to)
+        new_apps = executor.loader.project_state(self.migrate_to).apps
+        remaining = new_apps.get_model('predictions', 'StockPrediction').objects.order_by('id')
+        self.assertEqual(list(remaining.values_list('id', flat=True)), [ids[2], ids[3]])
+
+        executor = MigrationExecutor(connection)
+        executor.migrate(executor.loader.graph.leaf_nodes())
+
+
+class PredictionListTests(TestCase):
+    """Cursor pagination, filters and the NDJSON stream of the prediction list."""
+    url = '/api/predictions/predictions/list/'
+
+    @classmethod
+    def setUpTestData(cls):
+        products = [make_product('a'), make_product('b')]
+        now = timezone.now()
+        objs = [make_prediction(products[week % 2], store_id=str(week % 3), week_number=week) for week in range(7)]
+        StockPrediction.objects.upsert(objs)
+        # Pairs of rows share a created_at, so the id has to break the tie
+        for index, obj in enumerate(objs):
+            StockPrediction.objects.filter(pk=obj.pk).update(created_at=now - datetime.timedelta(hours=index // 2))
+        cls.expected = list(StockPrediction.objects.order_by('-created_at', '-id').values_list('id', flat=True))
+        cls.products = products
+
+    def pages(self, **params):
+        url, params, ids = self.url, dict(params, page_size=3), []
+        while url:
+            response = self.client.get(url, params)
+            self.assertEqual(response.status_code, 200, response.content)
+            data = response.json()
+            ids += [row['id'] for row in data['results']]
+            url, params = data['next'], {}
+        return ids
+
+    def test_cursor_pages_through_everything_once(self):
+        self.assertEqual(self.pages(), self.expected)
+
+    def test_filters(self):
+        product = self.products[1]
+        ids = self.pages(product=product.pk, store_id='1')
+        expected = StockPrediction.objects.filter(product=product, store_id='1') \
+            .order_by('-created_at', '-id').values_list('id', flat=True)
+        self.assertEqual(ids, list(expected))
+        response = self.client.get(self.url, {'date_from': '2026-02-01', 'date_to': '2026-01-01'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_ndjson_stream(self):
+        response = self.client.get(self.url, {'stream': 'ndjson'})
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        rows = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+        self.assertEqual([row['id'] for row in rows], self.expected)
+        self.assertEqual(set(rows[0]['product']), {'id', 'name'})
+
+
+class RetentionTests(TestCase):
+    """prune_predictions compacts old rows, archives very old ones and reports the counts."""
+
+    def setUp(self):
+        product = make_product()
+        now = timezone.now()
+        # (created days ago, store, week, model version): per store/week only the newest is kept once old
+        seeded = [
+            (10, '1', 1, 'v1'), (5, '1', 1, 'v2'),                      # recent: both kept
+            (100, '2', 1, 'v1'), (99, '2', 1, 'v2'), (98, '2', 1, 'v3'),  # compacted to the v3 row
+            (400, '3', 1, 'v1'), (399, '3', 1, 'v2'),                   # compacted, then archived
+            (500, '4', 1, 'v1'),                                         # archived
+        ]
+        objs = [make_prediction(product, store_id=store, week_number=week, model_version=version)
+                for _, store, week, version in seeded]
+        StockPrediction.objects.upsert(objs)
+        for obj, (days_ago, *_) in zip(objs, seeded):
+            moment = now - datetime.timedelta(days=days_ago)
+            StockPrediction.objects.filter(pk=obj.pk).update(created_at=moment, updated_at=moment)
+        self.objs = objs
+
+    def prune(self, *args):
+        out = io.StringIO()
+        call_command('prune_predictions', '--full-days', '90', '--archive-days', '365', '--chunk-size', '2',
+                     *args, stdout=out)
+        return out.getvalue()
+
+    def test_dry_run_changes_nothing(self):
+        output = self.prune('--dry-run')
+        self.assertIn("3 rows would be compacted", output)
+        self.assertEqual(StockPrediction.objects.count(), 8)
+        self.assertFalse(StockPredictionArchive.objects.exists())
+
+    def test_compact_and_archive(self):
+        output = self.prune()
+        self.assertIn("3 rows were compacted", output)
+        self.assertIn("2 rows were archived", output)
+        self.assertEqual(set(StockPrediction.objects.values_list('pk', flat=True)),
+                         {self.objs[0].pk, self.objs[1].pk, self.objs[4].pk})
+        self.assertEqual(set(StockPredictionArchive.objects.values_list('original_id', flat=True)),
+                         {self.objs[6].pk, self.objs[7].pk})
+        # A second run has nothing left to do
+        output = self.prune()
+        self.assertIn("0 rows were compacted", output)
+        self.assertIn("0 rows were archived", output)
+
+
+class ForecastJobRecoveryTests(TestCase):
+    """Jobs orphaned by a dead worker are requeued, and a broken pool is replaced."""
+
+    def make_job(self, status='pending', started_hours_ago=None, **fields):
+        started_at = timezone.now() - datetime.timedelta(hours=started_hours_ago) \
+            if started_hours_ago is not None else None
+        return ForecastJob.objects.create(status=status, started_at=started_at, processed_rows=5,
+                                          spec={'store_ids': ['1'], 'months': 1}, **fields)
+
+    def test_requeue_stale_jobs(self):
+        stale = self.make_job('running', started_hours_ago=7)
+        fresh = self.make_job('running', started_hours_ago=1)
+        cancelled = self.make_job('running', started_hours_ago=7, cancel_requested=True)
+        self.assertEqual(requeue_stale_jobs(6 * 3600), 1)
+        stale.refresh_from_db()
+        self.assertEqual((stale.status, stale.started_at, stale.processed_rows), ('pending', None, 0))
+        self.assertEqual(ForecastJob.objects.get(pk=fresh.pk).status, 'running')
+        self.assertEqual(ForecastJob.objects.get(pk=cancelled.pk).status, 'cancelled')
+
+    def test_broken_pool_is_replaced(self):
+        jobs = [self.make_job(), self.make_job()]
+        run_job = mock.Mock(side_effect=[BrokenProcessPool('worker died'), 'completed'])
+        executors = [mock.Mock(), mock.Mock()]
+        with mock.patch('predictions.management.commands.run_forecast_jobs.run_job', run_job), \
+                mock.patch('predictions.management.commands.run_forecast_jobs.make_executor',
+                           side_effect=executors):
+            call_command('run_forecast_jobs', '--once', stdout=io.StringIO(), stderr=io.StringIO())
+        self.assertEqual([call.args[0].pk for call in run_job.call_args_list], [job.pk for job in jobs])
+        # The second job ran on the new pool
+        self.assertIs(run_job.call_args_list[1].args[1], executors[1])
+        executors[0].shutdown.assert_called_once_with(wait=False, cancel_futures=True)
+
+
+class TrainInSubprocessTests(SimpleTestCase):
+    """A worker that fails or prints no summary is reported with its stderr."""
+
+    def run_worker(self, returncode, stdout, stderr='worker traceback'):
+        result = subprocess.CompletedProcess([], returncode, stdout=stdout, stderr=stderr)
+        with mock.patch('predictions.training.subprocess.run', return_value=result):
+            return train_in_subprocess('base.pkl', 'data.csv', 'out.pkl', 10, 0.2)
+
+    def test_summary_is_read_from_the_last_line(self):
+        self.assertEqual(self.run_worker(0, 'loading\n{"new_mae": 1.5}\n'), {'new_mae': 1.5})
+
+    def test_failures_raise_command_error_with_stderr(self):
+        for returncode, stdout in ((1, ''), (0, ''), (0, '\n  \n'), (0, 'not json')):
+            with self.assertRaisesMessage(CommandError, 'worker traceback'):
+                self.run_worker(returncode, stdout)
+
+
+class WarmupEntryPointTests(SimpleTestCase):
+    """The start-up warm-up runs in WSGI/ASGI servers, never in management commands."""
+
+    def test_is_server_process(self):
+        self.assertTrue(is_server_process(['/venv/bin/gunicorn', 'myproject.wsgi']))
+        self.assertTrue(is_server_process(['/venv/bin/daphne', 'myproject.asgi:application']))
+        self.assertTrue(is_server_process(['manage.py', 'runserver', '--noreload']))
+        self.assertFalse(is_server_process(['manage.py', 'migrate']))
+        self.assertFalse(is_server_process(['/venv/bin/django-admin', 'test']))
+        with mock.patch.dict(os.environ, {'RUN_MAIN': 'true'}):
+            self.assertTrue(is_server_process(['manage.py', 'runserver']))
+        with mock.patch.dict(os.environ):
+            os.environ.pop('RUN_MAIN', None)
+            self.assertFalse(is_server_process(['manage.py', 'runserver']))  # the autoreloader's parent
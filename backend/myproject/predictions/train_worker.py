@@ -0,0 +1,126 @@
+# predictions/train_worker.py
+#
+# Retraining step run in a child process by `manage.py retrain_model`:
+#
+#     python -m predictions.train_worker --base-model model.pkl --data rows.csv --output new.pkl
+#
+# It does not import Django. Training memory (CatBoost, encoded frames) is
+# given back to the OS when the process exits instead of staying in the
+# command's process. The last line of stdout is a JSON summary.
+#
+# Warm start: the fitted preprocessing of the base pipeline is kept as it is
+# (the trees were grown on its encoded feature space) and the estimator
+# continues from its current state: CatBoost adds `iterations` trees on top
+# of the existing ones (init_model), estimators with partial_fit or
+# warm_start are updated in place. Other estimators, or --full, refit the
+# whole pipeline from scratch.
+import argparse
+import copy
+import json
+import sys
+import time
+
+import numpy as np
+
+from predictions.features import EXPECTED_FEATURES, FEATURE_DTYPES
+
+
+def split_holdout(frame, holdout_fraction):
+    """Hold out the most recent weeks (by week_key) for validation."""
+    keys = np.unique(frame['week_key'].to_numpy())
+    if len(keys) < 2:
+        raise ValueError("Need at least two distinct weeks of data to hold one out")
+    n_holdout = min(max(1, int(round(len(keys) * holdout_fraction))), len(keys) - 1)
+    holdout = frame['week_key'].isin(keys[-n_holdout:]).to_numpy()
+    return frame[~holdout], frame[holdout]
+
+
+def features(frame):
+    return frame[EXPECTED_FEATURES].astype(FEATURE_DTYPES)
+
+
+def warm_start_fit(base, X, y, iterations):
+    """
+    Continue training a fitted pipeline on new rows.
+    Returns (model, method) where method says how it was trained.
+    """
+    from sklearn.base import clone
+    from sklearn.pipeline import Pipeline
+
+    if isinstance(base, Pipeline):
+        preproc, estimator = base[:-1], base.steps[-1][1]
+        X_encoded = preproc.transform(X)
+    else:
+        preproc, estimator, X_encoded = None, base, X
+
+    def rebuild(new_estimator):
+        if preproc is None:
+            return new_estimator
+        return Pipeline(copy.deepcopy(base.steps[:-1]) + [(base.steps[-1][0], new_estimator)])
+
+    if type(estimator).__name__ in ('CatBoostRegressor', 'CatBoostClassifier'):
+        params = estimator.get_params()
+        params['iterations'] = iterations
+        new_estimator = type(estimator)(**params)
+        new_estimator.fit(X_encoded, y, init_model=estimator)
+        return rebuild(new_estimator), 'catboost_init_model'
+    if hasattr(estimator, 'partial_fit'):
+        new_estimator = copy.deepcopy(estimator)
+        new_estimator.partial_fit(X_encoded, y)
+        return rebuild(new_estimator), 'partial_fit'
+    if 'warm_start' in estimator.get_params() and 'n_estimators' in estimator.get_params():
+        new_estimator = copy.deepcopy(estimator)
+        new_estimator.set_params(warm_start=True, n_estimators=estimator.n_estimators + iterations)
+        new_estimator.fit(X_encoded, y)
+        return rebuild(new_estimator), 'warm_start'
+
+    model = clone(base)
+    model.fit(X, y)
+    return model, 'full_refit'
+
+
+def mae(model, X, y):
+    return float(np.mean(np.abs(np.clip(model.predict(X), 0, None) - y)))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--base-model', required=True)
+    parser.add_argument('--data', required=True, help="CSV with the model features, week_key and units.")
+    parser.add_argument('--output', required=True)
+    parser.add_argument('--iterations', type=int, default=200)
+    parser.add_argument('--holdout-fraction', type=float, default=0.2)
+    parser.add_argument('--full', action='store_true', help="Refit from scratch instead of warm starting.")
+    args = parser.parse_args(argv)
+
+    import joblib
+    import pandas as pd
+    from sklearn.base import clone
+
+    started = time.perf_counter()
+    frame = pd.read_csv(args.data, dtype={'store_id': str})
+    train, holdout = split_holdout(frame, args.holdout_fraction)
+    X_train, y_train = features(train), train['units'].to_numpy(dtype=float)
+    X_holdout, y_holdout = features(holdout), holdout['units'].to_numpy(dtype=float)
+
+    base = joblib.load(args.base_model)
+    if args.full:
+        model, method = clone(base), 'full_refit'
+        model.fit(X_train, y_train)
+    else:
+        model, method = warm_start_fit(base, X_train, y_train, args.iterations)
+
+    joblib.dump(model, args.output)
+    print(json.dumps({
+        'method': method,
+        'train_rows': len(train),
+        'holdout_rows': len(holdout),
+        'base_mae': mae(base, X_holdout, y_holdout),
+        'new_mae': mae(model, X_holdout, y_holdout),
+        'seconds': round(time.perf_counter() - started, 3),
+    }))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,144 @@
+# predictions/training.py
+#
+# Incremental retraining.
+#
+# Training rows are the StockPrediction rows of weeks that are over: their
+# features are what the model was asked about and the label is what was
+# actually sold, the units of that product in that week from OrderItem
+# (orders are not attributed to a store, so every store row of a
+# product-week gets the product's total). The table is walked in id chunks;
+# each chunk gets its labels from one grouped OrderItem query and is
+# appended to a CSV, so memory stays bounded by the chunk size.
+#
+# The CSV is handed to predictions.train_worker in a child process. The
+# model it writes is stored as PREDICTIONS_MODEL_ARTIFACT_DIR/model-<version>.pkl
+# and installed over PREDICTIONS_MODEL_PATH with install_model(); the
+# registries of the running workers notice the new file and swap it in
+# between requests.
+import csv
+import datetime
+import json
+import os
+import subprocess
+import sys
+
+import numpy as np
+from django.conf import settings
+from django.core.management.base import CommandError
+from django.db.models import Q
+from django.utils import timezone
+
+from .backtest import sales_by_day
+from .features import EXPECTED_FEATURES, derive_date_features
+from .models import StockPrediction
+from .registry import file_digest
+
+DEFAULT_ARTIFACT_DIR = os.path.join(os.path.dirname(__file__), 'artifacts')
+DEFAULT_CHUNK_SIZE = 20000
+
+TRAINING_COLUMNS = EXPECTED_FEATURES + ['week_key', 'units']
+
+_SOURCE_FIELDS = (
+    'id', 'product_id', 'store_id', 'total_price', 'base_price', 'is_featured_sku', 'is_display_sku',
+    'week_number', 'month', 'week_year',
+)
+
+
+def week_key(week_number, month, year):
+    """Sortable integer key of a model week."""
+    return (np.asarray(year) * 100 + np.asarray(month)) * 10 + np.asarray(week_number)
+
+
+def _units_sold(product_id, keys, month, year):
+    """Units sold per row's (product, week), from one grouped OrderItem query."""
+    months = np.asarray(year) * 12 + np.asarray(month) - 1
+    first, last = int(months.min()), int(months.max()) + 1
+    start = datetime.date(first // 12, first % 12 + 1, 1)
+    end = datetime.date(last // 12, last % 12 + 1, 1)
+    sold_product, sold_day, quantity, _ = sales_by_day(np.unique(product_id).tolist(), start, end)
+    if not len(sold_product):
+        return np.zeros(len(product_id))
+
+    # Sum per (product, week), then look every row up in the sorted totals
+    sold_keys = sold_product * 10 ** 7 + week_key(*derive_date_features(sold_day))
+    totals_keys, inverse = np.unique(sold_keys, return_inverse=True)
+    totals = np.bincount(inverse, weights=quantity)
+    row_keys = product_id * 10 ** 7 + keys
+    index = np.minimum(np.searchsorted(totals_keys, row_keys), len(totals_keys) - 1)
+    return np.where(totals_keys[index] == row_keys, totals[index], 0.0)
+
+
+def extract_training_data(path, since, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Write the training rows of the weeks from `since` up to the current week
+    (excluded) to the CSV file `path`. Returns the number of rows written.
+    """
+    current_key = int(week_key(*derive_date_features([timezone.localdate()]))[0])
+    queryset = StockPrediction.objects.filter(
+        Q(week_year__gt=since.year) | Q(week_year=since.year, month__gte=since.month)
+    )
+    written = 0
+    last_id = 0
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(TRAINING_COLUMNS)
+        while True:
+            rows = list(queryset.filter(id__gt=last_id).order_by('id').values_list(*_SOURCE_FIELDS)[:chunk_size])
+            if not rows:
+                return written
+            last_id = rows[-1][0]
+
+            (_, product_id, store_id, total_price, base_price, featured, display,
+             week_number, month, year) = (np.array(column) for column in zip(*rows))
+            keys = week_key(week_number, month, year)
+            done = keys < current_key
+            if not done.any():
+                continue
+            product_id, keys = product_id[done].astype(np.int64), keys[done]
+            units = _units_sold(product_id, keys, month[done], year[done])
+            writer.writerows(zip(
+                week_number[done], month[done], store_id[done], product_id,
+                total_price[done], base_price[done], featured[done].astype(int), display[done].astype(int),
+                year[done], keys, units,
+            ))
+            written += int(done.sum())
+
+
+def train_in_subprocess(base_model, data_path, output_path, iterations, holdout_fraction, full=False,
+                        timeout=None):
+    """
+    Run predictions.train_worker in a child process and return its summary
+    dict. Raises CommandError, with the worker's stderr, when training fails
+    or the worker does not report a summary.
+    """
+    command = [
+        sys.executable, '-m', 'predictions.train_worker',
+        '--base-model', base_model, '--data', data_path, '--output', output_path,
+        '--iterations', str(iterations), '--holdout-fraction', str(holdout_fraction),
+    ]
+    if full:
+        command.append('--full')
+    result = subprocess.run(command, cwd=settings.BASE_DIR, capture_output=True, text=True, timeout=timeout)
+    stderr = result.stderr.strip()[-2000:]
+    if result.returncode != 0:
+        raise CommandError(f"Training failed (exit {result.returncode}): {stderr}")
+    lines = result.stdout.strip().splitlines()
+    if not lines:
+        raise CommandError(f"Training worker printed no summary: {stderr}")
+    try:
+        return json.loads(lines[-1])
+    except ValueError:
+        raise CommandError(f"Training worker printed an invalid summary {lines[-1][:200]!r}: {stderr}")
+
+
+def store_artifact(path, artifact_dir=None):
+    """
+    Move a trained model file into the artifact directory as
+    model-<version>.pkl (atomic rename). Returns (version, artifact path).
+    """
+    artifact_dir = artifact_dir or getattr(settings, 'PREDICTIONS_MODEL_ARTIFACT_DIR', DEFAULT_ARTIFACT_DIR)
+    os.makedirs(artifact_dir, exist_ok=True)
+    version = file_digest(path)[:12]
+    artifact = os.path.join(artifact_dir, f'model-{version}.pkl')
+    os.replace(path, artifact)
+    return version, artifact
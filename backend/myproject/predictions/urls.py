@@ -1,7 +1,18 @@
 from django.urls import path
-from .views import StockPredictionCreateView, StockPredictionListView
+from .views import StockPredictionCreateView, StockPredictionListView, ModelStatusView
+from .views import StockPredictionBatchCreateView, StockPredictionHorizonView
+from .views import ForecastJobListCreateView, ForecastJobDetailView, ForecastJobCancelView
+from .views import HealthView, MetricsView
 
 urlpatterns = [
     path('predictions/', StockPredictionCreateView.as_view(), name='stock-prediction-create'),
+    path('predictions/batch/', StockPredictionBatchCreateView.as_view(), name='stock-prediction-batch'),
+    path('predictions/horizon/', StockPredictionHorizonView.as_view(), name='stock-prediction-horizon'),
     path('predictions/list/', StockPredictionListView.as_view(), name='stock-prediction-list'),
+    path('predictions/jobs/', ForecastJobListCreateView.as_view(), name='forecast-job-list'),
+    path('predictions/jobs/<int:pk>/', ForecastJobDetailView.as_view(), name='forecast-job-detail'),
+    path('predictions/jobs/<int:pk>/cancel/', ForecastJobCancelView.as_view(), name='forecast-job-cancel'),
+    path('health/', HealthView.as_view(), name='predictions-health'),
+    path('metrics/', MetricsView.as_view(), name='predictions-metrics'),
+    path('predictions/model/', ModelStatusView.as_view(), name='stock-prediction-model'),
 ]
\ No newline at end of file
@@ -1,14 +1,50 @@
 # backend/predictions/views.py
 
+from django.conf import settings
+from django.http import HttpResponse, StreamingHttpResponse
+from django.utils import timezone
+from rest_framework.fields import DateTimeField
 from rest_framework import generics, status
 from rest_framework.permissions import AllowAny
 from rest_framework.response import Response
-from .models import StockPrediction
-from .serializers import StockPredictionSerializer
-from .inference import predict_stock
+from rest_framework.views import APIView
+from .models import StockPrediction, ForecastJob
+from .jobs import count_job_rows
+from .serializers import StockPredictionSerializer, StockPredictionBatchRowSerializer
+from .serializers import StockPredictionHorizonSerializer
+from .serializers import ForecastJobSpecSerializer, ForecastJobSerializer
+from .serializers import StockPredictionListFilterSerializer
+from .pagination import StockPredictionCursorPagination
+from .features import week_of_month, build_feature_frame, horizon_weeks, build_horizon_frame
+from .inference import predict_stock, predict_frame, serving_version
+from .registry import registry
+from .cache import prediction_cache
+from .batching import micro_batcher
+from .modelserver import model_server_client
+from .instrumentation import log_payload, logger, stage_metrics, timed
+from .shadow import shadow_scorer
+from .warmup import is_ready, warm_up_in_background, warmup_state
 from products.models import Product
-import traceback
 import datetime # Make sure datetime is imported
+import json
+
+# Columns read for the list endpoint (everything StockPredictionSerializer outputs)
+STOCK_PREDICTION_LIST_FIELDS = (
+    'id', 'product', 'week_number', 'month', 'week_year', 'store_id',
+    'total_price', 'base_price', 'is_featured_sku', 'is_display_sku',
+    'predicted_stock', 'model_version', 'created_at', 'updated_at',
+)
+# Same columns as flat values for NDJSON streaming
+STOCK_PREDICTION_STREAM_FIELDS = (
+    'id', 'product_id', 'product__name', 'week_number', 'month', 'week_year', 'store_id',
+    'total_price', 'base_price', 'is_featured_sku', 'is_display_sku',
+    'predicted_stock', 'model_version', 'created_at', 'updated_at',
+)
+
+
+def start_of_day(day):
+    """Aware datetime at midnight of `day` in the current time zone."""
+    return timezone.make_aware(datetime.datetime.combine(day, datetime.time.min))
 
 # View for Creating a new Stock Prediction
 class StockPredictionCreateView(generics.CreateAPIView):
@@ -17,14 +53,16 @@ class StockPredictionCreateView(generics.CreateAPIView):
     serializer_class = StockPredictionSerializer
 
     def create(self, request, *args, **kwargs):
-        print(f"Received POST request data: {request.data}")
+        log_payload("Received POST request data: %s", request.data)
         # Initialize serializer with request data
         # Note: We don't pass instance=... because we are creating
         serializer = self.get_serializer(data=request.data)
 
         # Validate the incoming data (checks 'product_id', 'date', prices, etc.)
-        if not serializer.is_valid():
-            print(f"Serializer validation errors: {serializer.errors}")
+        with timed('validation'):
+            is_valid = serializer.is_valid()
+        if not is_valid:
+            log_payload("Serializer validation errors: %s", serializer.errors)
             return Response(
                 {"errors": serializer.errors},
                 status=status.HTTP_400_BAD_REQUEST
@@ -36,76 +74,61 @@ class StockPredictionCreateView(generics.CreateAPIView):
         product_instance = validated_data['product'] # Fetch related Product object
         input_date = validated_data['date']         # Fetch date object
 
-        print(f"Serializer validated data: {validated_data}")
-
         # --- Derive features needed by the model ---
-        the_month = input_date.month
-        the_year = input_date.year
-        # --- Week Calculation Logic (verify this matches model training) ---
-        day_of_month = input_date.day
-        first_day_of_month = input_date.replace(day=1)
-        first_day_weekday = first_day_of_month.weekday() # Monday=0, Sunday=6
-        # Calculate week number (assuming week starts Monday, adjust if needed)
-        week_number = (day_of_month + first_day_weekday - 1) // 7 + 1
-        # --- End Week Calculation ---
-
-        # Ensure week is within 1-5 range (basic capping)
-        week_number = max(1, min(week_number, 5))
-
-        print(f"Derived features - Week: {week_number}, Month: {the_month}, Year: {the_year}")
-
-        # --- Prepare input dictionary EXACTLY as predict_stock expects ---
-        input_data_for_model = {
-            'week_number': week_number,
-            'week_month': the_month,           # Use 'week_month' if model expects that name
-            'store_id': validated_data['store_id'],
-            'sku_id': product_instance.id,      # Use Product ID
-            'total_price': validated_data['total_price'],
-            'base_price': validated_data['base_price'],
-            'is_featured_sku': validated_data['is_featured_sku'],
-            'is_display_sku': validated_data['is_display_sku'],
-            'week_year': the_year,             # Use 'week_year' if model expects that name
-        }
+        with timed('features'):
+            the_month = input_date.month
+            the_year = input_date.year
+            # Week of the month (1-5), same rule the model was trained with
+            week_number = week_of_month(input_date)
+
+            # --- Prepare input dictionary EXACTLY as predict_stock expects ---
+            input_data_for_model = {
+                'week_number': week_number,
+                'week_month': the_month,           # Use 'week_month' if model expects that name
+                'store_id': validated_data['store_id'],
+                'sku_id': product_instance.id,      # Use Product ID
+                'total_price': validated_data['total_price'],
+                'base_price': validated_data['base_price'],
+                'is_featured_sku': validated_data['is_featured_sku'],
+                'is_display_sku': validated_data['is_display_sku'],
+                'week_year': the_year,             # Use 'week_year' if model expects that name
+            }
 
         # --- Call the prediction function ---
         final_predicted_stock = None # Initialize
         try:
-            print(f"Data being sent to prediction function: {input_data_for_model}")
             # This function should return a single numeric value (float or int)
+            # (model load, preprocessing and predict are timed inside it)
             predicted_stock_raw = predict_stock(input_data_for_model)
-            print(f"Raw prediction result from inference: {predicted_stock_raw} (type: {type(predicted_stock_raw)})")
 
             # Validate and clean the prediction result
             if predicted_stock_raw is None or not isinstance(predicted_stock_raw, (int, float)):
                  # Log the unexpected type for debugging
-                 print(f"Error: Prediction function returned an invalid type: {type(predicted_stock_raw)}")
+                 logger.error("Prediction function returned an invalid type: %s", type(predicted_stock_raw))
                  raise ValueError("Prediction function returned an invalid value.")
 
             # Ensure it's a float for consistency, handle potential negative values
             final_predicted_stock = float(predicted_stock_raw)
             if final_predicted_stock < 0:
-                print(f"Warning: Raw prediction was negative ({final_predicted_stock}), setting to 0.")
+                logger.warning("Raw prediction was negative (%s), setting to 0.", final_predicted_stock)
                 final_predicted_stock = 0.0
 
-            print(f"Final processed predicted stock: {final_predicted_stock}")
-
         # --- Exception Handling for Prediction ---
         except ValueError as e: # Specific errors from prediction logic (e.g., missing columns, type issues)
             error_message = f"Prediction data error: {str(e)}"
-            print(error_message)
+            logger.info(error_message)
             return Response({"errors": {"prediction": error_message}}, status=status.HTTP_400_BAD_REQUEST)
         except FileNotFoundError as e: # Model file missing
             error_message = f"Model file not found: {str(e)}"
-            print(error_message)
+            logger.error(error_message)
             return Response({"errors": {"prediction": error_message}}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
         except ModuleNotFoundError as e: # Missing dependency for model loading
              error_message = f"Missing library for model: {str(e)}. Please install it."
-             print(error_message)
+             logger.error(error_message)
              return Response({"errors": {"prediction": error_message}}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
         except Exception as e: # Catch-all for unexpected errors during prediction
             error_message = f"Prediction failed unexpectedly: {str(e)}"
-            print(error_message)
-            traceback.print_exc() # Log the full traceback for server debugging
+            logger.exception(error_message) # Log the full traceback for server debugging
             return Response({"errors": {"prediction": error_message}}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
         # --- Save the prediction to the database ---
@@ -113,17 +136,18 @@ class StockPredictionCreateView(generics.CreateAPIView):
         # The serializer instance already knows about 'store_id', 'total_price' etc from validated_data.
         # It also knows the 'product' instance.
         try:
-            instance = serializer.save(
-                predicted_stock=final_predicted_stock, # Pass the calculated prediction
-                week_number=week_number,               # Pass the derived week number
-                month=the_month                         # Pass the derived month
-            )
-            print(f"Successfully saved StockPrediction instance with ID: {instance.id}")
+            with timed('db_save'):
+                instance = serializer.save(
+                    predicted_stock=final_predicted_stock, # Pass the calculated prediction
+                    week_number=week_number,               # Pass the derived week number
+                    month=the_month,                        # Pass the derived month
+                    week_year=the_year,                     # Pass the derived year
+                    model_version=serving_version(),        # Part of the natural key
+                )
         except Exception as e:
              # Handle potential database saving errors
              error_message = f"Database save failed: {str(e)}"
-             print(error_message)
-             traceback.print_exc()
+             logger.exception(error_message)
              return Response({"errors": {"database": error_message}}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
         # --- Prepare and return the final successful response ---
@@ -131,14 +155,333 @@ class StockPredictionCreateView(generics.CreateAPIView):
         # (like 'id', 'product' details, 'predicted_stock', 'created_at') in the response.
         response_serializer = self.get_serializer(instance)
         headers = self.get_success_headers(response_serializer.data)
-        print(f"Returning successful response data: {response_serializer.data}")
+        log_payload("Returning successful response data: %s", response_serializer.data)
         return Response(response_serializer.data, status=status.HTTP_201_CREATED, headers=headers)
 
 
+# View for scoring many (product, store, date) rows in one request
+class StockPredictionBatchCreateView(APIView):
+    """
+    Accepts {"rows": [...]} where each row has the same fields as a single
+    prediction request. Valid rows are scored with one model.predict call and
+    saved with bulk_create; invalid rows are reported by index and skipped.
+    """
+    permission_classes = [AllowAny]
+
+    def post(self, request):
+        rows = request.data.get('rows') if isinstance(request.data, dict) else request.data
+        if not isinstance(rows, list) or not rows:
+            return Response(
+                {"errors": {"rows": "Expected a non-empty list of prediction rows."}},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        max_rows = getattr(settings, 'PREDICTIONS_BATCH_MAX_ROWS', 5000)
+        if len(rows) > max_rows:
+            return Response(
+                {"errors": {"rows": f"A batch may contain at most {max_rows} rows."}},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        # --- Validate every row without touching the database ---
+        errors = []
+        valid = []  # (index, validated_data)
+        with timed('validation'):
+            for index, row in enumerate(rows):
+                row_serializer = StockPredictionBatchRowSerializer(data=row)
+                if row_serializer.is_valid():
+                    valid.append((index, row_serializer.validated_data))
+                else:
+                    errors.append({"index": index, "errors": row_serializer.errors})
+
+            # --- Resolve all products with a single query ---
+            products = Product.objects.in_bulk({data['product_id'] for _, data in valid})
+            resolved = []
+            for index, data in valid:
+                product = products.get(data['product_id'])
+                if product is None:
+                    errors.append({
+                        "index": index,
+                        "errors": {"product_id": [f"Invalid pk \"{data['product_id']}\" - object does not exist."]}
+                    })
+                    continue
+                data['product'] = product
+                resolved.append((index, data))
+
+        saved, inserted = [], 0
+        if resolved:
+            # --- Derive features and score the whole batch at once ---
+            with timed('features'):
+                frame = build_feature_frame([data for _, data in resolved])
+            try:
+                model_version = registry.get().version
+                predictions = predict_frame(frame)
+                shadow_scorer.submit(frame, predictions)
+            except ValueError as e:
+                return Response({"errors": {"prediction": f"Prediction data error: {str(e)}"}},
+                                status=status.HTTP_400_BAD_REQUEST)
+            except FileNotFoundError as e:
+                return Response({"errors": {"prediction": f"Model file not found: {str(e)}"}},
+                                status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+            instances = [
+                StockPrediction(
+                    product=data['product'],
+                    store_id=data['store_id'],
+                    total_price=data['total_price'],
+                    base_price=data['base_price'],
+                    is_featured_sku=data['is_featured_sku'],
+                    is_display_sku=data['is_display_sku'],
+                    week_number=int(week_number),
+                    month=int(month),
+                    week_year=int(week_year),
+                    predicted_stock=float(predicted_stock),
+                    model_version=model_version,
+                )
+                for (_, data), week_number, month, week_year, predicted_stock in zip(
+                    resolved, frame['week_number'], frame['week_month'], frame['week_year'], predictions
+                )
+            ]
+            try:
+                with timed('db_save'):
+                    # Rows whose natural key already exists are updated in place
+                    inserted = StockPrediction.objects.upsert(instances)
+                saved = instances
+            except Exception as e:
+                logger.exception("Batch prediction save failed")
+                return Response({"errors": {"database": f"Database save failed: {str(e)}"}},
+                                status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+        errors.sort(key=lambda error: error['index'])
+        results = StockPredictionSerializer(saved, many=True).data
+        for (index, _), result in zip(resolved, results):
+            result['index'] = index
+
+        return Response(
+            {
+                # Repeated natural keys in the batch count once
+                "created": inserted,
+                "updated": len({obj.pk for obj in saved}) - inserted,
+                "failed": len(errors),
+                "results": results,
+                "errors": errors,
+            },
+            status=status.HTTP_201_CREATED if saved else status.HTTP_400_BAD_REQUEST
+        )
+
+
+# View forecasting one product for many stores over a horizon of weeks
+class StockPredictionHorizonView(APIView):
+    """
+    Builds the full (store x week) feature grid for a product in numpy and
+    scores it with one model.predict call. The response is matrix shaped:
+    predictions[i][j] is store_ids[i] in weeks[j]. With "persist": true the
+    grid is also saved as StockPrediction rows.
+    """
+    permission_classes = [AllowAny]
+
+    def post(self, request):
+        serializer = StockPredictionHorizonSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response({"errors": serializer.errors}, status=status.HTTP_400_BAD_REQUEST)
+        data = serializer.validated_data
+        product = data['product']
+        store_ids = data['store_ids']
+        start = data.get('start') or timezone.localdate()
+        total_price = data.get('total_price', float(product.price))
+        base_price = data.get('base_price', float(product.price))
+
+        # --- Build the store x week grid and score it in one pass ---
+        week_starts, week_number, month, year = horizon_weeks(start, data['months'])
+        frame = build_horizon_frame(
+            product.id, store_ids, week_number, month, year,
+            total_price, base_price, data['is_featured_sku'], data['is_display_sku'],
+        )
+        try:
+            model_version = registry.get().version
+            predictions = predict_frame(frame)
+            shadow_scorer.submit(frame, predictions)
+        except ValueError as e:
+            return Response({"errors": {"prediction": f"Prediction data error: {str(e)}"}},
+                            status=status.HTTP_400_BAD_REQUEST)
+        except FileNotFoundError as e:
+            return Response({"errors": {"prediction": f"Model file not found: {str(e)}"}},
+                            status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        matrix = predictions.reshape(len(store_ids), len(week_number))
+
+        saved = 0
+        if data['persist']:
+            StockPrediction.objects.upsert([
+                StockPrediction(
+                    product=product,
+                    store_id=store_id,
+                    total_price=total_price,
+                    base_price=base_price,
+                    is_featured_sku=data['is_featured_sku'],
+                    is_display_sku=data['is_display_sku'],
+                    week_number=int(week_number[j]),
+                    month=int(month[j]),
+                    week_year=int(year[j]),
+                    predicted_stock=float(matrix[i, j]),
+                    model_version=model_version,
+                )
+                for i, store_id in enumerate(store_ids)
+                for j in range(len(week_number))
+            ])
+            saved = matrix.size
+
+        return Response({
+            "product": {"id": product.id, "name": product.name},
+            "model_version": model_version,
+            "stores": store_ids,
+            "weeks": [
+                {
+                    "start_date": str(week_start),
+                    "week_year": int(y),
+                    "month": int(m),
+                    "week_number": int(w),
+                }
+                for week_start, w, m, y in zip(week_starts, week_number, month, year)
+            ],
+            "predictions": matrix.round(4).tolist(),
+            "saved": saved,
+        })
+
+
+# Views for asynchronous forecast jobs (executed by `manage.py run_forecast_jobs`)
+class ForecastJobListCreateView(generics.ListCreateAPIView):
+    permission_classes = [AllowAny]
+    queryset = ForecastJob.objects.all().order_by('-created_at')
+    serializer_class = ForecastJobSerializer
+
+    def create(self, request, *args, **kwargs):
+        spec_serializer = ForecastJobSpecSerializer(data=request.data)
+        if not spec_serializer.is_valid():
+            return Response({"errors": spec_serializer.errors}, status=status.HTTP_400_BAD_REQUEST)
+        spec = spec_serializer.data  # JSON-ready (dates as ISO strings)
+        job = ForecastJob.objects.create(spec=spec, total_rows=count_job_rows(spec))
+        serializer = self.get_serializer(job)
+        return Response(serializer.data, status=status.HTTP_202_ACCEPTED)
+
+
+class ForecastJobDetailView(generics.RetrieveAPIView):
+    permission_classes = [AllowAny]
+    queryset = ForecastJob.objects.all()
+    serializer_class = ForecastJobSerializer
+
+
+class ForecastJobCancelView(APIView):
+    permission_classes = [AllowAny]
+
+    def post(self, request, pk):
+        # A job nobody has picked up yet is cancelled immediately;
+        # a running job stops after its current chunk.
+        ForecastJob.objects.filter(pk=pk, status='pending').update(
+            status='cancelled', cancel_requested=True, finished_at=timezone.now()
+        )
+        ForecastJob.objects.filter(pk=pk, status='running').update(cancel_requested=True)
+        job = generics.get_object_or_404(ForecastJob, pk=pk)
+        return Response(ForecastJobSerializer(job).data)
+
+
 # View for Listing existing Stock Predictions
 class StockPredictionListView(generics.ListAPIView):
+    """
+    Newest predictions first, cursor-paginated. Optional filters: product,
+    store_id, date_from / date_to (inclusive, on created_at). With
+    ?stream=ndjson the whole filtered history is streamed as one JSON object
+    per line instead of a page.
+    """
     permission_classes = [AllowAny]
-    # Add ordering to prevent pagination warnings and ensure consistent results
-    queryset = StockPrediction.objects.all().order_by('-created_at')
     serializer_class = StockPredictionSerializer
-    # Consider adding pagination_class = YourPaginationClass if using pagination
\ No newline at end of file
+    pagination_class = StockPredictionCursorPagination
+    stream_chunk_size = 2000  # rows fetched per database round trip when streaming
+
+    def get_queryset(self):
+        # The nested product only needs id and name: join it instead of one query per row
+        queryset = StockPrediction.objects.select_related('product').only(
+            *STOCK_PREDICTION_LIST_FIELDS, 'product__id', 'product__name'
+        )
+        filters = getattr(self, 'filters', {})
+        if 'product' in filters:
+            queryset = queryset.filter(product_id=filters['product'])
+        if 'store_id' in filters:
+            queryset = queryset.filter(store_id=filters['store_id'])
+        # Date bounds as datetimes so the (…, created_at) indexes are range-scanned
+        if 'date_from' in filters:
+            queryset = queryset.filter(created_at__gte=start_of_day(filters['date_from']))
+        if 'date_to' in filters:
+            queryset = queryset.filter(
+                created_at__lt=start_of_day(filters['date_to'] + datetime.timedelta(days=1))
+            )
+        return queryset
+
+    def list(self, request, *args, **kwargs):
+        filter_serializer = StockPredictionListFilterSerializer(data=request.query_params)
+        if not filter_serializer.is_valid():
+            return Response({"errors": filter_serializer.errors}, status=status.HTTP_400_BAD_REQUEST)
+        self.filters = filter_serializer.validated_data
+        if self.filters.get('stream') == 'ndjson':
+            return self.stream_ndjson()
+        return super().list(request, *args, **kwargs)
+
+    def stream_ndjson(self):
+        queryset = self.get_queryset().order_by(*self.pagination_class.ordering)
+        rows = queryset.values_list(*STOCK_PREDICTION_STREAM_FIELDS)
+        to_iso = DateTimeField().to_representation
+
+        def lines():
+            for row in rows.iterator(chunk_size=self.stream_chunk_size):
+                item = dict(zip(STOCK_PREDICTION_STREAM_FIELDS, row))
+                item['product'] = {'id': item.pop('product_id'), 'name': item.pop('product__name')}
+                item['created_at'] = to_iso(item['created_at'])
+                item['updated_at'] = to_iso(item['updated_at'])
+                yield json.dumps(item) + '\n'
+
+        response = StreamingHttpResponse(lines(), content_type='application/x-ndjson')
+        response['Content-Disposition'] = 'attachment; filename="stock_predictions.ndjson"'
+        return response
+
+
+# View reporting which model version this process is serving
+class ModelStatusView(APIView):
+    permission_classes = [AllowAny]
+
+    def get(self, request):
+        data = registry.info()
+        data['cache'] = prediction_cache.stats()
+        data['batching'] = micro_batcher.stats()
+        data['model_server'] = model_server_client.stats()
+        data['stages'] = stage_metrics.stats()
+        data['shadow'] = shadow_scorer.stats()
+        return Response(data)
+
+
+# Stage duration histograms in the Prometheus text format, for scraping
+class MetricsView(APIView):
+    permission_classes = [AllowAny]
+    authentication_classes = []
+
+    def get(self, request):
+        return HttpResponse(stage_metrics.render() + shadow_scorer.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+# Readiness probe for load balancers: 503 until the model is loaded and warm
+class HealthView(APIView):
+    permission_classes = [AllowAny]
+    authentication_classes = []
+
+    def get(self, request):
+        if is_ready():
+            # Workers using the model server never load the model themselves
+            model_version = registry.get().version if registry.is_loaded else warmup_state()['model_version']
+            return Response({
+                "status": "ready",
+                "model_version": model_version,
+                "warmup": warmup_state(),
+            })
+        # A cold worker starts warming up as soon as it is probed.
+        warm_up_in_background()
+        return Response(
+            {"status": "warming", "warmup": warmup_state()},
+            status=status.HTTP_503_SERVICE_UNAVAILABLE
+        )
@@ -0,0 +1,98 @@
+# predictions/warmup.py
+#
+# Model warm-up for freshly started workers.
+#
+# The first prediction in a new process pays for loading the model, importing
+# pandas/sklearn and their lazy initialization. warm_up() does all of that
+# ahead of time by loading the model and scoring a probe row through both the
+# single-row and the frame path. The readiness endpoint reports 503 until it
+# has completed, so load balancers only route traffic to warm workers.
+# When predictions go to the model server, warming up means reaching it; the
+# model is only loaded here if the server does not answer.
+import threading
+import time
+
+from django.conf import settings
+
+from .fastpath import PROBE_ROWS
+from .instrumentation import logger
+from .modelserver import ModelServerUnavailable, model_server_client
+from .registry import registry
+
+_state = {'status': 'cold', 'seconds': None, 'error': None, 'model_version': None, 'served_by': None}
+_lock = threading.Lock()
+
+
+def warm_up():
+    """Load the model and run a probe prediction. Returns the warm-up state."""
+    # Imported here: inference pulls in the batcher/cache modules.
+    from .inference import predict_frame
+
+    with _lock:
+        if _state['status'] in ('warming', 'ready'):
+            return dict(_state)
+        _state.update(status='warming', error=None)
+
+    started = time.perf_counter()
+    if model_server_client.available:
+        try:
+            version = model_server_client.ping()
+            model_server_client.predict_one(PROBE_ROWS[0])
+        except (ModelServerUnavailable, RuntimeError) as e:
+            logger.warning("Model server unavailable during warm-up (%s); loading the model in-process", e)
+        else:
+            with _lock:
+                _state.update(status='ready', seconds=time.perf_counter() - started,
+                              model_version=version, served_by='model_server')
+            logger.info("Model server reachable, serving model %s", version)
+            return dict(_state)
+
+    try:
+        import pandas as pd
+        loaded = registry.get()
+        if loaded.fast_path is not None:
+            loaded.fast_path.predict_one(PROBE_ROWS[0])
+        predict_frame(pd.DataFrame(PROBE_ROWS))
+    except Exception as e:
+        with _lock:
+            _state.update(status='failed', error=str(e), seconds=time.perf_counter() - started)
+        logger.warning("Prediction model warm-up failed: %s", e)
+        return dict(_state)
+
+    with _lock:
+        _state.update(status='ready', seconds=time.perf_counter() - started,
+                      model_version=loaded.version, served_by='in_process')
+    logger.info("Prediction model %s warmed up in %.3fs", loaded.version, _state['seconds'])
+    return dict(_state)
+
+
+def warm_up_in_background():
+    """Start warm_up() on a daemon thread unless it already ran or is running."""
+    if _state['status'] in ('warming', 'ready'):
+        return
+    threading.Thread(target=warm_up, name='prediction-warmup', daemon=True).start()
+
+
+def warm_up_on_startup():
+    """
+    Start-up hook (called from PredictionsConfig.ready() in server processes)
+    honouring PREDICTIONS_WARMUP:
+      None / False  - do nothing; the first request or health check warms up
+      'background'  - warm up on a thread while the worker starts serving
+      'blocking'    - warm up before returning; use this with gunicorn --preload
+                      so the master loads the model once before forking workers
+    """
+    mode = getattr(settings, 'PREDICTIONS_WARMUP', None)
+    if mode == 'blocking':
+        warm_up()
+    elif mode == 'background':
+        warm_up_in_background()
+
+
+def is_ready():
+    # A model loaded by a regular request also counts as warm.
+    return _state['status'] == 'ready' or (_state['status'] == 'cold' and registry.is_loaded)
+
+
+def warmup_state():
+    return dict(_state)
@@ -32,6 +32,12 @@ class Product(models.Model):
     available = models.BooleanField(default=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            # Low-stock listings: available=True AND stock <= threshold
+            models.Index(fields=['available', 'stock'], name='product_available_stock_idx'),
+        ]
     
     def __str__(self):
         return self.name